@@ -0,0 +1,336 @@
+import argparse
+import atexit
+import glob
+import hashlib
+import json
+import logging
+import mmap
+import os
+import threading
+import time
+import zlib
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List, Optional, Tuple
+
+try:
+    import zstandard
+except ImportError:  # Repli sur zlib (deflate avec dictionnaire prédéfini)
+    zstandard = None
+
+ARCHIVE_DIR = os.environ.get("TRUSTPILOT_ARCHIVE", "")
+DICT_SIZE = 112 * 1024
+SAMPLE_CHUNK = 16 * 1024
+ZLIB_WINDOW = 32 * 1024
+
+
+def _dict_id(data: bytes) -> str:
+    return hashlib.sha1(data).hexdigest()[:12]
+
+
+def train_dictionary(pages: List[bytes], size: int = DICT_SIZE) -> bytes:
+    """Build a compression dictionary from sample pages.
+
+    Pages are cut into chunks so that a few hundred KB pages still give the
+    trainer enough samples. Without zstandard, the dictionary is the most
+    repeated chunks as raw content, which deflate can use as a preset.
+    """
+    chunks = [page[i : i + SAMPLE_CHUNK] for page in pages for i in range(0, len(page), SAMPLE_CHUNK)]
+    if zstandard is not None:
+        return zstandard.train_dictionary(size, chunks).as_bytes()
+    counts: Dict[bytes, int] = {}
+    for chunk in chunks:
+        counts[chunk] = counts.get(chunk, 0) + 1
+    common = sorted(counts, key=counts.get, reverse=True)
+    # deflate ne voit que les 32 derniers Ko : le plus fréquent va en dernier
+    return b"".join(reversed(common))[-ZLIB_WINDOW:]
+
+
+def save_dictionary(directory: str, dictionary: bytes) -> str:
+    """Write dict-<id>.zdict; the newest one is picked up by the next writers."""
+    dict_id = _dict_id(dictionary)
+    with open(os.path.join(directory, f"dict-{dict_id}.zdict"), "wb") as f:
+        f.write(dictionary)
+    logging.info("Archive dictionary %s (%s KB) saved", dict_id, len(dictionary) // 1024)
+    return dict_id
+
+
+class _Codec:
+    """Compress/decompress with one dictionary (or none), zstd when available."""
+
+    def __init__(self, name: str, dictionary: Optional[bytes]):
+        self.name = name
+        self.dictionary = dictionary
+        if name == "zstd":
+            if zstandard is None:
+                raise RuntimeError("zstandard is required to read zstd records")
+            zdict = zstandard.ZstdCompressionDict(dictionary) if dictionary else None
+            self._compressor = zstandard.ZstdCompressor(level=3, dict_data=zdict)
+            self._decompressor = zstandard.ZstdDecompressor(dict_data=zdict)
+
+    def compress(self, data: bytes) -> bytes:
+        if self.name == "zstd":
+            return self._compressor.compress(data)
+        compressor = zlib.compressobj(6, zlib.DEFLATED, -15, zdict=self.dictionary[-ZLIB_WINDOW:]) if self.dictionary else zlib.compressobj(6, zlib.DEFLATED, -15)
+        return compressor.compress(data) + compressor.flush()
+
+    def decompress(self, data: bytes) -> bytes:
+        if self.name == "zstd":
+            return self._decompressor.decompress(data)
+        decompressor = zlib.decompressobj(-15, zdict=self.dictionary[-ZLIB_WINDOW:]) if self.dictionary else zlib.decompressobj(-15)
+        return decompressor.decompress(data) + decompressor.flush()
+
+
+class PageArchive:
+    """Append-only WARC-style container of fetched pages plus an offset index.
+
+    Every record is compressed on its own with a shared dictionary trained on
+    Trustpilot pages, so any page can be read back without touching its
+    neighbours. Each writer process gets its own segment:
+
+        <dir>/pages-<timestamp>-<pid>.warcz      WARC/1.0 headers + compressed body
+        <dir>/pages-<timestamp>-<pid>.warcz.idx  one JSON line per record (url, offset, length...)
+        <dir>/dict-<id>.zdict                    dictionaries, referenced by id from the index
+    """
+
+    def __init__(self, directory: str, train_after: int = 32):
+        self.directory = directory
+        self.train_after = train_after
+        os.makedirs(directory, exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        self.segment_path = os.path.join(directory, f"pages-{stamp}-{os.getpid()}.warcz")
+        self._segment = open(self.segment_path, "ab")
+        self._index = open(f"{self.segment_path}.idx", "a", encoding="utf-8")
+        self._lock = threading.Lock()
+        self._samples: List[bytes] = []
+        self.codec_name = "zstd" if zstandard is not None else "deflate"
+        self.dict_id, dictionary = self._latest_dictionary()
+        self._codec = _Codec(self.codec_name, dictionary)
+        self._training = self.dict_id == "none"
+        self.records = 0
+        self.raw_bytes = 0
+        self.stored_bytes = 0
+
+    def _latest_dictionary(self) -> Tuple[str, Optional[bytes]]:
+        paths = sorted(glob.glob(os.path.join(self.directory, "dict-*.zdict")), key=os.path.getmtime)
+        if not paths:
+            return "none", None
+        with open(paths[-1], "rb") as f:
+            data = f.read()
+        return _dict_id(data), data
+
+    def use_dictionary(self, dictionary: bytes):
+        """Store a dictionary and use it for the next records."""
+        self.dict_id = save_dictionary(self.directory, dictionary)
+        self._codec = _Codec(self.codec_name, dictionary)
+
+    def write(self, url: str, html, fetched_at: Optional[datetime] = None):
+        """Append one page; html may be str or bytes."""
+        body = html.encode("utf-8") if isinstance(html, str) else html
+        date = (fetched_at or datetime.now(timezone.utc)).isoformat(timespec="seconds")
+        with self._lock:
+            if self._training:
+                self._samples.append(body)
+                if len(self._samples) >= self.train_after:
+                    # Entraînement unique sur les premières pages du run
+                    samples, self._samples, self._training = self._samples, [], False
+                    try:
+                        self.use_dictionary(train_dictionary(samples))
+                    except Exception as e:
+                        # Pages trop petites ou trop semblables : on archive sans dictionnaire
+                        logging.warning("Archive dictionary training failed, writing without one: %s", e)
+            payload = self._codec.compress(body)
+            header = (
+                "WARC/1.0\r\n"
+                "WARC-Type: response\r\n"
+                f"WARC-Target-URI: {url}\r\n"
+                f"WARC-Date: {date}\r\n"
+                f"WARC-Payload-Digest: sha1:{hashlib.sha1(body).hexdigest()}\r\n"
+                f"X-Compression: {self.codec_name}; dict={self.dict_id}\r\n"
+                f"Content-Length: {len(payload)}\r\n\r\n"
+            ).encode("utf-8")
+            offset = self._segment.tell() + len(header)
+            self._segment.write(header + payload + b"\r\n\r\n")
+            self._segment.flush()
+            entry = {
+                "url": url,
+                "date": date,
+                "offset": offset,
+                "length": len(payload),
+                "size": len(body),
+                "codec": self.codec_name,
+                "dict": self.dict_id,
+            }
+            self._index.write(json.dumps(entry, separators=(",", ":")) + "\n")
+            self._index.flush()
+            self.records += 1
+            self.raw_bytes += len(body)
+            self.stored_bytes += len(payload)
+
+    def close(self):
+        with self._lock:
+            self._segment.close()
+            self._index.close()
+        if not self.records:
+            os.remove(self.segment_path)
+            os.remove(f"{self.segment_path}.idx")
+        else:
+            logging.info(
+                "Archived %s pages: %.1f MB -> %.1f MB (x%.1f)",
+                self.records,
+                self.raw_bytes / 1e6,
+                self.stored_bytes / 1e6,
+                self.raw_bytes / max(1, self.stored_bytes),
+            )
+
+
+class ArchiveReader:
+    """Memory-mapped random access over every segment of an archive directory."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._maps: Dict[str, mmap.mmap] = {}
+        self._codecs: Dict[Tuple[str, str], _Codec] = {}
+        self.index: Dict[str, List[dict]] = {}
+        self.segments = sorted(glob.glob(os.path.join(directory, "pages-*.warcz")))
+        for segment in self.segments:
+            if not os.path.exists(f"{segment}.idx"):
+                continue
+            with open(f"{segment}.idx", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        entry["segment"] = segment
+                        self.index.setdefault(entry["url"], []).append(entry)
+
+    def _map(self, segment: str) -> mmap.mmap:
+        if segment not in self._maps:
+            with open(segment, "rb") as f:
+                self._maps[segment] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._maps[segment]
+
+    def _codec(self, name: str, dict_id: str) -> _Codec:
+        key = (name, dict_id)
+        if key not in self._codecs:
+            dictionary = None
+            if dict_id != "none":
+                with open(os.path.join(self.directory, f"dict-{dict_id}.zdict"), "rb") as f:
+                    dictionary = f.read()
+            self._codecs[key] = _Codec(name, dictionary)
+        return self._codecs[key]
+
+    def read(self, entry: dict) -> bytes:
+        data = self._map(entry["segment"])[entry["offset"] : entry["offset"] + entry["length"]]
+        return self._codec(entry["codec"], entry["dict"]).decompress(data)
+
+    def get(self, url: str, before: Optional[str] = None) -> Optional[str]:
+        """Latest archived HTML of url, or the latest fetched before an ISO date."""
+        entries = [e for e in self.index.get(url, []) if before is None or e["date"] < before]
+        if not entries:
+            return None
+        return self.read(max(entries, key=lambda e: e["date"])).decode("utf-8")
+
+    def __iter__(self) -> Iterator[Tuple[dict, bytes]]:
+        """Every record in segment then file order, i.e. sequential reads."""
+        entries = sorted(
+            (e for history in self.index.values() for e in history),
+            key=lambda e: (e["segment"], e["offset"]),
+        )
+        for entry in entries:
+            yield entry, self.read(entry)
+
+    def close(self):
+        for mapped in self._maps.values():
+            mapped.close()
+        self._maps.clear()
+
+
+_archive: Optional[PageArchive] = None
+_archive_lock = threading.Lock()
+
+
+def archive_page(url: str, html):
+    """Tee a fetched page into the archive; no-op unless TRUSTPILOT_ARCHIVE=<dir> is set."""
+    global _archive
+    if not ARCHIVE_DIR:
+        return
+    if _archive is None:
+        with _archive_lock:
+            if _archive is None:
+                _archive = PageArchive(ARCHIVE_DIR)
+                atexit.register(_archive.close)
+    try:
+        _archive.write(url, html)
+    except Exception as e:
+        logging.warning("Could not archive %s: %s", url, e, extra={"url": url})
+
+
+def reextract(directory: str, output: str) -> int:
+    """Run the current extraction spec over the whole archive, one JSON line per record."""
+    from extraction_spec import get_engine
+
+    reader = ArchiveReader(directory)
+    engine = get_engine()
+    count = 0
+    start = time.perf_counter()
+    with open(output, "w", encoding="utf-8") as f:
+        for entry, body in reader:
+            values = engine.extract(body.decode("utf-8"))
+            f.write(json.dumps({"url": entry["url"], "date": entry["date"], "values": values}, ensure_ascii=False, default=str) + "\n")
+            count += 1
+    reader.close()
+    elapsed = time.perf_counter() - start
+    logging.info("Re-extracted %s pages in %.1f s (%.0f pages/s)", count, elapsed, count / elapsed if elapsed else 0)
+    return count
+
+
+def main():
+    from log_setup import configure_logging
+
+    parser = argparse.ArgumentParser(description="Inspect and re-process the raw page archive.")
+    parser.add_argument("--dir", default=ARCHIVE_DIR or "archive")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("stats", help="records, URLs and compression ratio")
+    get = commands.add_parser("get", help="print the latest archived HTML of a URL")
+    get.add_argument("url")
+    get.add_argument("--before", help="ISO date")
+    train = commands.add_parser("train", help="train a new dictionary from archived or local pages")
+    train.add_argument("html_files", nargs="*")
+    train.add_argument("--samples", type=int, default=200)
+    redo = commands.add_parser("reextract", help="run extraction_spec.json over every archived page")
+    redo.add_argument("--out", default="reextracted.jsonl")
+    args = parser.parse_args()
+    configure_logging()
+
+    if args.command == "reextract":
+        reextract(args.dir, args.out)
+        return
+    if args.command == "train":
+        pages = []
+        for path in args.html_files:
+            with open(path, "rb") as f:
+                pages.append(f.read())
+        if not pages:
+            reader = ArchiveReader(args.dir)
+            for _, body in reader:
+                pages.append(body)
+                if len(pages) >= args.samples:
+                    break
+            reader.close()
+        save_dictionary(args.dir, train_dictionary(pages))
+        return
+
+    reader = ArchiveReader(args.dir)
+    if args.command == "get":
+        html = reader.get(args.url, args.before)
+        print(html if html is not None else f"{args.url} is not archived")
+    else:
+        entries = [e for history in reader.index.values() for e in history]
+        raw = sum(e["size"] for e in entries)
+        stored = sum(e["length"] for e in entries)
+        print(f"{len(entries)} records, {len(reader.index)} URLs, {len(reader.segments)} segments")
+        print(f"{raw / 1e6:.1f} MB raw -> {stored / 1e6:.1f} MB stored (x{raw / max(1, stored):.1f})")
+    reader.close()
+
+
+if __name__ == "__main__":
+    main()
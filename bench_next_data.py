@@ -0,0 +1,47 @@
+import json
+import re
+import sys
+import timeit
+
+from next_data import full_next_data, orjson, partial_next_data, slice_next_data
+
+KEYS = ["businessUnit", "filters"]
+NEXT_DATA_RE = re.compile(r'<script id="__NEXT_DATA__" type="application/json"[^>]*>(.*?)</script>', re.S)
+
+
+def regex_full_decode(html: str) -> dict:
+    """Previous path: regex over the page then stdlib json.loads of the whole blob."""
+    return json.loads(NEXT_DATA_RE.search(html).group(1))
+
+
+def find_full_decode_stdlib(html: str) -> dict:
+    return json.loads(slice_next_data(html))
+
+
+def main(path: str = "trustpilot_sample.html", number: int = 50):
+    with open(path, encoding="utf-8") as f:
+        html = f.read()
+    raw = html.encode("utf-8")
+    print(f"Page: {len(raw) / 1024:.0f} KB, __NEXT_DATA__: {len(slice_next_data(raw)) / 1024:.0f} KB")
+
+    # Le décodage partiel doit rendre exactement les mêmes sous-arbres
+    full = regex_full_decode(html)["props"]["pageProps"]
+    partial = partial_next_data(html, KEYS)["props"]["pageProps"]
+    assert all(full[key] == partial[key] for key in KEYS), "partial decode differs from full decode"
+
+    cases = [
+        ("regex + json.loads (full)", lambda: regex_full_decode(html)),
+        ("find + json.loads (full)", lambda: find_full_decode_stdlib(html)),
+        (f"find + {'orjson' if orjson else 'json'} (full, bytes)", lambda: full_next_data(raw)),
+        ("find + partial raw_decode (str)", lambda: partial_next_data(html, KEYS)),
+        ("find + partial raw_decode (bytes)", lambda: partial_next_data(raw, KEYS)),
+    ]
+    baseline = None
+    for label, func in cases:
+        seconds = min(timeit.repeat(func, number=number, repeat=3)) / number
+        baseline = baseline or seconds
+        print(f"{label:<40} {seconds * 1000:8.3f} ms  x{baseline / seconds:5.1f}")
+
+
+if __name__ == "__main__":
+    main(*sys.argv[1:2])
@@ -0,0 +1,154 @@
+import asyncio
+import logging
+import time
+from typing import Callable, Iterable, Iterator, List, Optional
+
+from playwright.async_api import async_playwright
+
+from archive import archive_page
+from egress import EgressPool
+from extraction_spec import company_record, get_engine
+from frontier import Deadline
+from latency import endpoint_class, latency
+from records import CompanyRecord
+from resilience import FetchError, ParseError, Resilience, retry_after_seconds
+from tracing import tracer
+
+# Ressources inutiles à l'extraction : jamais téléchargées
+BLOCKED_RESOURCES = {"image", "media", "font", "stylesheet"}
+
+
+class AsyncBrowserPool:
+    """One Chromium process driven over CDP, one isolated context per page in flight.
+
+    Playwright talks to Chromium through its DevTools pipe, so there is no
+    chromedriver HTTP hop, and a context costs a few MB where a Selenium
+    driver costs a whole browser.
+    """
+
+    def __init__(
+        self,
+        max_pages: int = 50,
+        timeout: float = 10.0,
+        egress: Optional[EgressPool] = None,
+        browser_args: Optional[List[str]] = None,
+        resilience: Optional[Resilience] = None,
+    ):
+        self.max_pages = max_pages
+        self.timeout_ms = timeout * 1000
+        # Chaque contexte sort par un proxy de egress.json, avec sa cadence ; direct par défaut
+        self.egress = egress or EgressPool.from_config(rate=10, burst=10)
+        self.browser_args = browser_args or ["--no-sandbox", "--disable-dev-shm-usage", "--disable-gpu"]
+        self.resilience = resilience or Resilience("browser_async")
+        self._semaphore = asyncio.Semaphore(max_pages)
+        self._playwright = None
+        self._browser = None
+
+    async def __aenter__(self):
+        self._playwright = await async_playwright().start()
+        # Proxy global fictif : requis par Chromium sous Windows pour les proxys par contexte
+        proxied = any(e.proxy for e in self.egress.exits)
+        self._browser = await self._playwright.chromium.launch(
+            headless=True,
+            args=self.browser_args,
+            proxy={"server": "http://per-context"} if proxied else None,
+        )
+        logging.info("Chromium started for up to %s concurrent pages", self.max_pages)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self._browser.close()
+        await self._playwright.stop()
+
+    @staticmethod
+    async def _block_assets(route):
+        if route.request.resource_type in BLOCKED_RESOURCES:
+            await route.abort()
+        else:
+            await route.continue_()
+
+    async def fetch_html(self, url: str) -> str:
+        """Load url in a fresh context and return the DOM once __NEXT_DATA__ is attached."""
+        with tracer.span("slot_wait", url=url):
+            await self._semaphore.acquire()
+        try:
+            with tracer.span("pace", url=url):
+                exit_ = await self.egress.acquire_async()
+            context = await self._browser.new_context(
+                locale="fr-FR",
+                user_agent=exit_.user_agent,
+                proxy={"server": exit_.proxy} if exit_.proxy else None,
+            )
+            # Délai tiré du p99 des chargements déjà mesurés pour ce type de page
+            endpoint = f"browser:{endpoint_class(url)}"
+            timeout_ms = latency.timeout(endpoint, self.timeout_ms / 1000, key=url) * 1000
+            started = time.monotonic()
+            try:
+                page = await context.new_page()
+                await page.route("**/*", self._block_assets)
+                with latency.measure(endpoint, key=url):
+                    with tracer.span("navigate", url=url, exit=exit_.name):
+                        response = await page.goto(url, wait_until="domcontentloaded", timeout=timeout_ms)
+                    if response is not None and response.status >= 400:
+                        raise FetchError(url, response.status, retry_after_seconds(response.headers.get("retry-after")))
+                    with tracer.span("wait", url=url):
+                        await page.wait_for_selector(
+                            "script#__NEXT_DATA__, p[data-rating-typography]",
+                            state="attached",
+                            timeout=timeout_ms,
+                        )
+                html = await page.content()
+            except Exception as e:
+                self.egress.record(exit_, time.monotonic() - started, e)
+                raise
+            finally:
+                await context.close()
+            self.egress.record(exit_, time.monotonic() - started)
+            return html
+        finally:
+            self._semaphore.release()
+
+    async def _scrape_once(self, url: str) -> CompanyRecord:
+        html = await self.fetch_html(url)
+        archive_page(url, html)  # Actif si TRUSTPILOT_ARCHIVE=<dossier>
+        with tracer.span("parse", url=url):
+            values = get_engine().extract(html)
+        if not values.get("name"):
+            raise ParseError(f"No company name found for {url}")
+        record = company_record(values)
+        record.url = url
+        return record
+
+    async def scrape_company_data(self, url: str) -> Optional[CompanyRecord]:
+        """Same contract as scraper_fr_parallel.scrape_company_data: a CompanyRecord or None.
+
+        Failures are retried per error class; abandoned URLs are dead-lettered.
+        """
+        result = await self.resilience.call_async(url, self._scrape_once, url)
+        if result is not None:
+            logging.info("✅ Page terminée pour: %s", result.name)
+        return result
+
+
+async def scrape_companies(
+    urls: Iterable[str],
+    on_result: Callable[[str, Optional[CompanyRecord]], None],
+    max_pages: int = 50,
+    resilience: Optional[Resilience] = None,
+    deadline: Optional[Deadline] = None,
+):
+    """Scrape urls concurrently and call on_result(url, data) as each one completes.
+
+    max_pages workers take urls in the given (priority) order; pages not yet
+    started when deadline expires are skipped and on_result is not called for them.
+    """
+
+    async def worker(pool: AsyncBrowserPool, pending: Iterator[str]):
+        for url in pending:
+            if deadline is not None and deadline.expired():
+                return
+            on_result(url, await pool.scrape_company_data(url))
+
+    async with AsyncBrowserPool(max_pages=max_pages, resilience=resilience) as pool:
+        pending = iter(urls)
+        await asyncio.gather(*(worker(pool, pending) for _ in range(max_pages)))
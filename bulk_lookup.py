@@ -0,0 +1,279 @@
+import argparse
+import asyncio
+import csv
+import json
+import logging
+import sys
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from typing import AsyncIterator, Dict, Iterable, Iterator, List, Optional
+
+import aiohttp
+from aiohttp import ClientTimeout
+
+from domains import canonical_domain
+from extraction_spec import get_engine
+from log_setup import configure_logging
+from resilience import FetchError, ParseError
+from tracing import tracer
+from trustpilot_sitemap_extractor import TrustpilotScraper
+
+PROFILE_URL = "https://www.trustpilot.com/review/{}"
+
+# Suffixes publics à deux niveaux les plus courants ; pas de liste PSL complète
+TWO_LEVEL_SUFFIXES = {
+    "co.uk", "org.uk", "ac.uk", "gov.uk", "com.au", "net.au", "org.au", "co.nz", "com.br", "com.mx",
+    "com.ar", "co.jp", "co.kr", "co.in", "co.za", "com.tr", "com.cn", "com.hk", "com.sg", "co.il",
+}
+
+NOT_FOUND = "not_found"
+
+
+def candidate_domains(value: str) -> List[str]:
+    """Domains to try for a customer entry, most specific first.
+
+    'https://WWW.Shop.Example.co.uk/fr' -> ['shop.example.co.uk', 'example.co.uk'];
+    Trustpilot usually files a company under its registrable domain, but some
+    subdomains have their own profile. [] if value is not a domain at all.
+    """
+    domain = canonical_domain(value)
+    if "." not in domain or any(c.isspace() for c in domain):
+        return []
+    labels = domain.split(".")
+    keep = 3 if ".".join(labels[-2:]) in TWO_LEVEL_SUFFIXES else 2
+    return [".".join(labels[i:]) for i in range(max(1, len(labels) - keep + 1))]
+
+
+@dataclass
+class LookupResult:
+    query: str
+    status: str  # found / not_found / error / invalid
+    domain: Optional[str] = None  # Candidat qui a répondu
+    profile_domain: Optional[str] = None  # Domaine du profil après redirection Trustpilot
+    url: Optional[str] = None
+    name: Optional[str] = None
+    rating: Optional[float] = None
+    review_count: Optional[int] = None
+    cached: bool = False
+
+
+class BulkLookup:
+    """Domain -> Trustpilot profile lookups for large customer lists.
+
+    Each candidate domain is fetched at most once at a time: concurrent
+    lookups of the same profile await the same fetch task (single-flight),
+    and answers, 404s included, are kept ttl seconds in an LRU so duplicates
+    cost nothing. Errors are not cached. Fetches go through a TrustpilotScraper,
+    so they share its egress exits, retry policy and watchdog worker limit.
+    """
+
+    def __init__(
+        self,
+        fetcher: Optional[TrustpilotScraper] = None,
+        session: Optional[aiohttp.ClientSession] = None,
+        ttl: float = 900.0,
+        max_cached: int = 100_000,
+    ):
+        self.fetcher = fetcher or TrustpilotScraper()
+        self.session = session
+        self._owns_session = session is None
+        self.ttl = ttl
+        self.max_cached = max_cached
+        self._cache: "OrderedDict[str, tuple]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.fetches = 0
+        self.coalesced = 0
+        self.cache_hits = 0
+
+    async def __aenter__(self):
+        if self.session is None:
+            self.session = aiohttp.ClientSession(
+                timeout=ClientTimeout(total=30),
+                connector=aiohttp.TCPConnector(limit=self.fetcher.max_workers),
+            )
+        return self
+
+    async def __aexit__(self, *exc_info):
+        if self._owns_session and self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def lookup(self, query: str) -> LookupResult:
+        candidates = candidate_domains(query)
+        if not candidates:
+            return LookupResult(query=query, status="invalid")
+        for domain in candidates:
+            outcome, cached = await self._profile(domain)
+            if outcome["status"] != NOT_FOUND:
+                break
+        return LookupResult(query=query, cached=cached, **outcome)
+
+    async def lookup_many(self, queries: Iterable[str], concurrency: Optional[int] = None) -> AsyncIterator[LookupResult]:
+        """Yield exactly one LookupResult per query, in completion order; status "error" if it raised."""
+        pending = iter(queries)
+        results: asyncio.Queue = asyncio.Queue()
+        concurrency = concurrency or self.fetcher.max_workers
+
+        async def worker():
+            try:
+                for query in pending:
+                    try:
+                        result = await self.lookup(query)
+                    except Exception as e:
+                        # Une requête en échec ne doit ni arrêter le worker ni perdre sa ligne de sortie
+                        logging.warning("Lookup failed for %s: %s", query, e)
+                        result = LookupResult(query=query, status="error")
+                    await results.put(result)
+            finally:
+                await results.put(None)
+
+        workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
+        try:
+            remaining = len(workers)
+            while remaining:
+                result = await results.get()
+                if result is None:
+                    remaining -= 1
+                else:
+                    yield result
+        finally:
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+    async def _profile(self, domain: str):
+        """(outcome, cached) for one candidate domain, from the cache, a fetch in flight or a new fetch."""
+        entry = self._cache.get(domain)
+        if entry is not None:
+            expires, outcome = entry
+            if expires > time.monotonic():
+                self._cache.move_to_end(domain)
+                self.cache_hits += 1
+                return outcome, True
+            del self._cache[domain]
+        task = self._inflight.get(domain)
+        if task is not None:
+            self.coalesced += 1
+            # shield : un appelant annulé n'annule pas la requête des autres
+            return await asyncio.shield(task), True
+        task = asyncio.create_task(self._fetch(domain))
+        self._inflight[domain] = task
+        task.add_done_callback(lambda _: self._inflight.pop(domain, None))
+        return await asyncio.shield(task), False
+
+    async def _fetch(self, domain: str) -> dict:
+        url = PROFILE_URL.format(domain)
+        self.fetches += 1
+        async with self.fetcher.worker_limit.slot():
+            with tracer.span("lookup", url=url):
+                values = await self.fetcher.resilience.call_async(url, self._attempt, url)
+        if values is None:
+            return {"status": "error", "domain": domain, "url": url}
+        if values is NOT_FOUND:
+            outcome = {"status": NOT_FOUND, "domain": domain}
+        else:
+            profile_domain = values.get("profile_domain") or domain
+            outcome = {
+                "status": "found",
+                "domain": domain,
+                "profile_domain": profile_domain,
+                "url": PROFILE_URL.format(profile_domain),
+                "name": values.get("name"),
+                "rating": values.get("rating"),
+                "review_count": values.get("review_count"),
+            }
+        self._cache[domain] = (time.monotonic() + self.ttl, outcome)
+        while len(self._cache) > self.max_cached:
+            self._cache.popitem(last=False)
+        return outcome
+
+    async def _attempt(self, url: str):
+        """One attempt; a 404 is an answer here, not a failure to retry or dead-letter."""
+        try:
+            html = await self.fetcher.fetch_html(self.session, url)
+        except FetchError as e:
+            if e.status in (404, 410):
+                return NOT_FOUND
+            raise
+        with tracer.span("parse", url=url):
+            values = get_engine().extract(html)
+        if not values.get("name") and not values.get("rating"):
+            raise ParseError(f"No company data found for {url}")
+        return values
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "fetches": self.fetches,
+            "coalesced": self.coalesced,
+            "cache_hits": self.cache_hits,
+            "cached": len(self._cache),
+            "in_flight": len(self._inflight),
+        }
+
+
+def read_queries(path: str, column: Optional[str] = None) -> Iterator[str]:
+    """Domains from a text file (one per line, # comments) or a CSV column (default: the first)."""
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        if path.endswith(".csv"):
+            reader = csv.DictReader(f)
+            column = column or reader.fieldnames[0]
+            for row in reader:
+                if row.get(column):
+                    yield row[column].strip()
+        else:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith("#"):
+                    yield line
+
+
+async def lookup_file(
+    input_path: str,
+    output_path: Optional[str] = None,
+    column: Optional[str] = None,
+    max_workers: Optional[int] = None,
+    requests_per_second: Optional[float] = 2.0,
+) -> Dict[str, int]:
+    """Look up every domain of input_path, writing JSON lines (or CSV) as results complete."""
+    fetcher = TrustpilotScraper(max_workers=max_workers, requests_per_second=requests_per_second)
+    out = open(output_path, "w", newline="", encoding="utf-8") if output_path else sys.stdout
+    writer = None
+    if output_path and output_path.endswith(".csv"):
+        writer = csv.DictWriter(out, fieldnames=list(LookupResult.__dataclass_fields__))
+        writer.writeheader()
+    counts: Dict[str, int] = {}
+    watchdog_task = asyncio.create_task(fetcher.watchdog.run_async())
+    try:
+        async with BulkLookup(fetcher) as lookup:
+            async for result in lookup.lookup_many(read_queries(input_path, column)):
+                counts[result.status] = counts.get(result.status, 0) + 1
+                if writer is not None:
+                    writer.writerow(asdict(result))
+                else:
+                    out.write(json.dumps(asdict(result), ensure_ascii=False) + "\n")
+                out.flush()
+            logging.info("Lookup done: %s, %s", counts, lookup.stats())
+    finally:
+        watchdog_task.cancel()
+        if out is not sys.stdout:
+            out.close()
+        fetcher.store.close()
+        fetcher.resilience.dead_letters.compact()
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Trustpilot scores for a list of merchant domains.")
+    parser.add_argument("input", help="text file with one domain per line, or a CSV")
+    parser.add_argument("--column", help="CSV column holding the domains (default: the first)")
+    parser.add_argument("--output", help="JSON lines file, or .csv (default: stdout)")
+    parser.add_argument("--max-workers", type=int, help="concurrency ceiling (default: sized to this machine)")
+    parser.add_argument("--rps", type=float, default=2.0, help="requests per second per exit")
+    args = parser.parse_args()
+    configure_logging()
+    asyncio.run(lookup_file(args.input, args.output, args.column, args.max_workers, args.rps))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+import json
+import logging
+import os
+import re
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+STAR_COLUMNS = [
+    "Pourcentage 5 étoiles",
+    "Pourcentage 4 étoiles",
+    "Pourcentage 3 étoiles",
+    "Pourcentage 2 étoiles",
+    "Pourcentage 1 étoile",
+]
+
+
+def _to_number(value, decimal_comma: bool = False) -> Optional[float]:
+    """Parse '13,236', '87%', '4.8' or a number; None if unparseable.
+
+    With decimal_comma, ',' is the decimal separator ('4,8' is 4.8) instead of
+    a thousands separator.
+    """
+    if value is None or value == "":
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    text = str(value).replace(" ", "")
+    text = text.replace(",", ".") if decimal_comma else text.replace(",", "")
+    match = re.search(r"\d+(?:\.\d+)?", text)
+    return float(match.group()) if match else None
+
+
+def _to_rating(value) -> Optional[float]:
+    # Une note Trustpilot va de 1 à 5 : 0 est la valeur par défaut d'une note inconnue
+    rating = _to_number(value, decimal_comma=True)
+    return rating if rating else None
+
+
+class SnapshotStore:
+    """Last known record of every company, keyed by canonical Trustpilot domain."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.records: Dict[str, dict] = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.records = json.load(f)
+
+    def get(self, domain: str) -> Optional[dict]:
+        return self.records.get(domain)
+
+    def put(self, domain: str, record: dict):
+        self.records[domain] = record
+
+    def save(self):
+        """Write atomically so an interrupted run never corrupts the snapshot."""
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.records, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+
+def diff_record(domain: str, old: Optional[dict], new: dict) -> List[dict]:
+    """Return the change events between two snapshots of one company."""
+    if old is None:
+        return [{"type": "new_company", "domain": domain, "record": new}]
+
+    # Valeur inconnue d'un côté (champ non extrait) : pas de différence, pas d'événement
+    events = []
+    old_rating, new_rating = _to_rating(old.get("Note")), _to_rating(new.get("Note"))
+    if None not in (old_rating, new_rating) and old_rating != new_rating:
+        events.append(
+            {
+                "type": "rating_delta",
+                "domain": domain,
+                "old": old_rating,
+                "new": new_rating,
+                "delta": round(new_rating - old_rating, 2),
+            }
+        )
+
+    old_count = _to_number(old.get("Nombre de reviews"))
+    new_count = _to_number(new.get("Nombre de reviews"))
+    if None not in (old_count, new_count) and old_count != new_count:
+        events.append(
+            {
+                "type": "review_count_delta",
+                "domain": domain,
+                "old": old_count,
+                "new": new_count,
+                "delta": int(new_count - old_count),
+            }
+        )
+
+    shift = {}
+    for column in STAR_COLUMNS:
+        before, after = _to_number(old.get(column)), _to_number(new.get(column))
+        if None not in (before, after) and before != after:
+            shift[column] = {"old": before, "new": after}
+    if shift:
+        events.append({"type": "star_distribution_shift", "domain": domain, "changes": shift})
+
+    for column, event_type in (("Site", "website_change"), ("Adresse", "address_change")):
+        if (old.get(column) or "") != (new.get(column) or ""):
+            events.append(
+                {
+                    "type": event_type,
+                    "domain": domain,
+                    "old": old.get(column),
+                    "new": new.get(column),
+                }
+            )
+    return events
+
+
+class ChangeLog:
+    """Append-only JSON-lines log of change events."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def append(self, events: Iterable[dict], run_id: str):
+        with open(self.path, "a", encoding="utf-8") as f:
+            for event in events:
+                event = {"run": run_id, **event}
+                f.write(json.dumps(event, ensure_ascii=False, separators=(",", ":")) + "\n")
+
+
+def capture_changes(
+    records: Dict[str, dict],
+    snapshot_path: str = "trustpilot_snapshot.json",
+    changelog_path: str = "trustpilot_changes.jsonl",
+    run_id: Optional[str] = None,
+) -> List[dict]:
+    """Diff a run's records against the last snapshot, log the changes and roll the snapshot forward.
+
+    Companies absent from records are left untouched, so partial runs are safe.
+    """
+    run_id = run_id or datetime.now().strftime("%Y%m%d_%H%M%S")
+    store = SnapshotStore(snapshot_path)
+    events = []
+    for domain, record in records.items():
+        events.extend(diff_record(domain, store.get(domain), record))
+        store.put(domain, record)
+    ChangeLog(changelog_path).append(events, run_id)
+    store.save()
+    logging.info("%s change events for %s companies (run %s)", len(events), len(records), run_id)
+    return events
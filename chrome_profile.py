@@ -0,0 +1,177 @@
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+import weakref
+from typing import List, Optional
+
+PROFILES_PATH = os.environ.get("TRUSTPILOT_CHROME_PROFILES", "chrome_profiles")
+
+# Seuls les caches passent d'un profil à l'autre : ni cookies ni stockage local,
+# chaque sortie réseau garde ainsi une empreinte propre
+CACHE_DIRS = [os.path.join("Default", "Cache"), os.path.join("Default", "Code Cache")]
+
+
+def directory_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+    return total
+
+
+def chrome_running(profile_dir: str) -> bool:
+    """True if a live Chrome holds profile_dir (SingletonLock -> 'hostname-pid')."""
+    try:
+        target = os.readlink(os.path.join(profile_dir, "SingletonLock"))
+    except OSError:
+        return False
+    try:
+        os.kill(int(target.rsplit("-", 1)[1]), 0)
+    except (IndexError, ValueError, ProcessLookupError):
+        return False  # Verrou laissé par un Chrome mort
+    except PermissionError:
+        pass
+    return True
+
+
+class ProfileTemplate:
+    """Chrome profiles cloned from a pre-warmed template holding only the HTTP and code caches.
+
+    The template is harvested from real traffic: when a driver is released
+    and the template is missing or older than max_age, the driver's caches
+    become the new template (built aside, then swapped in with a rename, so
+    concurrent drivers and processes only ever see a complete one). Clones
+    are copies, never hard links, because Chrome rewrites cache entries in
+    place. Each clone's cache is capped by Chrome's own LRU (--disk-cache-size);
+    sweep() removes leftover clones, oldest first, once the directory goes
+    over max_total_mb.
+    """
+
+    def __init__(
+        self,
+        root: str = PROFILES_PATH,
+        cache_mb: int = 64,
+        max_age: float = 24 * 3600,
+        min_template_mb: float = 1.0,
+        max_total_mb: int = 2048,
+        grace: float = 120.0,
+        sweep_interval: float = 60.0,
+    ):
+        self.root = root
+        self.template_dir = os.path.join(root, "template")
+        self.clones_dir = os.path.join(root, "clones")
+        self.cache_mb = cache_mb
+        self.max_age = max_age
+        self.min_template_bytes = min_template_mb * 2**20
+        self.max_total_bytes = max_total_mb * 2**20
+        self.grace = grace  # Un clone tout neuf n'a pas encore de SingletonLock
+        self.sweep_interval = sweep_interval
+        self._last_sweep = 0.0
+        self._active = set()
+        self._lock = threading.Lock()
+
+    def template_age(self) -> Optional[float]:
+        try:
+            return time.time() - os.path.getmtime(self.template_dir)
+        except OSError:
+            return None
+
+    def clone(self) -> str:
+        """A fresh profile directory, pre-filled with the template's caches if there is one."""
+        path = os.path.join(self.clones_dir, uuid.uuid4().hex)
+        with self._lock:
+            self._active.add(path)
+        try:
+            shutil.copytree(self.template_dir, path)
+        except FileNotFoundError:
+            os.makedirs(path, exist_ok=True)  # Pas encore de modèle : profil froid
+        except shutil.Error as e:
+            # Modèle remplacé pendant la copie : un cache partiel reste utilisable
+            logging.debug("Partial profile clone %s: %s", path, e)
+        return path
+
+    def chrome_arguments(self, profile_dir: str) -> List[str]:
+        return [f"--user-data-dir={os.path.abspath(profile_dir)}", f"--disk-cache-size={self.cache_mb * 2**20}"]
+
+    def attach(self, driver, profile_dir: str):
+        """Release profile_dir once driver is garbage collected, i.e. after quit() on every code path."""
+        weakref.finalize(driver, self.release, profile_dir)
+
+    def release(self, profile_dir: str):
+        """Promote profile_dir's caches to template if it is due, then delete the clone."""
+        try:
+            age = self.template_age()
+            if age is None or age > self.max_age:
+                self._promote(profile_dir)
+        except OSError as e:
+            logging.warning("Chrome profile template update failed: %s", e)
+        finally:
+            with self._lock:
+                self._active.discard(profile_dir)
+            shutil.rmtree(profile_dir, ignore_errors=True)
+            if time.monotonic() - self._last_sweep > self.sweep_interval:
+                self.sweep()
+
+    def _promote(self, profile_dir: str):
+        if chrome_running(profile_dir):
+            return
+        size = sum(directory_size(os.path.join(profile_dir, d)) for d in CACHE_DIRS)
+        if size < self.min_template_bytes:
+            return
+        staging = os.path.join(self.root, f"template.{uuid.uuid4().hex}")
+        for cache_dir in CACHE_DIRS:
+            source = os.path.join(profile_dir, cache_dir)
+            if os.path.isdir(source):
+                shutil.copytree(source, os.path.join(staging, cache_dir))
+        # Remplacement par renommages : un lecteur voit l'ancien modèle complet ou le nouveau
+        retired = os.path.join(self.root, f"retired.{uuid.uuid4().hex}")
+        try:
+            os.rename(self.template_dir, retired)
+        except FileNotFoundError:
+            pass
+        try:
+            os.rename(staging, self.template_dir)
+            logging.info("Chrome profile template refreshed: %.1f MB of cache", size / 2**20)
+        except OSError:
+            # Un autre processus a publié son modèle entre-temps
+            shutil.rmtree(staging, ignore_errors=True)
+        shutil.rmtree(retired, ignore_errors=True)
+
+    def sweep(self) -> int:
+        """Delete clones left behind by crashed drivers, oldest first, while over max_total_mb."""
+        self._last_sweep = time.monotonic()
+        now = time.time()
+        with self._lock:
+            active = set(self._active)
+        clones = []
+        if not os.path.isdir(self.clones_dir):
+            return 0
+        for name in os.listdir(self.clones_dir):
+            path = os.path.join(self.clones_dir, name)
+            try:
+                mtime = os.path.getmtime(path)
+            except OSError:
+                continue
+            if path in active or now - mtime < self.grace or chrome_running(path):
+                continue
+            clones.append((mtime, path))
+        if not clones:
+            return 0
+        total = directory_size(self.root)
+        removed = 0
+        for _, path in sorted(clones):
+            if total <= self.max_total_bytes:
+                break
+            size = directory_size(path)
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+            removed += 1
+        if removed:
+            logging.info("%s stale Chrome profiles removed", removed)
+        return removed
@@ -0,0 +1,261 @@
+import argparse
+import json
+import os
+import sys
+from typing import List, Optional
+
+# Rien de lourd ici : chaque sous-commande importe son backend (selenium, pandas,
+# aiohttp, playwright, bs4) au moment où elle s'exécute.
+
+CONFIG_PATH = os.environ.get("TRUSTPILOT_CONFIG", "trustpilot.json")
+# Copie de listing_extractor.BASE_URL, qui importerait aiohttp
+BASE_URL = "https://www.trustpilot.com/categories/clothing_store?country=FR"
+
+
+def _duration(value: Optional[str]) -> Optional[float]:
+    if value is None:
+        return None
+    from frontier import parse_duration
+
+    return parse_duration(str(value))
+
+
+def cmd_listing(args):
+    """Category pages over HTTP -> CSV of company cards, in site order."""
+    import csv
+    from dataclasses import asdict, fields
+
+    from listing_extractor import ListingRecord, get_listings
+    from log_setup import configure_logging
+
+    configure_logging()
+    records = get_listings(
+        args.base_url,
+        range(1, args.pages + 1),
+        concurrency=args.concurrency,
+        requests_per_second=args.rps,
+    )
+    with open(args.output, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=[field.name for field in fields(ListingRecord)])
+        writer.writeheader()
+        writer.writerows(asdict(record) for record in records)
+    print(f"{len(records)} companies written to {args.output}")
+
+
+def cmd_profiles(args):
+    """Company profiles with Chrome: one driver (sequential) or a pool (parallel)."""
+    from prefilter import ListingFilter
+
+    budget = _duration(args.budget)
+    listing_filter = ListingFilter.from_store(
+        fresh_days=args.skip_fresh_days,
+        country=args.country or None,
+        min_reviews=args.min_reviews,
+        min_rating=args.min_rating,
+    )
+    if args.mode == "sequential":
+        import scraper_fr
+
+        scraper_fr.main(
+            redrive=args.redrive,
+            budget=budget,
+            base_url=args.base_url,
+            pages_count=args.pages,
+            csv_filename=args.output or "entreprises_vetements_trustpilot_sequential.csv",
+            requests_per_second=args.rps,
+            listing_filter=listing_filter,
+            check_sites=args.check_sites,
+            normalize=args.normalize,
+        )
+    else:
+        import scraper_fr_parallel
+
+        scraper_fr_parallel.main(
+            backend=args.backend,
+            max_pages=args.max_pages,
+            redrive=args.redrive,
+            max_workers=args.max_workers,
+            budget=budget,
+            base_url=args.base_url,
+            pages_count=args.pages,
+            csv_file=args.output or "entreprises_vetements_trustpilot.csv",
+            listing_filter=listing_filter,
+            check_sites=args.check_sites,
+            normalize=args.normalize,
+        )
+
+
+def cmd_sitemap(args):
+    """Scores for every URL of an input CSV over aiohttp."""
+    from trustpilot_sitemap_extractor import crawl
+
+    crawl(
+        input_csv=args.input,
+        output_csv=args.output,
+        max_workers=args.max_workers,
+        requests_per_second=args.rps,
+        budget=_duration(args.budget),
+        redrive=args.redrive,
+        hedge_ratio=args.hedge_ratio,
+    )
+
+
+def cmd_lookup(args):
+    """Domains -> Trustpilot profile scores, duplicates coalesced."""
+    import asyncio
+
+    from bulk_lookup import lookup_file
+    from log_setup import configure_logging
+
+    configure_logging()
+    asyncio.run(lookup_file(args.input, args.output, args.column, args.max_workers, args.rps))
+
+
+def cmd_serve(args):
+    """Long-running job service: crawl jobs over HTTP on shared pools."""
+    from crawl_service import serve
+
+    serve(args.host, args.port, args.jobs_dir, args.max_workers, args.rps, args.hedge_ratio)
+
+
+def cmd_sites(args):
+    """Website resolution and liveness for the companies already in the store."""
+    from log_setup import configure_logging
+    from site_check import check_websites
+    from store import CompanyStore
+
+    configure_logging()
+    store = CompanyStore()
+    try:
+        check_websites(
+            store.websites(),
+            store,
+            max_age_days=args.max_age_days,
+            concurrency=args.concurrency,
+            per_host_rate=args.per_host_rate,
+        )
+    finally:
+        store.close()
+
+
+def cmd_normalize(args):
+    """Typed, de-duplicated copy of a scraper CSV (also run at the end of 'profiles')."""
+    from log_setup import configure_logging
+    from normalize import normalize_csv
+
+    configure_logging()
+    normalize_csv(args.input, args.output)
+
+
+def cmd_bench(args):
+    """__NEXT_DATA__ decoding micro-benchmark."""
+    import bench_next_data
+
+    bench_next_data.main(args.sample, args.number)
+
+
+def build_parser(config: Optional[dict] = None) -> argparse.ArgumentParser:
+    """config: {subcommand: {option: value}}, applied as that subcommand's defaults."""
+    parser = argparse.ArgumentParser(
+        prog="cli.py",
+        description="Trustpilot scrapers. Options can also be set per subcommand in a JSON "
+        'config file, e.g. {"sitemap": {"rps": 4}}; flags override the file.',
+    )
+    parser.add_argument("--config", default=CONFIG_PATH, help=f"JSON config file (default: {CONFIG_PATH})")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    listing = commands.add_parser("listing", help="crawl the category listing pages over HTTP")
+    listing.add_argument("--base-url", default=BASE_URL)
+    listing.add_argument("--pages", type=int, default=105)
+    listing.add_argument("--concurrency", type=int, default=10)
+    listing.add_argument("--rps", type=float, default=10.0, help="requests per second")
+    listing.add_argument("--output", default="listing.csv")
+    listing.set_defaults(handler=cmd_listing)
+
+    profiles = commands.add_parser("profiles", help="scrape company profiles with a browser")
+    profiles.add_argument("--mode", choices=["sequential", "parallel"], default="parallel")
+    profiles.add_argument("--backend", choices=["selenium", "playwright"], default="selenium")
+    profiles.add_argument("--base-url", default=BASE_URL)
+    profiles.add_argument("--pages", type=int, default=105)
+    profiles.add_argument("--max-workers", type=int, help="parallel Selenium ceiling (default: sized to this machine)")
+    profiles.add_argument("--max-pages", type=int, default=50, help="concurrent Playwright pages")
+    profiles.add_argument("--rps", type=float, help="sequential mode request rate")
+    profiles.add_argument("--budget", help="wall-clock budget, e.g. 2h or 90m")
+    profiles.add_argument("--redrive", action="store_true", help="only retry dead-lettered URLs")
+    profiles.add_argument("--country", default="FR", help="skip cards from other countries ('' to keep all)")
+    profiles.add_argument("--min-reviews", type=int, help="skip cards with fewer reviews")
+    profiles.add_argument("--min-rating", type=float, help="skip cards rated lower")
+    profiles.add_argument("--skip-fresh-days", type=float, help="skip companies crawled in the last N days")
+    profiles.add_argument("--no-site-check", dest="check_sites", action="store_false", help="skip the website resolution stage")
+    profiles.add_argument("--no-normalize", dest="normalize", action="store_false", help="skip the normalized CSV stage")
+    profiles.add_argument("--output", help="CSV file")
+    profiles.set_defaults(handler=cmd_profiles)
+
+    sitemap = commands.add_parser("sitemap", help="fetch scores for the URLs of a CSV over aiohttp")
+    sitemap.add_argument("--input", default="trustpilot_urls.csv")
+    sitemap.add_argument("--output", default="trustpilot_company_scores.csv")
+    sitemap.add_argument("--max-workers", type=int, help="concurrency ceiling (default: sized to this machine)")
+    sitemap.add_argument("--rps", type=float, default=2.0, help="requests per second per exit")
+    sitemap.add_argument("--budget", help="wall-clock budget, e.g. 2h or 90m")
+    sitemap.add_argument("--redrive", action="store_true", help="only retry dead-lettered URLs")
+    sitemap.add_argument("--hedge-ratio", type=float, default=0.0, help="extra requests allowed for hedging, e.g. 0.05")
+    sitemap.set_defaults(handler=cmd_sitemap)
+
+    lookup = commands.add_parser("lookup", help="look up the Trustpilot profiles of a list of domains")
+    lookup.add_argument("input", help="text file with one domain per line, or a CSV")
+    lookup.add_argument("--column", help="CSV column holding the domains (default: the first)")
+    lookup.add_argument("--output", help="JSON lines file, or .csv (default: stdout)")
+    lookup.add_argument("--max-workers", type=int, help="concurrency ceiling (default: sized to this machine)")
+    lookup.add_argument("--rps", type=float, default=2.0, help="requests per second per exit")
+    lookup.set_defaults(handler=cmd_lookup)
+
+    serve = commands.add_parser("serve", help="run the local crawl-job service")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8766)  # crawl_service.DEFAULT_PORT
+    serve.add_argument("--jobs-dir", default="crawl_jobs", help="where job sinks are written")
+    serve.add_argument("--max-workers", type=int, help="concurrency ceiling shared by all jobs")
+    serve.add_argument("--rps", type=float, default=2.0, help="requests per second per exit")
+    serve.add_argument("--hedge-ratio", type=float, default=0.0, help="extra requests allowed for hedging, e.g. 0.05")
+    serve.set_defaults(handler=cmd_serve)
+
+    sites = commands.add_parser("sites", help="resolve and check the websites of the stored companies")
+    sites.add_argument("--max-age-days", type=float, default=7.0, help="re-check sites older than this")
+    sites.add_argument("--concurrency", type=int, default=50)
+    sites.add_argument("--per-host-rate", type=float, default=1.0, help="requests per second to one host")
+    sites.set_defaults(handler=cmd_sites)
+
+    normalize = commands.add_parser("normalize", help="type and de-duplicate a scraper CSV")
+    normalize.add_argument("input", help="raw CSV written by 'profiles'")
+    normalize.add_argument("--output", help="default: <input>_normalized.csv")
+    normalize.set_defaults(handler=cmd_normalize)
+
+    bench = commands.add_parser("bench", help="benchmark __NEXT_DATA__ decoding")
+    bench.add_argument("--sample", default="trustpilot_sample.html")
+    bench.add_argument("--number", type=int, default=50)
+    bench.set_defaults(handler=cmd_bench)
+
+    for name, subparser in commands.choices.items():
+        section = (config or {}).get(name, {})
+        subparser.set_defaults(**{key.replace("-", "_"): value for key, value in section.items()})
+    return parser
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """Flags > config file section for the subcommand > built-in defaults."""
+    pre_parser = argparse.ArgumentParser(add_help=False)
+    pre_parser.add_argument("--config", default=CONFIG_PATH)
+    config_path = pre_parser.parse_known_args(argv)[0].config
+    config = {}
+    if os.path.exists(config_path):
+        with open(config_path, encoding="utf-8") as f:
+            config = json.load(f)
+    return build_parser(config).parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None):
+    args = parse_args(argv)
+    args.handler(args)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,513 @@
+import argparse
+import asyncio
+import csv
+import importlib.util
+import json
+import logging
+import os
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+import aiohttp
+from aiohttp import ClientTimeout, web
+
+from bulk_lookup import BulkLookup
+from extraction_spec import get_engine
+from latency import latency
+from log_setup import configure_logging
+from resilience import ParseError
+from tracing import aiohttp_trace_config, enable_tracing, tracer
+from trustpilot_sitemap_extractor import TrustpilotScraper
+
+JOBS_DIR = os.environ.get("TRUSTPILOT_JOBS_DIR", "crawl_jobs")
+# store.serve() (API de la base) écoute sur 8765 : les deux services tournent ensemble
+DEFAULT_PORT = 8766
+DEFAULT_FIELDS = ["rating", "review_count"]
+SINK_SUFFIXES = (".jsonl", ".csv")
+# Événements gardés par job pour les clients qui se (re)connectent en cours de route
+EVENT_BUFFER = 1000
+# Jobs terminés gardés pour GET /jobs/<id> et les flux d'événements, puis oubliés
+JOB_RETENTION = 3600.0
+MAX_FINISHED_JOBS = 1000
+
+
+@dataclass
+class Job:
+    id: str
+    urls: List[str]
+    fields: List[str]
+    sink: str
+    priority: int = 0
+    max_concurrency: int = 4
+    browser: bool = False
+    state: str = "queued"  # queued -> running -> done | cancelled
+    created_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+    done: int = 0
+    failed: int = 0
+    in_flight: int = 0
+    pending: Deque[str] = field(default_factory=deque)
+    events: Deque[dict] = field(default_factory=lambda: deque(maxlen=EVENT_BUFFER))
+    next_seq: int = 0
+    served_at: float = 0.0
+
+    @property
+    def finished(self) -> bool:
+        return self.finished_at is not None
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "state": self.state,
+            "priority": self.priority,
+            "max_concurrency": self.max_concurrency,
+            "browser": self.browser,
+            "fields": self.fields,
+            "sink": self.sink,
+            "total": len(self.urls),
+            "done": self.done,
+            "failed": self.failed,
+            "in_flight": self.in_flight,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class JobSink:
+    """Per-job output file: one JSON object per line, or CSV with url + the job's fields."""
+
+    def __init__(self, path: str, fields: List[str]):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.fields = fields
+        new_file = not os.path.exists(path)
+        self._file = open(path, "a", newline="", encoding="utf-8")
+        self._csv = None
+        if path.endswith(".csv"):
+            self._csv = csv.writer(self._file)
+            if new_file:
+                self._csv.writerow(["url", *fields])
+
+    def write(self, url: str, values: Dict[str, Any]):
+        if self._csv is not None:
+            self._csv.writerow([url, *(values.get(f) for f in self.fields)])
+        else:
+            self._file.write(json.dumps({"url": url, **values}, ensure_ascii=False, default=str) + "\n")
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class CrawlService:
+    """Crawl jobs from several clients, scheduled onto pools shared by all of them.
+
+    The fetch pool is a TrustpilotScraper: its egress exits, retry policy,
+    circuit breakers and watchdog-driven worker limit are shared, and so is
+    one aiohttp session (keep-alive connections stay warm between jobs).
+    Parsing runs on a small thread pool so the API keeps answering, and
+    jobs that need a browser share one lazily started Chromium. Domain
+    lookups (POST /lookup) share one BulkLookup, so its single-flight and
+    result cache span every client.
+
+    A free worker takes the next URL of the highest-priority job still under
+    its max_concurrency quota; jobs of equal priority are served in turn.
+    Finished jobs are forgotten after job_retention seconds, and beyond
+    max_finished_jobs the oldest go first; their sinks stay on disk.
+    """
+
+    def __init__(
+        self,
+        jobs_dir: str = JOBS_DIR,
+        max_workers: Optional[int] = None,
+        requests_per_second: Optional[float] = 2.0,
+        parser_threads: int = 2,
+        max_pages: int = 20,
+        hedge_ratio: float = 0.0,
+        job_retention: float = JOB_RETENTION,
+        max_finished_jobs: int = MAX_FINISHED_JOBS,
+    ):
+        self.jobs_dir = jobs_dir
+        self.job_retention = job_retention
+        self.max_finished_jobs = max_finished_jobs
+        self.fetcher = TrustpilotScraper(
+            max_workers=max_workers, requests_per_second=requests_per_second, hedge_ratio=hedge_ratio
+        )
+        self.parsers = ThreadPoolExecutor(parser_threads, thread_name_prefix="parser")
+        self.max_pages = max_pages
+        self.jobs: Dict[str, Job] = {}
+        self._sinks: Dict[str, JobSink] = {}
+        # Une seule condition : nouveaux URLs pour les workers, nouveaux événements pour les flux
+        self._changed = asyncio.Condition()
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._browser = None
+        self._browser_lock = asyncio.Lock()
+        self._tasks: List[asyncio.Task] = []
+        self.lookup: Optional[BulkLookup] = None
+
+    async def start(self):
+        trace_configs = [aiohttp_trace_config()] if tracer.enabled else []
+        self._session = aiohttp.ClientSession(
+            timeout=ClientTimeout(total=30),
+            connector=aiohttp.TCPConnector(limit=self.fetcher.max_workers),
+            trace_configs=trace_configs,
+        )
+        self.lookup = BulkLookup(self.fetcher, self._session)
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.fetcher.max_workers)]
+        self._tasks.append(asyncio.create_task(self.fetcher.watchdog.run_async()))
+        logging.info("Crawl service started with %s fetch workers", self.fetcher.max_workers)
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._session is not None:
+            await self._session.close()
+        if self._browser is not None:
+            await self._browser.__aexit__(None, None, None)
+        for sink in self._sinks.values():
+            sink.close()
+        self.parsers.shutdown(wait=False)
+        self.fetcher.store.close()
+        self.fetcher.resilience.dead_letters.compact()
+
+    # Jobs
+
+    def sink_path(self, sink: Optional[str], job_id: str) -> str:
+        """Resolve a client-supplied sink name inside jobs_dir; ValueError if it points elsewhere."""
+        sink = sink or f"{job_id}.jsonl"
+        if not sink.endswith(SINK_SUFFIXES):
+            raise ValueError(f"sink must end with one of {SINK_SUFFIXES}")
+        root = os.path.abspath(self.jobs_dir)
+        path = os.path.abspath(os.path.join(root, sink))
+        if os.path.commonpath([root, path]) != root:
+            raise ValueError("sink must stay inside the jobs directory")
+        return path
+
+    async def submit(self, spec: Dict[str, Any]) -> Job:
+        """Validate a job spec ({"urls", "fields", "sink", "priority", "max_concurrency", "browser"}) and queue it."""
+        urls = spec.get("urls")
+        if not isinstance(urls, list) or not urls or not all(
+            isinstance(url, str) and url.startswith(("http://", "https://")) for url in urls
+        ):
+            raise ValueError("urls must be a non-empty list of http(s) URLs")
+        known_fields = list(get_engine().plan.fields)
+        fields = spec.get("fields") or DEFAULT_FIELDS
+        if fields == "*":
+            fields = known_fields
+        unknown = [f for f in fields if f not in known_fields]
+        if unknown:
+            raise ValueError(f"unknown fields {unknown}, expected some of {known_fields}")
+        browser = bool(spec.get("browser", False))
+        if browser and importlib.util.find_spec("playwright") is None:
+            raise ValueError("browser jobs need playwright, which is not installed")
+        max_concurrency = int(spec.get("max_concurrency", 4))
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1")
+        job_id = uuid.uuid4().hex[:12]
+        job = Job(
+            id=job_id,
+            urls=list(dict.fromkeys(urls)),
+            fields=list(fields),
+            sink=self.sink_path(spec.get("sink"), job_id),
+            priority=int(spec.get("priority", 0)),
+            max_concurrency=max_concurrency,
+            browser=browser,
+        )
+        job.pending.extend(job.urls)
+        self._sinks[job.id] = JobSink(job.sink, job.fields)
+        self._evict_finished()
+        self.jobs[job.id] = job
+        logging.info(
+            "Job %s queued: %s URLs, priority %s, %s max in flight",
+            job.id,
+            len(job.urls),
+            job.priority,
+            job.max_concurrency,
+            extra={"job": job.id},
+        )
+        async with self._changed:
+            self._emit(job, {"type": "state", "state": job.state})
+        return job
+
+    async def cancel(self, job: Job):
+        async with self._changed:
+            if job.finished:
+                return
+            job.pending.clear()
+            # Les pages en cours se terminent ; le job se clôt avec la dernière
+            if job.in_flight == 0:
+                self._finish(job, "cancelled")
+            else:
+                job.state = "cancelled"
+
+    def _emit(self, job: Job, event: Dict[str, Any]):
+        """Record an event and wake streams; the caller holds _changed."""
+        event["seq"] = job.next_seq
+        job.next_seq += 1
+        job.events.append(event)
+        self._changed.notify_all()
+
+    def _finish(self, job: Job, state: str):
+        job.state = state
+        job.finished_at = time.time()
+        sink = self._sinks.pop(job.id, None)
+        if sink is not None:
+            sink.close()
+        self._emit(job, {"type": "state", "state": state, "done": job.done, "failed": job.failed})
+        logging.info("Job %s %s: %s done, %s failed", job.id, state, job.done, job.failed, extra={"job": job.id})
+        self._evict_finished()
+
+    def _evict_finished(self):
+        """Drop finished jobs past job_retention, then the oldest beyond max_finished_jobs."""
+        cutoff = time.time() - self.job_retention
+        finished = sorted((job for job in self.jobs.values() if job.finished), key=lambda job: job.finished_at)
+        excess = len(finished) - self.max_finished_jobs
+        for i, job in enumerate(finished):
+            if job.finished_at > cutoff and i >= excess:
+                break
+            # Un flux déjà ouvert garde sa référence au job et se termine normalement
+            del self.jobs[job.id]
+
+    # Scheduling
+
+    def _next_job(self) -> Optional[Job]:
+        best = None
+        for job in self.jobs.values():
+            if job.finished or not job.pending or job.in_flight >= job.max_concurrency:
+                continue
+            # Priorité la plus haute, puis le job servi le moins récemment
+            if best is None or (job.priority, -job.served_at) > (best.priority, -best.served_at):
+                best = job
+        return best
+
+    async def _take(self) -> Tuple[Job, str]:
+        async with self._changed:
+            while True:
+                job = self._next_job()
+                if job is not None:
+                    if job.state == "queued":
+                        job.state = "running"
+                        self._emit(job, {"type": "state", "state": job.state})
+                    job.in_flight += 1
+                    job.served_at = time.monotonic()
+                    return job, job.pending.popleft()
+                await self._changed.wait()
+
+    async def _complete(self, job: Job, url: str, values: Optional[Dict[str, Any]]):
+        async with self._changed:
+            job.in_flight -= 1
+            sink = self._sinks.get(job.id)
+            if values is None:
+                job.failed += 1
+                self._emit(job, {"type": "error", "url": url})
+            else:
+                job.done += 1
+                if sink is not None:
+                    sink.write(url, values)
+                self._emit(job, {"type": "result", "url": url, "values": values})
+            if not job.pending and job.in_flight == 0 and not job.finished:
+                self._finish(job, "cancelled" if job.state == "cancelled" else "done")
+            # Un quota vient de se libérer
+            self._changed.notify_all()
+
+    async def _worker(self, worker_id: int):
+        while True:
+            job, url = await self._take()
+            values = None
+            try:
+                async with self.fetcher.worker_limit.slot():
+                    with tracer.span("url", url=url, worker=worker_id, job=job.id):
+                        values = await self.fetcher.resilience.call_async(url, self._scrape, job, url)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error("Worker %s error on %s: %s", worker_id, url, e, extra={"worker": worker_id, "url": url})
+            await self._complete(job, url, values)
+
+    async def _browser_pool(self):
+        async with self._browser_lock:
+            if self._browser is None:
+                from browser_async import AsyncBrowserPool
+
+                # Même pool de sorties que le fetch HTTP : une seule cadence vers le site
+                pool = AsyncBrowserPool(max_pages=self.max_pages, egress=self.fetcher.egress)
+                self._browser = await pool.__aenter__()
+            return self._browser
+
+    async def _scrape(self, job: Job, url: str) -> Dict[str, Any]:
+        """One attempt: raises FetchError / ParseError so the retry policy can classify it."""
+        if job.browser:
+            html = await (await self._browser_pool()).fetch_html(url)
+        else:
+            html = await self.fetcher.fetch_html(self._session, url)
+        with tracer.span("parse", url=url):
+            values = await asyncio.get_running_loop().run_in_executor(self.parsers, get_engine().extract, html)
+        values = {f: values.get(f) for f in job.fields}
+        if all(value is None for value in values.values()):
+            raise ParseError(f"None of {job.fields} found for {url}")
+        return values
+
+    def stats(self) -> Dict[str, Any]:
+        states: Dict[str, int] = {}
+        for job in self.jobs.values():
+            states[job.state] = states.get(job.state, 0) + 1
+        limit = self.fetcher.worker_limit
+        return {
+            "jobs": states,
+            "workers": {"limit": limit.limit, "in_flight": limit.in_flight, "max": self.fetcher.max_workers},
+            "browser": self._browser is not None,
+            "exits": self.fetcher.egress.stats(),
+            "latency": latency.stats(),
+            "hedging": self.fetcher.hedger.stats(),
+            "parse_cache": get_engine().cache.stats() if get_engine().cache is not None else None,
+            "lookup": self.lookup.stats() if self.lookup is not None else None,
+        }
+
+
+# API HTTP
+
+
+def _error(status: int, message: str) -> web.Response:
+    return web.json_response({"error": message}, status=status)
+
+
+def _job(request: web.Request) -> Job:
+    job = request.app["service"].jobs.get(request.match_info["job_id"])
+    if job is None:
+        raise web.HTTPNotFound(text=json.dumps({"error": "unknown job"}), content_type="application/json")
+    return job
+
+
+async def create_job(request: web.Request) -> web.Response:
+    try:
+        spec = await request.json()
+    except json.JSONDecodeError:
+        return _error(400, "body must be JSON")
+    if not isinstance(spec, dict):
+        return _error(400, "body must be a JSON object")
+    try:
+        job = await request.app["service"].submit(spec)
+    except (TypeError, ValueError) as e:
+        return _error(400, str(e))
+    return web.json_response(job.summary(), status=201)
+
+
+async def list_jobs(request: web.Request) -> web.Response:
+    return web.json_response([job.summary() for job in request.app["service"].jobs.values()])
+
+
+async def get_job(request: web.Request) -> web.Response:
+    return web.json_response(_job(request).summary())
+
+
+async def cancel_job(request: web.Request) -> web.Response:
+    job = _job(request)
+    await request.app["service"].cancel(job)
+    return web.json_response(job.summary())
+
+
+async def job_events(request: web.Request) -> web.StreamResponse:
+    """NDJSON stream of a job's events from ?since=<seq>, until the job is finished."""
+    service, job = request.app["service"], _job(request)
+    try:
+        since = int(request.query.get("since", 0))
+    except ValueError:
+        return _error(400, "since must be an integer")
+    response = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+    await response.prepare(request)
+    while True:
+        async with service._changed:
+            await service._changed.wait_for(lambda: job.next_seq > since or job.finished)
+            events = [event for event in job.events if event["seq"] >= since]
+            since = job.next_seq
+            finished = job.finished
+        if events:
+            await response.write("".join(json.dumps(e, ensure_ascii=False, default=str) + "\n" for e in events).encode())
+        if finished:
+            break
+    await response.write_eof()
+    return response
+
+
+async def lookup_domains(request: web.Request) -> web.StreamResponse:
+    """{"domains": [...]} -> NDJSON stream of LookupResults, in completion order."""
+    try:
+        spec = await request.json()
+    except json.JSONDecodeError:
+        return _error(400, "body must be JSON")
+    domains = spec.get("domains") if isinstance(spec, dict) else None
+    if not isinstance(domains, list) or not all(isinstance(d, str) for d in domains):
+        return _error(400, "domains must be a list of strings")
+    response = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+    await response.prepare(request)
+    async for result in request.app["service"].lookup.lookup_many(domains):
+        await response.write((json.dumps(asdict(result), ensure_ascii=False) + "\n").encode())
+    await response.write_eof()
+    return response
+
+
+async def get_stats(request: web.Request) -> web.Response:
+    return web.json_response(request.app["service"].stats())
+
+
+def build_app(service: CrawlService) -> web.Application:
+    app = web.Application()
+    app["service"] = service
+    app.add_routes(
+        [
+            web.post("/jobs", create_job),
+            web.get("/jobs", list_jobs),
+            web.get("/jobs/{job_id}", get_job),
+            web.delete("/jobs/{job_id}", cancel_job),
+            web.get("/jobs/{job_id}/events", job_events),
+            web.post("/lookup", lookup_domains),
+            web.get("/stats", get_stats),
+        ]
+    )
+
+    async def on_startup(_):
+        await service.start()
+
+    async def on_cleanup(_):
+        await service.stop()
+
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+    return app
+
+
+def serve(
+    host: str = "127.0.0.1",
+    port: int = DEFAULT_PORT,
+    jobs_dir: str = JOBS_DIR,
+    max_workers: Optional[int] = None,
+    requests_per_second: Optional[float] = 2.0,
+    hedge_ratio: float = 0.0,
+):
+    """Configure logging and tracing, then serve the job API until interrupted."""
+    configure_logging(log_file="crawl_service.log", json_format=True)
+    enable_tracing()  # Actif si TRUSTPILOT_TRACE=<fichier.json>
+    service = CrawlService(
+        jobs_dir, max_workers=max_workers, requests_per_second=requests_per_second, hedge_ratio=hedge_ratio
+    )
+    web.run_app(build_app(service), host=host, port=port, print=None)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local crawl-job service: submit jobs over HTTP, share the fetch pools.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--jobs-dir", default=JOBS_DIR, help="where job sinks are written")
+    parser.add_argument("--max-workers", type=int, help="concurrency ceiling shared by all jobs")
+    parser.add_argument("--rps", type=float, default=2.0, help="requests per second per exit")
+    parser.add_argument("--hedge-ratio", type=float, default=0.0, help="extra requests allowed for hedging, e.g. 0.05")
+    args = parser.parse_args()
+    serve(args.host, args.port, args.jobs_dir, args.max_workers, args.rps, args.hedge_ratio)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+from typing import Dict, Optional
+from urllib.parse import urlparse
+
+# Colonnes portant l'URL du profil Trustpilot (CSV du sitemap : "URL")
+TRUSTPILOT_URL_COLUMNS = ("URL", "URL Trustpilot")
+
+
+def canonical_domain(url: str) -> str:
+    """Return the key identifying a company, e.g. 'vinted.fr'.
+
+    Accepts Trustpilot profile URLs (https://www.trustpilot.com/review/vinted.fr)
+    as well as plain website URLs or bare domains.
+    """
+    url = url.strip()
+    if "://" not in url:
+        url = f"https://{url}"
+    parsed = urlparse(url)
+    host = (parsed.hostname or "").lower()
+    if host.endswith("trustpilot.com") and parsed.path.startswith("/review/"):
+        host = parsed.path[len("/review/"):].split("/")[0].lower()
+    if host.startswith("www."):
+        host = host[4:]
+    return host.rstrip(".")
+
+
+def record_key(record: Dict[str, str], known: Optional[Dict[str, str]] = None) -> str:
+    """Key of a scraper CSV row, the canonical Trustpilot domain the crawlers use.
+
+    The Trustpilot URL when the CSV has one; else known (CompanyStore.key_index())
+    maps the website's domain or the lower-cased name to the key of a company
+    already crawled; else the website's domain, which Trustpilot files most
+    profiles under (/review/<domain>); else the lower-cased name. '' if none.
+    """
+    for column in TRUSTPILOT_URL_COLUMNS:
+        url = (record.get(column) or "").strip()
+        if "trustpilot.com/review/" in url:
+            return canonical_domain(url)
+    site = (record.get("Site") or "").strip()
+    name = (record.get("Nom de l'entreprise") or "").strip().lower()
+    site_domain = canonical_domain(site) if site else ""
+    if known:
+        for candidate in (site_domain, name):
+            if candidate and candidate in known:
+                return known[candidate]
+    return site_domain or name
@@ -0,0 +1,187 @@
+import json
+import logging
+import os
+import threading
+import time
+from typing import List, Optional
+
+from rate_limiter import RateLimiter
+from resilience import classify
+
+EGRESS_PATH = os.environ.get("TRUSTPILOT_EGRESS", "egress.json")
+
+# Un User-Agent stable par sortie : une IP garde la même empreinte d'un run à l'autre
+USER_AGENTS = [
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36",
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36",
+    "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36",
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/123.0.0.0 Safari/537.36 Edg/123.0.0.0",
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.4 Safari/605.1.15",
+]
+
+# Erreurs imputables à la sortie ; un 404 ou une page incomplète ne le sont pas
+EXIT_ERRORS = {"rate_limited", "server", "timeout", "network", "client"}
+
+
+class Exit:
+    """One way out: a proxy URL (http://host:port) or the direct connection (proxy=None)."""
+
+    def __init__(
+        self,
+        proxy: Optional[str] = None,
+        rate: Optional[float] = None,
+        burst: int = 1,
+        user_agent: str = USER_AGENTS[0],
+    ):
+        self.proxy = proxy
+        self.limiter = RateLimiter(rate=rate, burst=burst)
+        self.user_agent = user_agent
+        self.latency = 1.0  # EWMA en secondes, prior pessimiste pour une sortie jamais mesurée
+        self.error_rate = 0.0  # EWMA de 0/1
+        self.samples = 0
+        self.retirements = 0
+        self.retired_until = 0.0
+
+    @property
+    def name(self) -> str:
+        return self.proxy or "direct"
+
+    def score(self) -> float:
+        """Expected seconds until a good answer: budget wait plus error-penalised latency."""
+        return self.limiter.peek() + self.latency * (1 + 4 * self.error_rate)
+
+
+class EgressPool:
+    """Spread requests over several exits, each with its own rate budget and health score.
+
+    An exit whose error rate goes above max_error_rate is retired for
+    retire_seconds, doubled at each new retirement, then comes back on
+    probation. With no configuration the pool is a single direct exit, which
+    behaves exactly like one shared RateLimiter.
+    """
+
+    def __init__(
+        self,
+        exits: List[Exit],
+        alpha: float = 0.2,
+        min_samples: int = 10,
+        max_error_rate: float = 0.5,
+        retire_seconds: float = 60.0,
+        rate_limit_pause: float = 30.0,
+    ):
+        if not exits:
+            raise ValueError("EgressPool needs at least one exit")
+        self.exits = exits
+        self.alpha = alpha
+        self.min_samples = min_samples
+        self.max_error_rate = max_error_rate
+        self.retire_seconds = retire_seconds
+        self.rate_limit_pause = rate_limit_pause
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, path: str = EGRESS_PATH, rate: Optional[float] = None, burst: int = 1, **kwargs) -> "EgressPool":
+        """Build the pool from egress.json, or a single direct exit if there is none.
+
+        egress.json: {"direct": true, "exits": [{"proxy": "http://127.0.0.1:8081", "rate": 2, "burst": 2}]}
+        rate/burst are the defaults for exits that do not set their own.
+        """
+        if not os.path.exists(path):
+            return cls([Exit(None, rate, burst)], **kwargs)
+        with open(path, encoding="utf-8") as f:
+            config = json.load(f)
+        exits = []
+        if config.get("direct", False):
+            exits.append(Exit(None, rate, burst))
+        for spec in config.get("exits", []):
+            exits.append(
+                Exit(
+                    spec["proxy"],
+                    spec.get("rate", rate),
+                    spec.get("burst", burst),
+                    spec.get("user_agent", USER_AGENTS[len(exits) % len(USER_AGENTS)]),
+                )
+            )
+        logging.info("Egress pool: %s exits from %s", len(exits), path)
+        return cls(exits or [Exit(None, rate, burst)], **kwargs)
+
+    def choose(self) -> Exit:
+        """The active exit with the best score; the soonest back if all are retired."""
+        now = time.monotonic()
+        with self._lock:
+            active = [e for e in self.exits if e.retired_until <= now]
+            if not active:
+                return min(self.exits, key=lambda e: e.retired_until)
+            return min(active, key=Exit.score)
+
+    def acquire(self) -> Exit:
+        """Pick an exit and block until its budget allows a request."""
+        exit_ = self.choose()
+        exit_.limiter.acquire()
+        return exit_
+
+    async def acquire_async(self) -> Exit:
+        exit_ = self.choose()
+        await exit_.limiter.acquire_async()
+        return exit_
+
+    def record(
+        self,
+        exit_: Exit,
+        latency: float,
+        error: Optional[BaseException] = None,
+    ):
+        """Feed back one request's outcome into the exit's health score."""
+        error_class = classify(error) if error is not None else None
+        failed = error_class in EXIT_ERRORS
+        with self._lock:
+            exit_.samples += 1
+            exit_.latency += self.alpha * (latency - exit_.latency)
+            exit_.error_rate += self.alpha * (float(failed) - exit_.error_rate)
+            if error_class == "rate_limited":
+                # Seule cette sortie fait la pause, les autres continuent
+                exit_.limiter.backoff(getattr(error, "retry_after", None) or self.rate_limit_pause)
+            if (
+                failed
+                and len(self.exits) > 1
+                and exit_.samples >= self.min_samples
+                and exit_.error_rate > self.max_error_rate
+            ):
+                pause = min(3600.0, self.retire_seconds * 2 ** exit_.retirements)
+                exit_.retirements += 1
+                exit_.retired_until = time.monotonic() + pause
+                exit_.samples = 0
+                exit_.error_rate = self.max_error_rate / 2  # Retour en période d'essai
+                logging.warning(
+                    "Exit %s retired for %.0f seconds (error rate above %.0f%%)",
+                    exit_.name,
+                    pause,
+                    self.max_error_rate * 100,
+                    extra={"exit": exit_.name},
+                )
+
+    def stats(self) -> List[dict]:
+        now = time.monotonic()
+        with self._lock:
+            return [
+                {
+                    "exit": e.name,
+                    "latency": round(e.latency, 3),
+                    "error_rate": round(e.error_rate, 3),
+                    "retired_for": max(0.0, round(e.retired_until - now, 1)),
+                    "retirements": e.retirements,
+                }
+                for e in self.exits
+            ]
+
+
+def chrome_arguments(exit_: Exit) -> List[str]:
+    """ChromeOptions arguments routing a driver through exit_.
+
+    Chrome's --proxy-server takes no credentials: authenticated proxies need
+    an IP allow-list or a local forwarder.
+    """
+    arguments = [f"--user-agent={exit_.user_agent}"]
+    if exit_.proxy:
+        arguments.append(f"--proxy-server={exit_.proxy}")
+    return arguments
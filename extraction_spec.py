@@ -0,0 +1,351 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from bs4 import BeautifulSoup
+
+from next_data import full_next_data, partial_next_data
+from parse_cache import ParseCache, content_key
+from records import CompanyRecord
+
+SPEC_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "extraction_spec.json")
+
+JSON_LD_RE = re.compile(r'<script type="application/ld\+json"[^>]*>(.*?)</script>', re.S)
+STAR_KEYS = {5: "five", 4: "four", 3: "three", 2: "two", 1: "one"}
+COUNTRY_NAMES = {"FR": "France"}
+
+
+class Document:
+    """One fetched page; each representation is built at most once, on first use."""
+
+    def __init__(self, html: str, next_data_keys: Optional[List[str]] = None):
+        self.html = html
+        self.next_data_keys = next_data_keys
+        self._next_data = None
+        self._json_ld = None
+        self._soup = None
+
+    @property
+    def next_data(self) -> Any:
+        if self._next_data is None:
+            # Décodage partiel des seules clés utiles, décodage complet en repli
+            if self.next_data_keys:
+                self._next_data = partial_next_data(self.html, self.next_data_keys)
+            if self._next_data is None:
+                self._next_data = full_next_data(self.html)
+        return self._next_data
+
+    @property
+    def json_ld(self) -> List[Any]:
+        if self._json_ld is None:
+            self._json_ld = []
+            for match in JSON_LD_RE.finditer(self.html):
+                try:
+                    self._json_ld.append(json.loads(match.group(1)))
+                except json.JSONDecodeError:
+                    continue
+        return self._json_ld
+
+    @property
+    def soup(self) -> BeautifulSoup:
+        if self._soup is None:
+            self._soup = BeautifulSoup(self.html, "html.parser")
+        return self._soup
+
+
+def compile_path(path: str) -> Callable[[Any], Any]:
+    """Compile 'a.b.0.key=value.c' into a lookup function.
+
+    Integer segments index lists, 'key=value' segments pick the first list item
+    whose key matches.
+    """
+    steps = []
+    for segment in path.split("."):
+        if "=" in segment:
+            key, value = segment.split("=", 1)
+            steps.append(("filter", key, value.lower()))
+        elif segment.isdigit():
+            steps.append(("index", int(segment), None))
+        else:
+            steps.append(("key", segment, None))
+
+    def lookup(data: Any) -> Any:
+        for kind, key, value in steps:
+            if kind == "key":
+                if not isinstance(data, dict):
+                    return None
+                data = data.get(key)
+            elif kind == "index":
+                if not isinstance(data, list) or key >= len(data):
+                    return None
+                data = data[key]
+            else:
+                if not isinstance(data, list):
+                    return None
+                data = next(
+                    (
+                        item
+                        for item in data
+                        if isinstance(item, dict) and str(item.get(key)).lower() == value
+                    ),
+                    None,
+                )
+            if data is None:
+                return None
+        return data
+
+    return lookup
+
+
+def page_props_key(path: str) -> Optional[str]:
+    """'props.pageProps.businessUnit.trustScore' -> 'businessUnit'."""
+    segments = path.split(".")
+    if len(segments) > 2 and segments[:2] == ["props", "pageProps"]:
+        return segments[2]
+    return None
+
+
+def compile_strategy(strategy: Dict[str, str]) -> Callable[[Document], Any]:
+    """Turn one strategy of the spec into a function of a Document."""
+    if "next_data" in strategy:
+        lookup = compile_path(strategy["next_data"])
+        return lambda doc: lookup(doc.next_data)
+    if "jsonld" in strategy:
+        lookup = compile_path(strategy["jsonld"])
+
+        def from_json_ld(doc: Document) -> Any:
+            for data in doc.json_ld:
+                value = lookup(data)
+                if value not in (None, ""):
+                    return value
+            return None
+
+        return from_json_ld
+    if "css" in strategy:
+        selector, attr = strategy["css"], strategy.get("attr")
+
+        def from_css(doc: Document) -> Any:
+            element = doc.soup.select_one(selector)
+            if element is None:
+                return None
+            return element.get(attr) if attr else element.get_text(" ", strip=True)
+
+        return from_css
+    if "regex" in strategy:
+        pattern = re.compile(strategy["regex"])
+
+        def from_regex(doc: Document) -> Any:
+            match = pattern.search(doc.html)
+            return match.group(1) if match else None
+
+        return from_regex
+    raise ValueError(f"Unknown extraction strategy: {strategy}")
+
+
+def coerce(value: Any, kind: str) -> Any:
+    """Cast a raw value to the field type; None when it does not parse."""
+    if kind == "raw" or value is None:
+        return value
+    if kind == "int":
+        if isinstance(value, (int, float)):
+            return int(value)
+        digits = re.sub(r"[^\d]", "", str(value))
+        return int(digits) if digits else None
+    if kind == "float":
+        if isinstance(value, (int, float)):
+            return float(value)
+        match = re.search(r"\d+(?:[.,]\d+)?", str(value))
+        return float(match.group().replace(",", ".")) if match else None
+    value = str(value).strip()
+    return value or None
+
+
+class ExtractionPlan:
+    """A compiled spec: per field, an ordered list of strategies with hit counters."""
+
+    def __init__(self, spec: dict):
+        self.version = spec.get("version", 0)
+        # Version déclarée + contenu : une retouche sans changement de version invalide aussi le cache
+        canonical = json.dumps(spec, sort_keys=True).encode("utf-8")
+        self.fingerprint = f"{self.version}:{hashlib.sha1(canonical).hexdigest()[:12]}"
+        self.fields = {}
+        keys = set()
+        for field, field_spec in spec["fields"].items():
+            strategies = [compile_strategy(s) for s in field_spec["strategies"]]
+            self.fields[field] = (field_spec.get("type", "str"), strategies)
+            for strategy in field_spec["strategies"]:
+                if "next_data" in strategy:
+                    keys.add(page_props_key(strategy["next_data"]))
+        # Décodage partiel seulement si tous les chemins passent par pageProps
+        self.next_data_keys = sorted(keys) if keys and None not in keys else None
+        self.hits = {field: [0] * len(s) for field, (_, s) in self.fields.items()}
+        self.misses = {field: 0 for field in self.fields}
+
+    def extract(self, html: str) -> Dict[str, Any]:
+        doc = Document(html, self.next_data_keys)
+        values = {}
+        for field, (kind, strategies) in self.fields.items():
+            for index, strategy in enumerate(strategies):
+                try:
+                    value = coerce(strategy(doc), kind)
+                except Exception:
+                    value = None
+                if value not in (None, ""):
+                    values[field] = value
+                    self.hits[field][index] += 1
+                    break
+            else:
+                self.misses[field] += 1
+        return values
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Hit rate of every strategy, to spot selectors Trustpilot broke."""
+        report = {}
+        for field, hits in self.hits.items():
+            total = sum(hits) + self.misses[field]
+            report[field] = {
+                "hits": hits,
+                "misses": self.misses[field],
+                "hit_rates": [round(h / total, 3) if total else 0.0 for h in hits],
+            }
+        return report
+
+
+class ExtractionEngine:
+    """Loads the spec file and recompiles it when it changes on disk.
+
+    The file is stat'ed at most every check_interval seconds, so a fixed selector
+    is picked up by a running crawl without a restart. An invalid spec is logged
+    and the previous plan stays in use. With a cache, pages whose JSON-LD and
+    the __NEXT_DATA__ entries the spec reads are unchanged return the values
+    extracted the last time, until the spec changes.
+    """
+
+    def __init__(self, path: str = SPEC_PATH, check_interval: float = 2.0, cache: Optional[ParseCache] = None):
+        self.path = path
+        self.check_interval = check_interval
+        self.cache = cache
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._checked_at = 0.0
+        self._plan: Optional[ExtractionPlan] = None
+        self._reload()
+
+    def _reload(self):
+        mtime = os.stat(self.path).st_mtime
+        with open(self.path, encoding="utf-8") as f:
+            plan = ExtractionPlan(json.load(f))
+        self._plan, self._mtime = plan, mtime
+        logging.info("Extraction spec v%s loaded from %s", plan.version, self.path)
+
+    @property
+    def plan(self) -> ExtractionPlan:
+        now = time.monotonic()
+        if now - self._checked_at >= self.check_interval:
+            with self._lock:
+                self._checked_at = now
+                try:
+                    if os.stat(self.path).st_mtime != self._mtime:
+                        self._reload()
+                except Exception as e:
+                    logging.error("Invalid extraction spec %s, keeping v%s: %s", self.path, self._plan.version, e)
+        return self._plan
+
+    @property
+    def version(self) -> int:
+        return self.plan.version
+
+    def extract(self, html: str) -> Dict[str, Any]:
+        plan = self.plan
+        key = content_key(html, plan.next_data_keys) if self.cache is not None else None
+        if key is not None:
+            values = self.cache.get("values", key, plan.fingerprint)
+            if values is not None:
+                return values
+        values = plan.extract(html)
+        if key is not None and values:
+            self.cache.put("values", key, plan.fingerprint, values)
+        return values
+
+    def cached_record(self, html: str, url: Optional[str] = None) -> Optional[CompanyRecord]:
+        """The record a scraper built from an identical page, so it can skip its DOM lookups."""
+        key = content_key(html, self.plan.next_data_keys) if self.cache is not None else None
+        if key is None:
+            return None
+        fields = self.cache.get("record", key, self.plan.fingerprint)
+        return None if fields is None else CompanyRecord.from_dict(fields, url)
+
+    def remember_record(self, html: str, record: CompanyRecord):
+        key = content_key(html, self.plan.next_data_keys) if self.cache is not None else None
+        if key is not None:
+            self.cache.put("record", key, self.plan.fingerprint, record.to_dict())
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return self.plan.stats()
+
+
+_engine: Optional[ExtractionEngine] = None
+_engine_lock = threading.Lock()
+
+
+def get_engine() -> ExtractionEngine:
+    """Process-wide engine shared by every scraper."""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = ExtractionEngine(cache=ParseCache())
+        return _engine
+
+
+def star_distribution(star_counts: Optional[dict]) -> Optional[Dict[int, str]]:
+    """{'one': 63, ..., 'five': 8} -> {1: '76%', ..., 5: '10%'}, '<1%' rounded up to '1%'."""
+    if not star_counts:
+        return None
+    counts = {stars: int(star_counts.get(key) or 0) for stars, key in STAR_KEYS.items()}
+    total = sum(counts.values())
+    if not total:
+        return {stars: "0%" for stars in counts}
+    percentages = {}
+    for stars, count in counts.items():
+        percent = round(100 * count / total)
+        percentages[stars] = f"{max(percent, 1) if count else 0}%"
+    return percentages
+
+
+def full_address(values: Dict[str, Any]) -> str:
+    """Join street, zip code, city and country the way the CSV already stores them."""
+    country = values.get("country")
+    parts = [
+        values.get("address"),
+        values.get("zip_code"),
+        values.get("city"),
+        COUNTRY_NAMES.get(country, country),
+    ]
+    return ", ".join(part for part in parts if part)
+
+
+def company_record(values: Dict[str, Any], default_category: str = "Clothing Store") -> CompanyRecord:
+    """Build the record of scrape_company_data() from extracted values alone (no DOM)."""
+    address = full_address(values)
+    country = values.get("country")
+    if country:
+        in_france = country == "FR"
+    else:
+        # Pas de pays connu : on fait confiance au filtre country=FR du listing
+        in_france = not address or "france" in address.lower()
+    stars = star_distribution(values.get("star_counts")) or {i: "0%" for i in range(1, 6)}
+    return CompanyRecord(
+        name=values.get("name", ""),
+        rating=values.get("rating", 0),
+        review_count=values.get("review_count", 0),
+        category=values.get("category") or default_category,
+        website=values.get("website", ""),
+        address=address,
+        in_france=in_france,
+        stars=stars,
+    )
@@ -0,0 +1,153 @@
+import heapq
+import json
+import logging
+import math
+import os
+import re
+import sqlite3
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from domains import canonical_domain
+from store import DB_PATH
+
+CHANGELOG_PATH = "trustpilot_changes.jsonl"
+
+
+def parse_duration(value: str) -> float:
+    """'2h' / '90m' / '45s' / '3600' -> seconds."""
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([hms]?)\s*", value.lower())
+    if not match:
+        raise ValueError(f"invalid duration: {value!r}")
+    number, unit = float(match.group(1)), match.group(2)
+    return number * {"h": 3600, "m": 60}.get(unit, 1)
+
+
+class Deadline:
+    """Hard wall-clock budget for a run; never expires when seconds is None."""
+
+    def __init__(self, seconds: Optional[float] = None):
+        self.seconds = seconds
+        self.end = time.monotonic() + seconds if seconds is not None else None
+
+    def remaining(self) -> float:
+        return math.inf if self.end is None else max(0.0, self.end - time.monotonic())
+
+    def expired(self) -> bool:
+        return self.end is not None and time.monotonic() >= self.end
+
+
+@dataclass
+class FrontierWeights:
+    staleness: float = 1.0  # Temps depuis le dernier crawl, plafonné à staleness_horizon_days
+    popularity: float = 1.0  # log du nombre d'avis
+    change: float = 0.5  # Part des runs où l'entreprise a changé
+    staleness_horizon_days: float = 7.0
+
+
+def load_signals(
+    store_path: str = DB_PATH, changelog_path: str = CHANGELOG_PATH
+) -> Tuple[Dict[str, Tuple[Optional[str], Optional[int]]], Dict[str, float]]:
+    """(domain -> (crawled_at, review_count)) from the store, (domain -> change rate) from the change log."""
+    crawled: Dict[str, Tuple[Optional[str], Optional[int]]] = {}
+    if os.path.exists(store_path):
+        conn = sqlite3.connect(store_path)
+        try:
+            for domain, crawled_at, review_count in conn.execute(
+                "SELECT domain, crawled_at, review_count FROM companies"
+            ):
+                crawled[domain] = (crawled_at, review_count)
+        finally:
+            conn.close()
+
+    changes: Dict[str, float] = {}
+    if os.path.exists(changelog_path):
+        runs, changed_runs = set(), {}
+        with open(changelog_path, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                event = json.loads(line)
+                runs.add(event["run"])
+                if event["type"] != "new_company":
+                    changed_runs.setdefault(event["domain"], set()).add(event["run"])
+        if runs:
+            changes = {domain: len(seen) / len(runs) for domain, seen in changed_runs.items()}
+    return crawled, changes
+
+
+class Frontier:
+    """URLs ordered by staleness × popularity × change frequency, most valuable first.
+
+    Companies never crawled count as fully stale. Review counts from the
+    listing cards (popularity=) are used when the store has none.
+    """
+
+    def __init__(
+        self,
+        urls: Iterable[str],
+        weights: Optional[FrontierWeights] = None,
+        popularity: Optional[Dict[str, int]] = None,
+        deadline: Optional[Deadline] = None,
+        store_path: str = DB_PATH,
+        changelog_path: str = CHANGELOG_PATH,
+    ):
+        self.weights = weights or FrontierWeights()
+        self.deadline = deadline or Deadline()
+        crawled, changes = load_signals(store_path, changelog_path)
+        popularity = popularity or {}
+        now = datetime.now()
+
+        rows = []
+        for url in dict.fromkeys(urls):
+            domain = canonical_domain(url)
+            crawled_at, review_count = crawled.get(domain, (None, None))
+            if review_count is None:
+                review_count = popularity.get(url)
+            if crawled_at:
+                age_days = (now - datetime.fromisoformat(crawled_at)).total_seconds() / 86400
+            else:
+                age_days = math.inf
+            rows.append((url, age_days, review_count or 0, changes.get(domain, 0.0)))
+
+        max_reviews = max((reviews for _, _, reviews, _ in rows), default=0)
+        self._heap: List[Tuple[float, int, str]] = []
+        for position, (url, age_days, reviews, change) in enumerate(rows):
+            score = self.score(age_days, reviews, change, max_reviews)
+            # Score négatif : heapq est un tas min ; position pour garder l'ordre d'origine à égalité
+            self._heap.append((-score, position, url))
+        heapq.heapify(self._heap)
+        logging.info("Frontier: %s URLs, budget %s", len(self._heap), self._budget_label())
+
+    def score(self, age_days: float, reviews: int, change: float, max_reviews: int) -> float:
+        w = self.weights
+        staleness = min(1.0, age_days / w.staleness_horizon_days) if w.staleness_horizon_days else 1.0
+        popularity = math.log1p(reviews) / math.log1p(max_reviews) if max_reviews else 0.0
+        return w.staleness * staleness + w.popularity * popularity + w.change * change
+
+    def _budget_label(self) -> str:
+        return "none" if self.deadline.seconds is None else f"{self.deadline.seconds / 60:.0f} min"
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def pop(self) -> Optional[str]:
+        """Next URL, or None once the frontier is empty or the deadline has passed."""
+        if not self._heap or self.deadline.expired():
+            return None
+        return heapq.heappop(self._heap)[2]
+
+    def __iter__(self) -> Iterator[str]:
+        while True:
+            url = self.pop()
+            if url is None:
+                if self._heap:
+                    logging.warning("Deadline reached: %s URLs left for the next run", len(self._heap))
+                return
+            yield url
+
+    def ordered(self) -> List[str]:
+        """Every URL in priority order, without consuming the frontier or checking the deadline."""
+        return [url for _, _, url in sorted(self._heap)]
@@ -0,0 +1,405 @@
+import argparse
+import csv
+import logging
+import os
+import sqlite3
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from itertools import accumulate
+from typing import Dict, Iterator, List, Optional
+from urllib.parse import quote
+
+from domains import canonical_domain, record_key
+from log_setup import configure_logging
+from records import STARS, CompanyRecord
+from store import DB_PATH, CompanyStore
+
+HISTORY_PATH = os.environ.get("TRUSTPILOT_HISTORY", "trustpilot_history")
+
+# Une mesure = minute + 7 valeurs entières (note×10, nombre d'avis, % 5 à 1 étoile),
+# stockées +1 pour que 0 signifie « inconnu »
+FIELDS = ["rating", "review_count", "pct_5", "pct_4", "pct_3", "pct_2", "pct_1"]
+WIDTH = 1 + len(FIELDS)
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS series (
+    domain TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    block INTEGER,
+    minute INTEGER NOT NULL,
+    {", ".join(f"{f} INTEGER NOT NULL" for f in FIELDS)}
+);
+CREATE TABLE IF NOT EXISTS checkpoints (
+    domain TEXT NOT NULL,
+    minute INTEGER NOT NULL,
+    start INTEGER NOT NULL,
+    next INTEGER NOT NULL,
+    {", ".join(f"{f} INTEGER NOT NULL, {f}_lo INTEGER NOT NULL, {f}_hi INTEGER NOT NULL" for f in FIELDS)},
+    PRIMARY KEY (domain, minute)
+) WITHOUT ROWID;
+"""
+
+
+@dataclass
+class Sample:
+    at: datetime
+    rating: Optional[float]
+    review_count: Optional[int]
+    pct_5: Optional[int]
+    pct_4: Optional[int]
+    pct_3: Optional[int]
+    pct_2: Optional[int]
+    pct_1: Optional[int]
+
+
+def _zigzag(value: int) -> int:
+    return value << 1 if value >= 0 else (-value << 1) - 1
+
+
+def encode_sample(previous: List[int], current: List[int]) -> bytes:
+    """Deltas from previous as varints: plain for the (increasing) minute, zigzag for the values."""
+    out = bytearray()
+    for i, (before, after) in enumerate(zip(previous, current)):
+        value = after - before if i == 0 else _zigzag(after - before)
+        while value >= 0x80:
+            out.append((value & 0x7F) | 0x80)
+            value >>= 7
+        out.append(value)
+    return bytes(out)
+
+
+def decode_samples(data: bytes, state: List[int]) -> Iterator[List[int]]:
+    """Absolute values of each complete sample of data, deltas applied from state."""
+    numbers, result, shift = [], 0, 0
+    for byte in data:
+        if byte < 0x80:
+            numbers.append(result | (byte << shift))
+            result = shift = 0
+        else:
+            result |= (byte & 0x7F) << shift
+            shift += 7
+    end = len(numbers) // WIDTH * WIDTH  # Une mesure tronquée en fin de fichier est ignorée
+    # Sommes cumulées colonne par colonne : la boucle interne reste dans itertools
+    columns = [list(accumulate(numbers[0:end:WIDTH], initial=state[0]))[1:]]
+    for i in range(1, WIDTH):
+        deltas = (n >> 1 if not n & 1 else -((n + 1) >> 1) for n in numbers[i:end:WIDTH])
+        columns.append(list(accumulate(deltas, initial=state[i]))[1:])
+    return (list(values) for values in zip(*columns))
+
+
+def sample_ends(data: bytes) -> List[int]:
+    """End offset of each complete sample of data."""
+    ends, fields = [], 0
+    for pos, byte in enumerate(data, 1):
+        if byte < 0x80:
+            fields += 1
+            if fields == WIDTH:
+                ends.append(pos)
+                fields = 0
+    return ends
+
+
+def _sample(values: List[int]) -> Sample:
+    minute, rating, *rest = values
+    return Sample(
+        datetime.fromtimestamp(minute * 60),
+        (rating - 1) / 10 if rating else None,
+        *(value - 1 if value else None for value in rest),
+    )
+
+
+def _stored(value, scale: int = 1) -> int:
+    return 0 if value is None else int(round(value * scale)) + 1
+
+
+def _minute(when: Optional[datetime]) -> int:
+    return int((when or datetime.now()).timestamp() // 60)
+
+
+class HistoryStore:
+    """Append-only, delta + varint encoded rating history, one series file per company.
+
+    A daily sample takes about 9 bytes. The SQLite index keeps the latest
+    values of every company and a checkpoint every checkpoint_every samples:
+    absolute values, file offsets and the min/max of each field over the
+    block. A point in time costs one block decode at most, and trend
+    queries skip the decode whenever the block bounds settle the answer.
+    Samples written after the last commit (crash) are re-indexed on the
+    next append; a torn last sample is cut off.
+    """
+
+    def __init__(self, root: str = HISTORY_PATH, checkpoint_every: int = 16):
+        self.root = root
+        self.series_dir = os.path.join(root, "series")
+        self.checkpoint_every = checkpoint_every
+        os.makedirs(self.series_dir, exist_ok=True)
+        self.conn = sqlite3.connect(os.path.join(root, "index.db"))
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+
+    def _path(self, domain: str) -> str:
+        return os.path.join(self.series_dir, quote(domain, safe="") + ".bin")
+
+    def _read(self, domain: str, start: int, end: Optional[int] = None) -> bytes:
+        with open(self._path(domain), "rb") as f:
+            f.seek(start)
+            return f.read(-1 if end is None else end - start)
+
+    def _entry(self, domain: str) -> dict:
+        row = self.conn.execute(
+            f"SELECT size, count, block, minute, {', '.join(FIELDS)} FROM series WHERE domain = ?", (domain,)
+        ).fetchone()
+        if row is None:
+            return {"size": 0, "count": 0, "block": None, "last": [0] * WIDTH}
+        return {"size": row[0], "count": row[1], "block": row[2], "last": list(row[3:])}
+
+    def _index(self, domain: str, entry: dict, values: List[int], start: int, end: int):
+        """Record a sample stored at [start, end) of the series file."""
+        if entry["count"] % self.checkpoint_every == 0:
+            entry["block"] = values[0]
+            columns = ", ".join(f"{f}, {f}_lo, {f}_hi" for f in FIELDS)
+            self.conn.execute(
+                f"INSERT OR REPLACE INTO checkpoints (domain, minute, start, next, {columns}) "
+                f"VALUES (?, ?, ?, ?, {', '.join('?, ?, ?' for _ in FIELDS)})",
+                (domain, values[0], start, end, *(v for value in values[1:] for v in (value, value, value))),
+            )
+        else:
+            bounds = ", ".join(f"{f}_lo = MIN({f}_lo, ?), {f}_hi = MAX({f}_hi, ?)" for f in FIELDS)
+            self.conn.execute(
+                f"UPDATE checkpoints SET {bounds} WHERE domain = ? AND minute = ?",
+                (*(v for value in values[1:] for v in (value, value)), domain, entry["block"]),
+            )
+        entry["count"] += 1
+        entry["size"] = end
+        entry["last"] = values
+        self.conn.execute(
+            f"INSERT OR REPLACE INTO series (domain, size, count, block, minute, {', '.join(FIELDS)}) "
+            f"VALUES (?, ?, ?, ?, {', '.join('?' for _ in range(WIDTH))})",
+            (domain, entry["size"], entry["count"], entry["block"], *values),
+        )
+
+    def _recover(self, domain: str) -> dict:
+        """Index entry of domain, after catching up with bytes written since the last commit."""
+        entry = self._entry(domain)
+        path = self._path(domain)
+        actual = os.path.getsize(path) if os.path.exists(path) else 0
+        if actual > entry["size"]:
+            base = start = entry["size"]
+            tail = self._read(domain, base)
+            for end, values in zip(sample_ends(tail), decode_samples(tail, entry["last"])):
+                self._index(domain, entry, values, start, base + end)
+                start = base + end
+            if actual > entry["size"]:
+                logging.warning("History %s: %s trailing bytes dropped", domain, actual - entry["size"])
+                with open(path, "r+b") as f:
+                    f.truncate(entry["size"])
+        return entry
+
+    def append(self, domain: str, company: CompanyRecord, at: Optional[datetime] = None) -> bool:
+        """Add one sample; ignored (False) if it is not later than the company's last one."""
+        entry = self._recover(domain)
+        values = [
+            _minute(at),
+            _stored(company.rating, 10),
+            _stored(company.review_count),
+            *(_stored(getattr(company, f"pct_{stars}")) for stars in STARS),
+        ]
+        if entry["count"] and values[0] <= entry["last"][0]:
+            return False
+        data = encode_sample(entry["last"], values)
+        with open(self._path(domain), "ab") as f:
+            f.write(data)
+        self._index(domain, entry, values, entry["size"], entry["size"] + len(data))
+        return True
+
+    def ingest(self, companies: Dict[str, CompanyRecord], at: Optional[datetime] = None) -> int:
+        """Add one run's records (canonical domain -> record) in a single index transaction."""
+        with self.conn:
+            added = sum(self.append(domain, company, at) for domain, company in companies.items())
+        logging.info("History: %s samples added to %s", added, self.root)
+        return added
+
+    def ingest_csv(self, path: str, at: Optional[datetime] = None, known: Optional[Dict[str, str]] = None) -> int:
+        """Add a scraper CSV as one run, dated by the file's modification time by default.
+
+        Rows go to the same series as crawled companies (domains.record_key());
+        known is CompanyStore.key_index(), to map websites and names to those keys.
+        """
+        at = at or datetime.fromtimestamp(os.path.getmtime(path))
+        companies = {}
+        with open(path, newline="", encoding="utf-8-sig") as f:
+            for row in csv.DictReader(f):
+                key = record_key(row, known)
+                if key:
+                    companies[key] = CompanyRecord.from_row(row)
+        return self.ingest(companies, at)
+
+    def _checkpoint(self, domain: str, minute: int) -> Optional[tuple]:
+        """(minute, start, next, values...) of the last checkpoint at or before minute, else the first one."""
+        select = f"SELECT minute, start, next, {', '.join(FIELDS)} FROM checkpoints WHERE domain = ?"
+        row = self.conn.execute(f"{select} AND minute <= ? ORDER BY minute DESC LIMIT 1", (domain, minute)).fetchone()
+        return row or self.conn.execute(f"{select} ORDER BY minute LIMIT 1", (domain,)).fetchone()
+
+    def _block(self, domain: str, checkpoint: tuple, to_end: bool = False) -> Iterator[List[int]]:
+        """Samples from checkpoint to the next one (or to the end of the file)."""
+        first = [checkpoint[0], *checkpoint[3:]]
+        yield first
+        end = None
+        if not to_end:
+            row = self.conn.execute(
+                "SELECT start FROM checkpoints WHERE domain = ? AND minute > ? ORDER BY minute LIMIT 1",
+                (domain, checkpoint[0]),
+            ).fetchone()
+            end = row[0] if row else None
+        yield from decode_samples(self._read(domain, checkpoint[2], end), first)
+
+    def series(self, domain: str, start: Optional[datetime] = None, end: Optional[datetime] = None) -> List[Sample]:
+        """Samples of domain between start and end (inclusive)."""
+        first, last = _minute(start) if start else 0, _minute(end) if end else None
+        checkpoint = self._checkpoint(domain, first)
+        if checkpoint is None:
+            return []
+        samples = []
+        for values in self._block(domain, checkpoint, to_end=True):
+            if last is not None and values[0] > last:
+                break
+            if values[0] >= first:
+                samples.append(_sample(values))
+        return samples
+
+    def at(self, domain: str, when: datetime) -> Optional[Sample]:
+        """The last sample of domain at or before when."""
+        values = self._values_at(domain, _minute(when))
+        return _sample(values) if values else None
+
+    def _values_at(self, domain: str, minute: int, checkpoint: Optional[tuple] = None) -> Optional[List[int]]:
+        checkpoint = checkpoint or self._checkpoint(domain, minute)
+        if checkpoint is None or checkpoint[0] > minute:
+            return None
+        found = None
+        for values in self._block(domain, checkpoint):
+            if values[0] > minute:
+                break
+            found = values
+        return found
+
+    def trend(
+        self,
+        field: str = "rating",
+        days: float = 30,
+        min_change: Optional[float] = None,
+        max_change: Optional[float] = None,
+        now: Optional[datetime] = None,
+        limit: Optional[int] = None,
+    ) -> List[dict]:
+        """Change of field over the last days for every company, e.g. max_change=-0.3 for drops of 0.3 or more.
+
+        The baseline is the last sample at or before now - days, or the first
+        sample if the series starts later. Sorted by change, largest drop first.
+        """
+        if field not in FIELDS:
+            raise ValueError(f"field must be one of {FIELDS}")
+        scale = 10 if field == "rating" else 1
+        column = FIELDS.index(field) + 1
+        # Bornes en unités stockées (note×10) ; marge pour les arrondis de -0.3 * 10
+        low = -float("inf") if min_change is None else min_change * scale - 1e-6
+        high = float("inf") if max_change is None else max_change * scale + 1e-6
+        now_minute = _minute(now)
+        since = _minute((now or datetime.now()) - timedelta(days=days))
+        # Par entreprise, en une requête : dernière valeur et bloc contenant la référence
+        rows = self.conn.execute(
+            f"""
+            SELECT s.domain, s.minute, s.{field}, c.minute, c.start, c.next, {', '.join(f'c.{f}' for f in FIELDS)},
+                   c.{field}_lo, c.{field}_hi
+            FROM series s JOIN checkpoints c ON c.domain = s.domain AND c.minute = COALESCE(
+                (SELECT MAX(minute) FROM checkpoints WHERE domain = s.domain AND minute <= ?),
+                (SELECT MIN(minute) FROM checkpoints WHERE domain = s.domain))
+            """,
+            (since,),
+        ).fetchall()
+        results = []
+        for domain, head_minute, head, *checkpoint, lo, hi in rows:
+            if head_minute > now_minute:
+                head = (self._values_at(domain, now_minute) or [0] * WIDTH)[column]
+            if not head:
+                continue
+            if lo == hi:
+                base = lo  # Valeur constante sur tout le bloc : rien à décoder
+            elif lo and (head - lo < low or head - hi > high):
+                continue  # Aucune valeur du bloc ne peut satisfaire le filtre
+            else:
+                values = self._values_at(domain, max(since, checkpoint[0]), tuple(checkpoint))
+                base = values[column] if values else 0
+            if not base or not low <= head - base <= high:
+                continue
+            results.append(
+                {
+                    "domain": domain,
+                    "from": (base - 1) / scale,
+                    "to": (head - 1) / scale,
+                    "change": round((head - base) / scale, 3),
+                }
+            )
+        results.sort(key=lambda r: r["change"])
+        return results[:limit] if limit else results
+
+    def close(self):
+        self.conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rating history of the Trustpilot companies.")
+    parser.add_argument("--root", default=HISTORY_PATH)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    ingest = commands.add_parser("ingest", help="add scraper CSV files, one run each")
+    ingest.add_argument("csv_files", nargs="+")
+    ingest.add_argument("--at", help="ISO date of the run (default: file modification time)")
+
+    series = commands.add_parser("series", help="samples of one company")
+    series.add_argument("domain")
+    series.add_argument("--since", help="ISO date")
+    series.add_argument("--until", help="ISO date")
+
+    trend = commands.add_parser("trend", help="companies whose value moved over a window")
+    trend.add_argument("--field", choices=FIELDS, default="rating")
+    trend.add_argument("--days", type=float, default=30)
+    trend.add_argument("--min-change", type=float)
+    trend.add_argument("--max-change", type=float, help="e.g. -0.3: dropped by 0.3 or more")
+    trend.add_argument("--top", dest="limit", type=int, default=20)
+
+    args = parser.parse_args()
+    configure_logging()
+    store = HistoryStore(args.root)
+    try:
+        if args.command == "ingest":
+            at = datetime.fromisoformat(args.at) if args.at else None
+            known = None
+            if os.path.exists(DB_PATH):
+                companies = CompanyStore(DB_PATH)
+                known = companies.key_index()
+                companies.close()
+            for path in args.csv_files:
+                store.ingest_csv(path, at, known)
+        elif args.command == "series":
+            for sample in store.series(
+                canonical_domain(args.domain),
+                datetime.fromisoformat(args.since) if args.since else None,
+                datetime.fromisoformat(args.until) if args.until else None,
+            ):
+                print(f"{sample.at:%Y-%m-%d %H:%M}  {sample.rating or '-':>4}  {sample.review_count or 0:>7}")
+        else:
+            start = time.perf_counter()
+            rows = store.trend(args.field, args.days, args.min_change, args.max_change, limit=args.limit)
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            for row in rows:
+                print(f"{row['change']:+7}  {row['from']:>7} -> {row['to']:<7} {row['domain']}")
+            print(f"{len(rows)} companies in {elapsed_ms:.1f} ms")
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
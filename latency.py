@@ -0,0 +1,176 @@
+import asyncio
+import contextlib
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Awaitable, Callable, Deque, Dict, Optional, TypeVar
+from urllib.parse import urlparse
+
+from resilience import classify
+
+T = TypeVar("T")
+
+
+def endpoint_class(url: str) -> str:
+    """'https://fr.trustpilot.com/review/vinted.fr' -> 'review'; one latency profile per page type."""
+    segments = urlparse(url).path.strip("/").split("/")
+    return segments[0] or "root"
+
+
+class LatencyTracker:
+    """Rolling latency windows per endpoint class, and the timeouts derived from them.
+
+    Until an endpoint has min_samples measurements its timeout is the fixed
+    default the caller passes; after that it is factor x p99, kept between
+    floor and max_stretch x default. Timeouts are recorded at the elapsed
+    time, so a slowing site pushes p99, and the timeout, back up; other
+    failures are not recorded. A key (URL) that timed out gets max_stretch x
+    default on its retries, until it succeeds: a page that is always slow must
+    not time out forever.
+    """
+
+    def __init__(
+        self,
+        window: int = 500,
+        min_samples: int = 30,
+        factor: float = 2.0,
+        floor: float = 0.5,
+        max_stretch: float = 2.0,
+    ):
+        self.window = window
+        self.min_samples = min_samples
+        self.factor = factor
+        self.floor = floor
+        self.max_stretch = max_stretch
+        self._samples: Dict[str, Deque[float]] = {}
+        self._slow_keys: "OrderedDict[str, None]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def record(self, endpoint: str, seconds: float):
+        with self._lock:
+            samples = self._samples.get(endpoint)
+            if samples is None:
+                samples = self._samples[endpoint] = deque(maxlen=self.window)
+            samples.append(seconds)
+
+    def mark_slow(self, key: str):
+        with self._lock:
+            self._slow_keys[key] = None
+            self._slow_keys.move_to_end(key)
+            if len(self._slow_keys) > 10_000:
+                self._slow_keys.popitem(last=False)
+
+    def clear_slow(self, key: str):
+        with self._lock:
+            self._slow_keys.pop(key, None)
+
+    @contextlib.contextmanager
+    def measure(self, endpoint: str, key: Optional[str] = None):
+        """Record the duration of the block if it succeeds or times out.
+
+        A timeout also marks key slow, a success clears it. Other failures
+        (fast 404s, parse or session errors) say nothing about the endpoint's
+        latency and would drag its percentiles down: they are not recorded.
+        """
+        started = time.monotonic()
+        try:
+            yield
+        except Exception as e:
+            if classify(e) == "timeout":
+                self.record(endpoint, time.monotonic() - started)
+                if key is not None:
+                    self.mark_slow(key)
+            raise
+        self.record(endpoint, time.monotonic() - started)
+        if key is not None:
+            self.clear_slow(key)
+
+    def percentile(self, endpoint: str, q: float) -> Optional[float]:
+        """q in [0, 1]; None while the window holds fewer than min_samples."""
+        with self._lock:
+            samples = self._samples.get(endpoint)
+            if samples is None or len(samples) < self.min_samples:
+                return None
+            ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def timeout(self, endpoint: str, default: float, key: Optional[str] = None) -> float:
+        if key is not None and key in self._slow_keys:
+            return default * self.max_stretch
+        p99 = self.percentile(endpoint, 0.99)
+        if p99 is None:
+            return default
+        return min(max(p99 * self.factor, self.floor), default * self.max_stretch)
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            endpoints = list(self._samples)
+        report = {}
+        for endpoint in endpoints:
+            p50, p95, p99 = (self.percentile(endpoint, q) for q in (0.5, 0.95, 0.99))
+            if p50 is not None:
+                report[endpoint] = {"p50": round(p50, 3), "p95": round(p95, 3), "p99": round(p99, 3)}
+        return report
+
+
+class Hedger:
+    """Hedged requests: a second attempt when the first outlives the endpoint's p95.
+
+    Whichever attempt succeeds first wins and the other is cancelled. Hedges
+    draw on a token bucket refilled by ratio per request (at most burst
+    saved up), so they add at most ratio extra load on the site. ratio=0
+    disables hedging.
+    """
+
+    def __init__(self, tracker: LatencyTracker, ratio: float = 0.05, burst: float = 10.0):
+        self.tracker = tracker
+        self.ratio = ratio
+        self.burst = burst
+        self.tokens = burst if ratio > 0 else 0.0
+        self.requests = 0
+        self.hedges = 0
+        self.wins = 0
+
+    async def run(
+        self,
+        endpoint: str,
+        attempt: Callable[[], Awaitable[T]],
+        backup_attempt: Optional[Callable[[], Awaitable[T]]] = None,
+    ) -> T:
+        """Await attempt(), hedged with backup_attempt() (default: attempt again) if it is slow."""
+        self.requests += 1
+        self.tokens = min(self.burst, self.tokens + self.ratio)
+        delay = self.tracker.percentile(endpoint, 0.95) if self.ratio > 0 else None
+        if delay is None:
+            return await attempt()
+        primary = asyncio.ensure_future(attempt())
+        backup = None
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+            if done or self.tokens < 1:
+                return await primary
+            self.tokens -= 1
+            self.hedges += 1
+            backup = asyncio.ensure_future((backup_attempt or attempt)())
+            pending = {primary, backup}
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is backup:
+                            self.wins += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in (primary, backup):
+                if task is not None and not task.done():
+                    task.cancel()
+
+    def stats(self) -> Dict[str, int]:
+        return {"requests": self.requests, "hedges": self.hedges, "hedge_wins": self.wins}
+
+
+# Partagé par tous les scrapers du processus, comme tracer
+latency = LatencyTracker()
@@ -0,0 +1,143 @@
+import asyncio
+import logging
+import re
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional
+
+import aiohttp
+from aiohttp import ClientTimeout
+
+from domains import canonical_domain
+from next_data import full_next_data
+from rate_limiter import RateLimiter
+from resilience import FetchError, Resilience, retry_after_seconds
+
+BASE_URL = "https://www.trustpilot.com/categories/clothing_store?country=FR"
+PROFILE_URL = "https://www.trustpilot.com/review/{}"
+REVIEW_HREF_RE = re.compile(r'href="/review/([^"?#/]+)')
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36",
+    "Accept-Language": "fr-FR,fr;q=0.9,en;q=0.8",
+}
+
+
+@dataclass
+class ListingRecord:
+    """One company card of a category page, in display order."""
+
+    page: int
+    position: int
+    url: str
+    domain: str
+    name: Optional[str] = None
+    rating: Optional[float] = None
+    review_count: Optional[int] = None
+    country: Optional[str] = None
+    city: Optional[str] = None
+    website: Optional[str] = None
+
+
+def _business_units(next_data: dict) -> List[dict]:
+    """Return the company cards embedded in a category page's __NEXT_DATA__."""
+    page_props = next_data.get("props", {}).get("pageProps", {})
+    units = page_props.get("businessUnits", [])
+    if isinstance(units, dict):
+        units = units.get("businesses", [])
+    return units if isinstance(units, list) else []
+
+
+def parse_listing_page(html: str, page: int) -> List[ListingRecord]:
+    """Parse a category page without a DOM: __NEXT_DATA__ first, review links as fallback."""
+    records = []
+    for unit in _business_units(full_next_data(html)):
+        identifying_name = unit.get("identifyingName")
+        if not identifying_name:
+            continue
+        location = unit.get("location") or {}
+        contact = unit.get("contact") or {}
+        records.append(
+            ListingRecord(
+                page=page,
+                position=len(records),
+                url=PROFILE_URL.format(identifying_name),
+                domain=canonical_domain(identifying_name),
+                name=unit.get("displayName"),
+                rating=unit.get("trustScore"),
+                review_count=unit.get("numberOfReviews"),
+                country=location.get("country"),
+                city=location.get("city"),
+                website=contact.get("website"),
+            )
+        )
+    if not records:
+        for identifying_name in dict.fromkeys(REVIEW_HREF_RE.findall(html)):
+            records.append(
+                ListingRecord(
+                    page,
+                    len(records),
+                    PROFILE_URL.format(identifying_name),
+                    canonical_domain(identifying_name),
+                )
+            )
+    return records
+
+
+async def _fetch_page_once(
+    session: aiohttp.ClientSession,
+    limiter: RateLimiter,
+    page_url: str,
+    page: int,
+) -> List[ListingRecord]:
+    await limiter.acquire_async()
+    async with session.get(page_url, headers=HEADERS) as response:
+        if response.status >= 400:
+            raise FetchError(page_url, response.status, retry_after_seconds(response.headers.get("Retry-After")))
+        records = parse_listing_page(await response.text(), page)
+    logging.info("Listing page %s: %s companies", page, len(records))
+    return records
+
+
+async def _fetch_page(
+    session: aiohttp.ClientSession,
+    resilience: Resilience,
+    base_url: str,
+    page: int,
+) -> List[ListingRecord]:
+    page_url = f"{base_url}&page={page}"
+    records = await resilience.call_async(
+        page_url, _fetch_page_once, session, resilience.limiter, page_url, page
+    )
+    return records or []
+
+
+async def fetch_listings(
+    base_url: str = BASE_URL,
+    pages: Iterable[int] = range(1, 106),
+    concurrency: int = 10,
+    requests_per_second: Optional[float] = 10.0,
+) -> List[ListingRecord]:
+    """Fetch every listing page concurrently over plain HTTP.
+
+    Results keep the site's ordering (page, then position on the page) and are
+    de-duplicated by domain, first occurrence wins.
+    """
+    limiter = RateLimiter(rate=requests_per_second, burst=concurrency)
+    resilience = Resilience("listing", limiter=limiter)
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(
+        connector=connector, timeout=ClientTimeout(total=30)
+    ) as session:
+        pages_records = await asyncio.gather(
+            *(_fetch_page(session, resilience, base_url, page) for page in pages)
+        )
+    seen: Dict[str, ListingRecord] = {}
+    for records in pages_records:
+        for record in records:
+            seen.setdefault(record.domain, record)
+    logging.info("%s companies found on the listing pages", len(seen))
+    return list(seen.values())
+
+
+def get_listings(base_url: str = BASE_URL, pages: Iterable[int] = range(1, 106), **kwargs) -> List[ListingRecord]:
+    """Blocking wrapper for the Selenium scrapers."""
+    return asyncio.run(fetch_listings(base_url, pages, **kwargs))
@@ -0,0 +1,104 @@
+import json
+from typing import Any, Iterable, List, Optional, Union
+
+try:
+    import orjson
+except ImportError:  # Repli sur la bibliothèque standard
+    orjson = None
+
+Text = Union[str, bytes]
+
+_decoder = json.JSONDecoder()
+
+
+def loads(data: Text) -> Any:
+    """Decode JSON with orjson when it is installed, stdlib json otherwise."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _markers(raw: Text):
+    if isinstance(raw, bytes):
+        return b'id="__NEXT_DATA__"', b">", b"</script>"
+    return 'id="__NEXT_DATA__"', ">", "</script>"
+
+
+def slice_next_data(raw: Text) -> Optional[Text]:
+    """Return the __NEXT_DATA__ script payload using plain find(), no DOM and no regex."""
+    script_id, tag_end, script_end = _markers(raw)
+    start = raw.find(script_id)
+    if start < 0:
+        return None
+    start = raw.find(tag_end, start) + 1
+    end = raw.find(script_end, start)
+    if start <= 0 or end < 0:
+        return None
+    return raw[start:end]
+
+
+def full_next_data(raw: Text) -> dict:
+    """Decode the whole __NEXT_DATA__ payload."""
+    payload = slice_next_data(raw)
+    if payload is None:
+        return {}
+    try:
+        return loads(payload)
+    except ValueError:
+        return {}
+
+
+def partial_next_data(raw: Text, page_props_keys: Iterable[str]) -> Optional[dict]:
+    """Decode only the requested pageProps entries of __NEXT_DATA__.
+
+    Each key is located at its first occurrence after "pageProps" and its value
+    is decoded by the stdlib scanner, which stops at the end of that value; the
+    hundreds of KB of reviews around it are never turned into objects. Returns
+    a dict shaped like the full document ({"props": {"pageProps": {...}}}), or
+    None if a key cannot be found so the caller can fall back to a full decode.
+    """
+    payload = slice_next_data(raw)
+    if payload is None:
+        return None
+    if isinstance(payload, bytes):
+        payload = payload.decode("utf-8")
+    page_props_start = payload.find('"pageProps":')
+    if page_props_start < 0:
+        return None
+    page_props = {}
+    for key in page_props_keys:
+        marker = f'"{key}":'
+        position = payload.find(marker, page_props_start)
+        if position < 0:
+            return None
+        try:
+            page_props[key], _ = _decoder.raw_decode(payload, position + len(marker))
+        except ValueError:
+            return None
+    return {"props": {"pageProps": page_props}}
+
+
+def page_props_slices(raw: Text, page_props_keys: Iterable[str]) -> Optional[List[str]]:
+    """Raw JSON text of the requested pageProps entries of __NEXT_DATA__, located like
+    partial_next_data(); a missing key gives "". None if the page has no __NEXT_DATA__."""
+    payload = slice_next_data(raw)
+    if payload is None:
+        return None
+    if isinstance(payload, bytes):
+        payload = payload.decode("utf-8")
+    page_props_start = payload.find('"pageProps":')
+    slices = []
+    for key in page_props_keys:
+        marker = f'"{key}":'
+        position = payload.find(marker, page_props_start) if page_props_start >= 0 else -1
+        if position < 0:
+            slices.append("")
+            continue
+        start = position + len(marker)
+        try:
+            _, end = _decoder.raw_decode(payload, start)
+        except ValueError:
+            slices.append("")
+            continue
+        slices.append(payload[start:end])
+    return slices
@@ -0,0 +1,118 @@
+import argparse
+import logging
+import os
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from change_capture import STAR_COLUMNS
+from log_setup import configure_logging
+
+STAR_WEIGHTS = np.array([5, 4, 3, 2, 1], dtype=np.float64)
+
+
+def parse_count(series: pd.Series) -> pd.Series:
+    """'13,236' / '471 total' / 471 -> 13236 / 471 (nullable integer)."""
+    digits = series.astype("string").str.replace(r"[^\d]", "", regex=True)
+    return pd.to_numeric(digits.replace("", pd.NA), errors="coerce").astype("Int64")
+
+
+def parse_percent(series: pd.Series) -> pd.Series:
+    """'87%' / '<1%' / '1%' -> 87.0 / 1.0 / 1.0."""
+    number = series.astype("string").str.extract(r"(\d+(?:\.\d+)?)", expand=False)
+    return pd.to_numeric(number, errors="coerce").astype("Float64")
+
+
+def parse_rating(series: pd.Series) -> pd.Series:
+    """'4,8' / '4.8' -> 4.8."""
+    text = series.astype("string").str.replace(",", ".", regex=False)
+    number = text.str.extract(r"(\d+(?:\.\d+)?)", expand=False)
+    return pd.to_numeric(number, errors="coerce").astype("Float64")
+
+
+def company_key(df: pd.DataFrame) -> pd.Series:
+    """Domain of the website when known, lower-cased company name otherwise."""
+    domain = (
+        df["Site"]
+        .astype("string")
+        .str.lower()
+        .str.extract(r"^(?:[a-z]+://)?(?:www\.)?([^/:?#]+)", expand=False)
+    )
+    name = df["Nom de l'entreprise"].astype("string").str.strip().str.lower()
+    return domain.fillna(name)
+
+
+def normalize(
+    df: pd.DataFrame, sum_tolerance: float = 3.0, prior_reviews: int = 50
+) -> pd.DataFrame:
+    """Type, validate, de-duplicate and enrich a batch of scraped records.
+
+    Every step is a column-wide pandas/NumPy operation, no per-row Python.
+    """
+    df = df.copy()
+    df["Note"] = parse_rating(df["Note"])
+    df["Nombre de reviews"] = parse_count(df["Nombre de reviews"])
+    for column in STAR_COLUMNS:
+        df[column] = parse_percent(df[column])
+    df["En France"] = df["En France"].astype("string").str.strip().eq("Oui")
+
+    # Les pourcentages étant arrondis, la somme n'est jamais exactement 100
+    stars = df[STAR_COLUMNS].to_numpy(dtype=np.float64, na_value=np.nan)
+    star_sum = stars.sum(axis=1)
+    df["Somme étoiles"] = star_sum
+    df["Distribution valide"] = np.abs(star_sum - 100.0) <= sum_tolerance
+
+    # Note moyenne reconstruite depuis la distribution
+    with np.errstate(invalid="ignore", divide="ignore"):
+        df["Note distribution"] = np.round((stars @ STAR_WEIGHTS) / star_sum, 2)
+
+    # Les reprises de crawl ré-écrivent des lignes : on garde la plus récente
+    df["Clé"] = company_key(df)
+    df = df.drop_duplicates(subset="Clé", keep="last").reset_index(drop=True)
+
+    # Score bayésien : les petites entreprises tirent vers la moyenne globale
+    reviews = df["Nombre de reviews"].to_numpy(dtype=np.float64, na_value=0.0)
+    rating = df["Note"].to_numpy(dtype=np.float64, na_value=np.nan)
+    global_mean = np.nanmean(rating) if np.isfinite(rating).any() else 0.0
+    df["Score pondéré"] = np.round(
+        (reviews * np.nan_to_num(rating, nan=global_mean) + prior_reviews * global_mean)
+        / (reviews + prior_reviews),
+        3,
+    )
+    return df
+
+
+def normalized_path(csv_path: str) -> str:
+    """'entreprises.csv' -> 'entreprises_normalized.csv', next to the raw file."""
+    root, ext = os.path.splitext(csv_path)
+    return f"{root}_normalized{ext or '.csv'}"
+
+
+def normalize_csv(input_csv: str, output_csv: Optional[str] = None) -> pd.DataFrame:
+    """Pipeline stage: the raw CSV of a run -> one typed row per company (default: normalized_path())."""
+    output_csv = output_csv or normalized_path(input_csv)
+    raw = pd.read_csv(input_csv, encoding="utf-8-sig", dtype="string")
+    df = normalize(raw)
+    logging.info(
+        "%s rows -> %s companies, %s with an invalid star distribution",
+        len(raw),
+        len(df),
+        int((~df["Distribution valide"]).sum()),
+    )
+    df.to_csv(output_csv, index=False, encoding="utf-8-sig")
+    logging.info("Normalized CSV written to %s", output_csv)
+    return df
+
+
+def main():
+    configure_logging()
+    parser = argparse.ArgumentParser(description="Normalize scraped Trustpilot records")
+    parser.add_argument("input_csv", nargs="?", default="entreprises_vetements_trustpilot_sequential.csv")
+    parser.add_argument("output_csv", nargs="?", default="entreprises_vetements_trustpilot_normalized.csv")
+    args = parser.parse_args()
+    normalize_csv(args.input_csv, args.output_csv)
+
+
+if __name__ == "__main__":
+    main()
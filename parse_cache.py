@@ -0,0 +1,170 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional
+
+from next_data import page_props_slices, slice_next_data
+
+CACHE_PATH = os.environ.get("TRUSTPILOT_PARSE_CACHE", "trustpilot_parse_cache.db")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS parses (
+    kind TEXT NOT NULL,
+    key TEXT NOT NULL,
+    version TEXT NOT NULL,
+    value TEXT NOT NULL,
+    stored_at REAL NOT NULL,
+    PRIMARY KEY (kind, key)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS parses_stored_at ON parses (stored_at);
+"""
+
+
+def content_key(html: str, next_data_keys: Optional[Iterable[str]] = None) -> Optional[str]:
+    """Digest of the page data the extraction reads, or None if it has none (blocked or broken page).
+
+    That is the JSON-LD scripts (name, address, aggregate rating) plus the
+    pageProps entries of __NEXT_DATA__ the spec reads, e.g. businessUnit and
+    filters (category, star distribution), which the JSON-LD does not carry.
+    Without next_data_keys the whole __NEXT_DATA__ payload is hashed. The rest
+    of the page (build ids, nonces, rendered widgets) changes on every fetch.
+    Located with plain find() like slice_next_data(); only the pageProps
+    entries are scanned to find where they end.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    found = False
+    position = html.find('type="application/ld+json"')
+    while position >= 0:
+        start = html.find(">", position) + 1
+        end = html.find("</script>", start)
+        if start <= 0 or end < 0:
+            break
+        digest.update(html[start:end].encode("utf-8"))
+        digest.update(b"\0")
+        found = True
+        position = html.find('type="application/ld+json"', end)
+    if next_data_keys is not None:
+        slices = page_props_slices(html, next_data_keys)
+    else:
+        payload = slice_next_data(html)
+        slices = None if payload is None else [payload]
+    for part in slices or ():
+        digest.update(b"\1")
+        digest.update(part.encode("utf-8"))
+        found = found or bool(part)
+    return digest.hexdigest() if found else None
+
+
+class ParseCache:
+    """Extraction results keyed by content_key(): an in-memory LRU over a SQLite table.
+
+    Every entry records the spec fingerprint it was extracted with; a lookup
+    under another fingerprint is a miss, and the first write under a new one
+    purges the stale rows. kind separates what is cached ("values" for the
+    engine, "record" for the Selenium scrapers). Values must be JSON-serialisable.
+    path="" keeps the memory tier only.
+    """
+
+    def __init__(self, path: str = CACHE_PATH, capacity: int = 4096, max_rows: int = 200_000):
+        self.path = path
+        self.capacity = capacity
+        self.max_rows = max_rows
+        self.hits = 0
+        self.misses = 0
+        self._lru: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._versions = set()  # Empreintes déjà purgées dans ce processus
+        self._writes = 0
+        self._lock = threading.Lock()
+
+    def _db(self) -> Optional[sqlite3.Connection]:
+        # Ouverture paresseuse : importer le module ne crée aucun fichier
+        if self._conn is None and self.path:
+            try:
+                conn = sqlite3.connect(self.path, check_same_thread=False)
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("PRAGMA synchronous=NORMAL")
+                conn.executescript(SCHEMA)
+                self._conn = conn
+            except sqlite3.Error as e:
+                logging.warning("Parse cache %s unavailable, memory only: %s", self.path, e)
+                self.path = ""
+        return self._conn
+
+    def get(self, kind: str, key: str, version: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._lru.get((kind, key))
+            if entry is not None and entry[0] == version:
+                self._lru.move_to_end((kind, key))
+                self.hits += 1
+                return json.loads(entry[1])
+            conn = self._db()
+            row = None
+            if conn is not None:
+                row = conn.execute(
+                    "SELECT value FROM parses WHERE kind = ? AND key = ? AND version = ?", (kind, key, version)
+                ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._remember(kind, key, version, row[0])
+            self.hits += 1
+            return json.loads(row[0])
+
+    def put(self, kind: str, key: str, version: str, value: Any):
+        encoded = json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+        with self._lock:
+            self._remember(kind, key, version, encoded)
+            conn = self._db()
+            if conn is None:
+                return
+            try:
+                with conn:
+                    if version not in self._versions:
+                        self._versions.add(version)
+                        purged = conn.execute("DELETE FROM parses WHERE version != ?", (version,)).rowcount
+                        if purged:
+                            logging.info("Parse cache: %s entries of an older extraction spec dropped", purged)
+                    conn.execute(
+                        "INSERT OR REPLACE INTO parses VALUES (?, ?, ?, ?, ?)",
+                        (kind, key, version, encoded, time.time()),
+                    )
+                    self._writes += 1
+                    if self._writes % 1000 == 0:
+                        self._trim(conn)
+            except sqlite3.Error as e:
+                logging.warning("Parse cache write failed: %s", e)
+
+    def _remember(self, kind: str, key: str, version: str, encoded: str):
+        # Le JSON est gardé tel quel : chaque lecture rend une copie que l'appelant peut modifier
+        self._lru[(kind, key)] = (version, encoded)
+        self._lru.move_to_end((kind, key))
+        while len(self._lru) > self.capacity:
+            self._lru.popitem(last=False)
+
+    def _trim(self, conn: sqlite3.Connection):
+        conn.execute(
+            "DELETE FROM parses WHERE stored_at < ("
+            "SELECT stored_at FROM parses ORDER BY stored_at DESC LIMIT 1 OFFSET ?)",
+            (self.max_rows,),
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "memory_entries": len(self._lru),
+        }
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
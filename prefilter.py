@@ -0,0 +1,86 @@
+import logging
+import os
+import sqlite3
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Iterable, List, Optional, Set
+
+from domains import canonical_domain
+from listing_extractor import ListingRecord
+from store import DB_PATH
+
+
+@dataclass
+class ListingFilter:
+    """Cheap predicates evaluated on listing cards, before any profile is opened.
+
+    A card missing a field passes that predicate: only the profile can tell,
+    and the scrapers still check it there.
+    """
+
+    country: Optional[str] = "FR"
+    min_reviews: Optional[int] = None
+    min_rating: Optional[float] = None
+    # Domaines déjà connus comme hors France, ou crawlés depuis moins de fresh_days jours
+    known_domains: Set[str] = field(default_factory=set)
+
+    @classmethod
+    def from_store(
+        cls,
+        store_path: str = DB_PATH,
+        fresh_days: Optional[float] = None,
+        **kwargs,
+    ) -> "ListingFilter":
+        return cls(known_domains=load_known_domains(store_path, fresh_days), **kwargs)
+
+    def reject_reason(self, record: ListingRecord) -> Optional[str]:
+        """Why record can be skipped, or None if its profile must be scraped."""
+        if record.domain in self.known_domains:
+            return "known"
+        if self.country and record.country and record.country != self.country:
+            return "country"
+        if self.min_reviews is not None and record.review_count is not None and record.review_count < self.min_reviews:
+            return "reviews"
+        if self.min_rating is not None and record.rating is not None and record.rating < self.min_rating:
+            return "rating"
+        return None
+
+    def filter(self, records: Iterable[ListingRecord]) -> List[ListingRecord]:
+        kept, rejected = [], Counter()
+        for record in records:
+            reason = self.reject_reason(record)
+            if reason is None:
+                kept.append(record)
+            else:
+                rejected[reason] += 1
+        logging.info(
+            "Listing filter: %s profiles to scrape, %s skipped %s",
+            len(kept),
+            sum(rejected.values()),
+            dict(rejected),
+        )
+        return kept
+
+    def filter_urls(self, urls: Iterable[str]) -> List[str]:
+        """For profile URLs without card data (Chrome fallback): only the known-domain predicate applies."""
+        return [url for url in urls if canonical_domain(url) not in self.known_domains]
+
+
+def load_known_domains(store_path: str = DB_PATH, fresh_days: Optional[float] = None) -> Set[str]:
+    """Domains the store already knows to be outside France, plus those crawled in the last fresh_days."""
+    if not os.path.exists(store_path):
+        return set()
+    sql = "SELECT domain FROM companies WHERE in_france = 0"
+    params = []
+    if fresh_days is not None:
+        sql += " OR crawled_at >= ?"
+        params.append((datetime.now() - timedelta(days=fresh_days)).isoformat(timespec="seconds"))
+    conn = sqlite3.connect(store_path)
+    try:
+        return {domain for (domain,) in conn.execute(sql, params)}
+    except sqlite3.OperationalError:
+        # Base créée par une autre version, sans table companies
+        return set()
+    finally:
+        conn.close()
@@ -0,0 +1,55 @@
+import asyncio
+import threading
+import time
+from typing import Optional
+
+
+class RateLimiter:
+    """Central request pacer shared by every worker of a process.
+
+    A GCRA token bucket: callers only wait when the budget is exhausted or when
+    the server asked us to back off, so idle time is zero while the site keeps up.
+    """
+
+    def __init__(self, rate: Optional[float] = None, burst: int = 1):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tat = 0.0  # Theoretical arrival time of the next request
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def _reserve(self, commit: bool = True) -> float:
+        """Reserve a slot and return how long the caller must wait for it."""
+        with self._lock:
+            now = time.monotonic()
+            if not self.rate:
+                return max(0.0, self._blocked_until - now)
+            interval = 1.0 / self.rate
+            tat = max(self._tat, now, self._blocked_until)
+            start = max(tat - (self.burst - 1) * interval, self._blocked_until)
+            if commit:
+                self._tat = tat + interval
+            return max(0.0, start - now)
+
+    def peek(self) -> float:
+        """How long acquire() would wait right now, without reserving a slot."""
+        return self._reserve(commit=False)
+
+    def acquire(self) -> float:
+        """Block the calling thread until a request may be sent."""
+        delay = self._reserve()
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+    async def acquire_async(self) -> float:
+        """Asyncio flavour of acquire()."""
+        delay = self._reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return delay
+
+    def backoff(self, seconds: float):
+        """Pause every caller, e.g. after a 429 or a Retry-After header."""
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
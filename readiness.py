@@ -0,0 +1,67 @@
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.webdriver.support.ui import WebDriverWait
+
+from latency import endpoint_class, latency
+
+# Signaux de disponibilité d'une page Trustpilot
+NEXT_DATA = (By.CSS_SELECTOR, "script#__NEXT_DATA__")
+RATING = (By.CSS_SELECTOR, "p[data-rating-typography]")
+TITLE = (By.CSS_SELECTOR, "h1")
+COMPANY_LINK = (By.CSS_SELECTOR, "a[href*='/review/']")
+
+# Délai de chargement tant que la fenêtre de latence est vide (Selenium attend 300 s par défaut)
+PAGE_LOAD_TIMEOUT = 30.0
+
+
+def setup_readiness_options(options):
+    """Return as soon as the DOM is parsed; readiness is then decided by the waits below."""
+    options.page_load_strategy = "eager"
+    return options
+
+
+def navigate(driver, url: str, timeout: float = PAGE_LOAD_TIMEOUT):
+    """driver.get(url) under a page-load timeout derived like the waits below.
+
+    With the eager strategy the slow tail of a page is in driver.get(), not
+    in the element waits that follow it, so this is where it is measured and cut.
+    """
+    endpoint = f"selenium:get:{endpoint_class(url)}"
+    with latency.measure(endpoint, key=url):
+        driver.set_page_load_timeout(latency.timeout(endpoint, timeout, key=url))
+        driver.get(url)
+
+
+def wait_for(driver, locator, timeout: float):
+    """Wait until an element matching locator is present."""
+    return WebDriverWait(driver, timeout, poll_frequency=0.05).until(
+        EC.presence_of_element_located(locator)
+    )
+
+
+def wait_for_profile(driver, timeout: float):
+    """A company profile is usable once __NEXT_DATA__ or the rating is in the DOM.
+
+    timeout only applies until enough waits are measured; then it is derived
+    from their p99 (latency.LatencyTracker), at most twice the given value,
+    and a URL that already timed out gets that maximum on its retry.
+    """
+    url = driver.current_url
+    with latency.measure("selenium:review", key=url):
+        return WebDriverWait(driver, latency.timeout("selenium:review", timeout, key=url), poll_frequency=0.05).until(
+            EC.all_of(
+                EC.presence_of_element_located(TITLE),
+                EC.any_of(
+                    EC.presence_of_element_located(NEXT_DATA),
+                    EC.presence_of_element_located(RATING),
+                ),
+            )
+        )
+
+
+def wait_for_listing(driver, timeout: float):
+    """A category page is usable once its company cards are rendered (timeout adapted like wait_for_profile)."""
+    url = driver.current_url
+    with latency.measure("selenium:categories", key=url):
+        return wait_for(driver, COMPANY_LINK, latency.timeout("selenium:categories", timeout, key=url))
+
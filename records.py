@@ -0,0 +1,302 @@
+import csv
+import math
+import os
+import re
+import sys
+from array import array
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+# Colonnes du CSV historique, dans l'ordre ; les puits CSV/JSON les reçoivent telles quelles
+CSV_COLUMNS = [
+    "Nom de l'entreprise", "Note", "Nombre de reviews", "Catégorie", "Site", "Adresse", "En France",
+    "Pourcentage 5 étoiles", "Pourcentage 4 étoiles", "Pourcentage 3 étoiles", "Pourcentage 2 étoiles",
+    "Pourcentage 1 étoile",
+]
+
+STARS = (5, 4, 3, 2, 1)
+
+FIELDS = (
+    "url", "name", "rating", "review_count", "category", "website", "address", "in_france",
+    "pct_5", "pct_4", "pct_3", "pct_2", "pct_1",
+)
+
+
+def parse_number(value: Any, decimal_comma: bool = False) -> Optional[float]:
+    """'13,236' -> 13236, '87%' -> 87, '<1%' -> 1, '4,8' -> 4.8 with decimal_comma; None if unparseable."""
+    if value is None or value == "":
+        return None
+    if isinstance(value, (int, float)):
+        return None if isinstance(value, float) and math.isnan(value) else float(value)
+    text = str(value).replace(" ", "")
+    text = text.replace(",", ".") if decimal_comma else text.replace(",", "")
+    match = re.search(r"\d+(?:\.\d+)?", text)
+    return float(match.group()) if match else None
+
+
+def _int(value: Any, decimal_comma: bool = False) -> Optional[int]:
+    number = parse_number(value, decimal_comma)
+    return None if number is None else int(round(number))
+
+
+def _str(value: Any) -> Optional[str]:
+    return None if value is None else str(value)
+
+
+class CompanyRecord:
+    """One company, typed: floats and small ints instead of the 12 French string values.
+
+    in_france is True / False / None (unknown); pct_5 .. pct_1 are whole
+    percentages. Values are parsed on the way in, so the scrapers can pass what
+    they read from the page ('13,236', '87%', 'Oui').
+    """
+
+    __slots__ = FIELDS
+
+    def __init__(
+        self,
+        url: Optional[str] = None,
+        name: Optional[str] = None,
+        rating: Any = None,
+        review_count: Any = None,
+        category: Optional[str] = None,
+        website: Optional[str] = None,
+        address: Optional[str] = None,
+        in_france: Optional[bool] = None,
+        stars: Optional[Dict[int, Any]] = None,
+    ):
+        self.url = url
+        self.name = _str(name)
+        self.rating = parse_number(rating, decimal_comma=True)
+        self.review_count = _int(review_count)
+        # Catégories et pays reviennent des milliers de fois : une seule chaîne en mémoire
+        self.category = sys.intern(category) if category else category
+        self.website = _str(website)
+        self.address = _str(address)
+        self.in_france = in_france
+        stars = stars or {}
+        self.pct_5 = _int(stars.get(5))
+        self.pct_4 = _int(stars.get(4))
+        self.pct_3 = _int(stars.get(3))
+        self.pct_2 = _int(stars.get(2))
+        self.pct_1 = _int(stars.get(1))
+
+    @property
+    def stars(self) -> Dict[int, Optional[int]]:
+        return {stars: getattr(self, f"pct_{stars}") for stars in STARS}
+
+    @classmethod
+    def from_row(cls, row: Dict[str, Any], url: Optional[str] = None) -> "CompanyRecord":
+        """Parse a row of the historical CSV (French columns)."""
+        in_france = row.get("En France")
+        return cls(
+            url=url,
+            name=row.get("Nom de l'entreprise"),
+            rating=row.get("Note"),
+            review_count=row.get("Nombre de reviews"),
+            category=row.get("Catégorie"),
+            website=row.get("Site"),
+            address=row.get("Adresse"),
+            in_france=None if in_france in (None, "") else in_france == "Oui",
+            stars={stars: row.get(column) for stars, column in zip(STARS, CSV_COLUMNS[7:])},
+        )
+
+    def to_row(self, missing: Any = 0) -> Dict[str, Any]:
+        """The historical CSV row: French columns, 'Oui'/'Non', '87%'.
+
+        Unknown numbers are written as missing: 0 in the CSV, None to keep
+        them apart from a real zero.
+        """
+        values = [
+            self.name or "",
+            self.rating if self.rating is not None else missing,
+            self.review_count if self.review_count is not None else missing,
+            self.category or "",
+            self.website or "",
+            self.address or "",
+            {True: "Oui", False: "Non"}.get(self.in_france, ""),
+        ]
+        values.extend(
+            missing if pct is None and missing != 0 else f"{pct or 0}%"
+            for pct in (self.pct_5, self.pct_4, self.pct_3, self.pct_2, self.pct_1)
+        )
+        return dict(zip(CSV_COLUMNS, values))
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Parsed fields without the URL, JSON-serialisable (parse cache)."""
+        return {field: getattr(self, field) for field in FIELDS[1:]}
+
+    @classmethod
+    def from_dict(cls, values: Dict[str, Any], url: Optional[str] = None) -> "CompanyRecord":
+        record = cls.__new__(cls)
+        for field in FIELDS[1:]:
+            setattr(record, field, values.get(field))
+        record.url = url
+        if record.category:
+            record.category = sys.intern(record.category)
+        return record
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, CompanyRecord):
+            return NotImplemented
+        return all(getattr(self, field) == getattr(other, field) for field in FIELDS)
+
+    def __repr__(self) -> str:
+        return f"CompanyRecord(name={self.name!r}, rating={self.rating!r}, review_count={self.review_count!r})"
+
+
+class CompanyBatch:
+    """Column buffers for many CompanyRecords.
+
+    Numeric columns are array.array (8 bytes per rating, 1 per percentage),
+    categories are dictionary-encoded, missing numbers are NaN / -1 sentinels.
+    to_pandas() and to_arrow() wrap the numeric buffers without copying them;
+    numpy, pandas and pyarrow are only imported there, and clear() raises
+    BufferError while such a frame is still alive. Categories are kept across
+    clear(), so codes stay stable for the whole run.
+    """
+
+    def __init__(self, records: Iterable[CompanyRecord] = ()):
+        self.url: List[Optional[str]] = []
+        self.name: List[Optional[str]] = []
+        self.website: List[Optional[str]] = []
+        self.address: List[Optional[str]] = []
+        self.rating = array("d")
+        self.review_count = array("q")
+        self.category_codes = array("h")  # -1 = pas de catégorie
+        self.categories: List[str] = []
+        self._category_index: Dict[str, int] = {}
+        self.in_france = array("b")  # 1 / 0 / -1 inconnu
+        self.stars = {stars: array("b") for stars in STARS}  # -1 = inconnu
+        for record in records:
+            self.append(record)
+
+    def __len__(self) -> int:
+        return len(self.rating)
+
+    def append(self, record: CompanyRecord):
+        self.url.append(record.url)
+        self.name.append(record.name)
+        self.website.append(record.website)
+        self.address.append(record.address)
+        self.rating.append(math.nan if record.rating is None else record.rating)
+        self.review_count.append(-1 if record.review_count is None else record.review_count)
+        if record.category is None:
+            self.category_codes.append(-1)
+        else:
+            code = self._category_index.get(record.category)
+            if code is None:
+                code = self._category_index[record.category] = len(self.categories)
+                self.categories.append(record.category)
+            self.category_codes.append(code)
+        self.in_france.append(-1 if record.in_france is None else int(record.in_france))
+        for stars, column in self.stars.items():
+            pct = getattr(record, f"pct_{stars}")
+            column.append(-1 if pct is None else pct)
+
+    def extend(self, records: Iterable[CompanyRecord]):
+        for record in records:
+            self.append(record)
+
+    def clear(self):
+        for column in (self.url, self.name, self.website, self.address):
+            column.clear()
+        for column in (self.rating, self.review_count, self.category_codes, self.in_france, *self.stars.values()):
+            del column[:]
+
+    def __getitem__(self, i: int) -> CompanyRecord:
+        record = CompanyRecord.__new__(CompanyRecord)
+        rating, review_count, code, in_france = self.rating[i], self.review_count[i], self.category_codes[i], self.in_france[i]
+        record.url = self.url[i]
+        record.name = self.name[i]
+        record.rating = None if math.isnan(rating) else rating
+        record.review_count = None if review_count < 0 else review_count
+        record.category = None if code < 0 else self.categories[code]
+        record.website = self.website[i]
+        record.address = self.address[i]
+        record.in_france = None if in_france < 0 else bool(in_france)
+        for stars, column in self.stars.items():
+            setattr(record, f"pct_{stars}", None if column[i] < 0 else column[i])
+        return record
+
+    def __iter__(self) -> Iterator[CompanyRecord]:
+        for i in range(len(self)):
+            yield self[i]
+
+    def rows(self) -> Iterator[Dict[str, Any]]:
+        """Historical CSV rows, built one at a time."""
+        for record in self:
+            yield record.to_row()
+
+    def _numpy_columns(self) -> Dict[str, Any]:
+        import numpy as np
+
+        # np.frombuffer : vue sur le tampon de l'array, sans copie
+        columns = {
+            "rating": np.frombuffer(self.rating, dtype=np.float64),
+            "review_count": np.frombuffer(self.review_count, dtype=np.int64),
+            "in_france": np.frombuffer(self.in_france, dtype=np.int8),
+        }
+        for stars, column in self.stars.items():
+            columns[f"pct_{stars}"] = np.frombuffer(column, dtype=np.int8)
+        columns["category_codes"] = np.frombuffer(self.category_codes, dtype=np.int16)
+        return columns
+
+    def to_pandas(self):
+        """Typed DataFrame with the store's column names; numeric columns share the batch's memory."""
+        import pandas as pd
+
+        if not len(self):
+            return pd.DataFrame(columns=list(FIELDS))
+        numeric = self._numpy_columns()
+        data = {
+            "url": self.url,
+            "name": self.name,
+            "rating": numeric["rating"],
+            # Entiers nullables : le tampon est réutilisé, seul le masque est alloué
+            "review_count": pd.arrays.IntegerArray(numeric["review_count"], numeric["review_count"] < 0),
+            "category": pd.Categorical.from_codes(numeric["category_codes"], self.categories),
+            "website": self.website,
+            "address": self.address,
+            "in_france": pd.arrays.BooleanArray(numeric["in_france"] == 1, numeric["in_france"] < 0),
+        }
+        for stars in STARS:
+            column = numeric[f"pct_{stars}"]
+            data[f"pct_{stars}"] = pd.arrays.IntegerArray(column, column < 0)
+        return pd.DataFrame(data, copy=False)
+
+    def to_arrow(self):
+        """pyarrow Table with the same columns as to_pandas(); missing values become nulls."""
+        import pyarrow as pa
+
+        numeric = self._numpy_columns()
+        data = {
+            "url": pa.array(self.url, pa.string()),
+            "name": pa.array(self.name, pa.string()),
+            "rating": pa.array(numeric["rating"], from_pandas=True),
+            "review_count": pa.array(numeric["review_count"], mask=numeric["review_count"] < 0),
+            "category": pa.DictionaryArray.from_arrays(
+                pa.array(numeric["category_codes"], mask=numeric["category_codes"] < 0),
+                pa.array(self.categories, pa.string()),
+            ),
+            "website": pa.array(self.website, pa.string()),
+            "address": pa.array(self.address, pa.string()),
+            "in_france": pa.array(numeric["in_france"] == 1, mask=numeric["in_france"] < 0),
+        }
+        for stars in STARS:
+            column = numeric[f"pct_{stars}"]
+            data[f"pct_{stars}"] = pa.array(column, mask=column < 0)
+        return pa.table(data)
+
+
+def append_csv(path: str, records: Iterable[CompanyRecord]) -> int:
+    """Append records to the historical CSV (header written if the file is new); returns the row count."""
+    write_header = not os.path.exists(path)
+    count = 0
+    with open(path, "a", newline="", encoding="utf-8-sig") as f:
+        writer = csv.DictWriter(f, fieldnames=CSV_COLUMNS)
+        if write_header:
+            writer.writeheader()
+        for record in records:
+            writer.writerow(record.to_row())
+            count += 1
+    return count
@@ -0,0 +1,380 @@
+import asyncio
+import json
+import logging
+import os
+import random
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, List, Optional
+from urllib.parse import urlparse
+
+from rate_limiter import RateLimiter
+
+DEAD_LETTER_PATH = "trustpilot_dead_letters.jsonl"
+
+# Un verrou par fichier : plusieurs stores (un par chemin de fetch) partagent le même
+_PATH_LOCKS: Dict[str, threading.Lock] = {}
+_PATH_LOCKS_GUARD = threading.Lock()
+
+
+def _path_lock(path: str) -> threading.Lock:
+    with _PATH_LOCKS_GUARD:
+        return _PATH_LOCKS.setdefault(os.path.abspath(path), threading.Lock())
+
+
+class FetchError(Exception):
+    """A non-2xx answer, raised by the HTTP fetch paths so it can be classified."""
+
+    def __init__(self, url: str, status: int, retry_after: Optional[float] = None):
+        super().__init__(f"HTTP {status} for {url}")
+        self.url = url
+        self.status = status
+        self.retry_after = retry_after
+
+
+class ParseError(Exception):
+    """The page loaded but the expected data was not in it."""
+
+
+def retry_after_seconds(value: Optional[str]) -> Optional[float]:
+    """Parse a Retry-After header given in seconds; HTTP dates are ignored."""
+    try:
+        return max(0.0, float(value)) if value else None
+    except ValueError:
+        return None
+
+
+def classify(exc: BaseException) -> str:
+    """Map any fetch exception (aiohttp, Selenium, Playwright...) to an error class.
+
+    Done by duck typing so this module never imports the optional backends.
+    """
+    if isinstance(exc, ParseError):
+        return "parse"
+    status = getattr(exc, "status", None)
+    if isinstance(status, int):
+        if status == 429:
+            return "rate_limited"
+        if status in (404, 410):
+            return "gone"
+        if status >= 500:
+            return "server"
+        return "client"
+    name = type(exc).__name__
+    message = str(exc)
+    if isinstance(exc, (asyncio.TimeoutError, TimeoutError)) or "Timeout" in name:
+        return "timeout"
+    if (
+        isinstance(exc, ConnectionError)
+        or "Connect" in name
+        or "Disconnect" in name
+        or "net::ERR_" in message
+    ):
+        return "network"
+    return "unknown"
+
+
+@dataclass
+class RetryRule:
+    max_attempts: int
+    base: float = 1.0
+    cap: float = 60.0
+    trips_breaker: bool = False
+    dead_letter: bool = True
+
+
+DEFAULT_RULES = {
+    "rate_limited": RetryRule(5, base=5.0, cap=300.0, trips_breaker=True),
+    "server": RetryRule(4, base=2.0, cap=60.0, trips_breaker=True),
+    "timeout": RetryRule(3, base=1.0, cap=30.0, trips_breaker=True),
+    "network": RetryRule(4, base=2.0, cap=60.0, trips_breaker=True),
+    "client": RetryRule(1),
+    "gone": RetryRule(1, dead_letter=False),  # Profil supprimé : inutile de le rejouer
+    "parse": RetryRule(1),
+    "unknown": RetryRule(2, base=1.0, cap=10.0),
+}
+
+
+class RetryPolicy:
+    """Per error class attempt budget and jittered exponential backoff."""
+
+    def __init__(self, rules: Optional[Dict[str, RetryRule]] = None):
+        self.rules = {**DEFAULT_RULES, **(rules or {})}
+
+    def rule(self, error_class: str) -> RetryRule:
+        return self.rules.get(error_class, self.rules["unknown"])
+
+    def should_retry(self, error_class: str, attempt: int) -> bool:
+        return attempt < self.rule(error_class).max_attempts
+
+    def delay(self, error_class: str, attempt: int, retry_after: Optional[float] = None) -> float:
+        """Equal jitter: half the exponential step is fixed, half is random.
+
+        The fixed half keeps a floor under the wait, the random half spreads
+        workers that failed together so they do not retry in lockstep.
+        """
+        rule = self.rule(error_class)
+        step = min(rule.cap, rule.base * 2 ** (attempt - 1))
+        delay = step / 2 + random.uniform(0, step / 2)
+        return max(delay, retry_after or 0.0)
+
+
+class CircuitBreaker:
+    """Per-host breaker: after failure_threshold consecutive failures, callers wait.
+
+    closed -> open (everyone waits cooldown) -> half-open (one trial request)
+    -> closed on success, or open again with a doubled cooldown on failure.
+    """
+
+    def __init__(self, host: str, failure_threshold: int = 5, cooldown: float = 30.0, max_cooldown: float = 600.0):
+        self.host = host
+        self.failure_threshold = failure_threshold
+        self.base_cooldown = cooldown
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def wait_time(self) -> float:
+        """Seconds the caller must wait before sending; 0 means go."""
+        with self._lock:
+            if self.state == "closed":
+                return 0.0
+            now = time.monotonic()
+            if self.state == "open":
+                remaining = self.opened_at + self.cooldown - now
+                if remaining > 0:
+                    return remaining
+                self.state = "half_open"
+                self._trial_in_flight = False
+            if not self._trial_in_flight:
+                self._trial_in_flight = True
+                return 0.0
+            return min(1.0, self.cooldown)  # Une requête d'essai est déjà en vol
+
+    def abort_trial(self):
+        """The half-open trial ended without an answer (cancelled): let the next caller probe."""
+        with self._lock:
+            if self.state == "half_open":
+                self._trial_in_flight = False
+
+    def record_success(self):
+        with self._lock:
+            if self.state != "closed":
+                logging.info("Circuit closed for %s", self.host, extra={"host": self.host})
+            self.state = "closed"
+            self.failures = 0
+            self.cooldown = self.base_cooldown
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open":
+                self.cooldown = min(self.max_cooldown, self.cooldown * 2)
+            elif self.state == "open" or self.failures < self.failure_threshold:
+                return
+            self.state = "open"
+            self.opened_at = time.monotonic()
+            self._trial_in_flight = False
+            logging.warning(
+                "Circuit open for %s: pausing requests %.0f seconds after %s failures",
+                self.host,
+                self.cooldown,
+                self.failures,
+                extra={"host": self.host},
+            )
+
+
+class DeadLetterStore:
+    """URLs that exhausted their retries, kept across runs until a re-drive succeeds.
+
+    Append-only JSON lines: a "dead" entry when a URL is abandoned and a
+    "resolved" entry when it later succeeds; the last entry per URL wins.
+    Several stores may share one file (one per fetch path): they serialise
+    on a per-path lock and compact() rebuilds from the file, not from memory.
+    """
+
+    def __init__(self, path: str = DEAD_LETTER_PATH):
+        self.path = path
+        self._lock = _path_lock(path)
+        with self._lock:
+            self.entries = self._load()
+
+    def _load(self) -> Dict[str, dict]:
+        entries: Dict[str, dict] = {}
+        if os.path.exists(self.path):
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        entries[entry["url"]] = entry
+        return {url: e for url, e in entries.items() if e["status"] == "dead"}
+
+    def _append(self, entry: dict):
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n")
+
+    def add(self, url: str, source: str, error_class: str, error: str, attempts: int):
+        entry = {
+            "url": url,
+            "status": "dead",
+            "source": source,
+            "error_class": error_class,
+            "error": error,
+            "attempts": attempts,
+            "at": datetime.now().isoformat(timespec="seconds"),
+        }
+        with self._lock:
+            self.entries[url] = entry
+            self._append(entry)
+
+    def resolve(self, url: str):
+        with self._lock:
+            if self.entries.pop(url, None) is not None:
+                self._append({"url": url, "status": "resolved", "at": datetime.now().isoformat(timespec="seconds")})
+
+    def pending(self, source: Optional[str] = None) -> List[str]:
+        """URLs waiting for a re-drive, oldest first."""
+        with self._lock:
+            return [url for url, e in self.entries.items() if source is None or e["source"] == source]
+
+    def compact(self):
+        """Rewrite the file with only the pending entries, those of the other stores included."""
+        with self._lock:
+            # Relu sous le verrou : les autres stores du fichier y ont ajouté leurs entrées
+            self.entries = self._load()
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                for entry in self.entries.values():
+                    f.write(json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n")
+            os.replace(tmp_path, self.path)
+
+
+class Resilience:
+    """Retry policy, per-host circuit breakers and dead letters for one fetch path.
+
+    call()/call_async() run a fetch function until it succeeds or its error
+    class runs out of attempts; abandoned URLs go to the dead-letter store and
+    None is returned, like the scrapers did before.
+    """
+
+    def __init__(
+        self,
+        source: str,
+        policy: Optional[RetryPolicy] = None,
+        limiter: Optional[RateLimiter] = None,
+        dead_letters: Optional[DeadLetterStore] = None,
+        failure_threshold: int = 5,
+        cooldown: float = 30.0,
+    ):
+        self.source = source
+        self.policy = policy or RetryPolicy()
+        self.limiter = limiter
+        self.dead_letters = dead_letters or DeadLetterStore()
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    def breaker(self, url: str) -> CircuitBreaker:
+        host = urlparse(url).netloc or url
+        with self._lock:
+            if host not in self._breakers:
+                self._breakers[host] = CircuitBreaker(host, self.failure_threshold, self.cooldown)
+            return self._breakers[host]
+
+    def _on_failure(self, url: str, exc: Exception, attempt: int) -> Optional[float]:
+        """Record a failed attempt; return the delay before the next one, or None to give up."""
+        error_class = classify(exc)
+        rule = self.policy.rule(error_class)
+        if rule.trips_breaker:
+            self.breaker(url).record_failure()
+        else:
+            self.breaker(url).record_success()  # L'hôte a répondu : 404, page incomplète...
+        if not self.policy.should_retry(error_class, attempt):
+            logging.error(
+                "Giving up on %s after %s attempts (%s): %s",
+                url,
+                attempt,
+                error_class,
+                exc,
+                extra={"url": url, "error_class": error_class},
+            )
+            if rule.dead_letter:
+                self.dead_letters.add(url, self.source, error_class, str(exc), attempt)
+            return None
+        delay = self.policy.delay(error_class, attempt, getattr(exc, "retry_after", None))
+        logging.warning(
+            "Attempt %s for %s failed (%s), retrying in %.1f seconds: %s",
+            attempt,
+            url,
+            error_class,
+            delay,
+            exc,
+            extra={"url": url, "error_class": error_class},
+        )
+        if error_class == "rate_limited" and self.limiter is not None:
+            # Le serveur demande de ralentir : tous les workers font la pause
+            self.limiter.backoff(delay)
+            return 0.0
+        return delay
+
+    def _on_success(self, url: str):
+        self.breaker(url).record_success()
+        self.dead_letters.resolve(url)
+
+    def call(self, url: str, func, *args, **kwargs):
+        """Blocking flavour, for the Selenium thread pools."""
+        breaker = self.breaker(url)
+        attempt = 0
+        while True:
+            attempt += 1
+            wait = breaker.wait_time()
+            while wait > 0:
+                time.sleep(wait)
+                wait = breaker.wait_time()
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                delay = self._on_failure(url, e, attempt)
+                if delay is None:
+                    return None
+                time.sleep(delay)
+                continue
+            except BaseException:
+                # Annulation (job arrêté, requête couverte perdante...) : l'essai ne doit pas rester pris
+                breaker.abort_trial()
+                raise
+            self._on_success(url)
+            return result
+
+    async def call_async(self, url: str, func, *args, **kwargs):
+        """Asyncio flavour of call(); func is a coroutine function."""
+        breaker = self.breaker(url)
+        attempt = 0
+        while True:
+            attempt += 1
+            wait = breaker.wait_time()
+            while wait > 0:
+                await asyncio.sleep(wait)
+                wait = breaker.wait_time()
+            try:
+                result = await func(*args, **kwargs)
+            except Exception as e:
+                delay = self._on_failure(url, e, attempt)
+                if delay is None:
+                    return None
+                await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                # Annulation (job arrêté, requête couverte perdante...) : l'essai ne doit pas rester pris
+                breaker.abort_trial()
+                raise
+            self._on_success(url)
+            return result
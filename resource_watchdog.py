@@ -0,0 +1,282 @@
+import asyncio
+import collections
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from datetime import datetime
+from typing import Callable, Dict, Optional
+
+import psutil
+
+METRICS_PATH = "watchdog_metrics.jsonl"
+
+
+def default_max_workers(per_worker_mb: float = 300.0, per_cpu: int = 4) -> int:
+    """Upper bound for this machine: what fits in available memory, at most per_cpu per core."""
+    available_mb = psutil.virtual_memory().available / 2**20
+    return max(1, min(int(available_mb // per_worker_mb), (os.cpu_count() or 1) * per_cpu))
+
+
+def process_tree_rss(pid: int) -> int:
+    """RSS in bytes of a process and all its descendants (chromedriver + Chrome renderers)."""
+    try:
+        root = psutil.Process(pid)
+        processes = [root, *root.children(recursive=True)]
+    except psutil.NoSuchProcess:
+        return 0
+    total = 0
+    for process in processes:
+        try:
+            total += process.memory_info().rss
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            pass
+    return total
+
+
+def kill_process_tree(pid: int):
+    try:
+        root = psutil.Process(pid)
+        processes = [*root.children(recursive=True), root]
+    except psutil.NoSuchProcess:
+        return
+    for process in processes:
+        try:
+            process.kill()
+        except psutil.NoSuchProcess:
+            pass
+
+
+def driver_pid(driver) -> Optional[int]:
+    """chromedriver's pid for a Selenium driver; Chrome runs underneath it."""
+    service = getattr(driver, "service", None)
+    process = getattr(service, "process", None)
+    return getattr(process, "pid", None)
+
+
+class WorkerLimit:
+    """Adjustable concurrency limit for threads; set_limit() takes effect on the next slot()."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.in_flight = 0
+        self._condition = threading.Condition()
+
+    def set_limit(self, limit: int):
+        with self._condition:
+            self.limit = limit
+            self._condition.notify_all()
+
+    @contextmanager
+    def slot(self):
+        with self._condition:
+            while self.in_flight >= self.limit:
+                self._condition.wait()
+            self.in_flight += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self.in_flight -= 1
+                self._condition.notify()
+
+
+class AsyncWorkerLimit:
+    """asyncio flavour of WorkerLimit; must be used from a single event loop."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.in_flight = 0
+        self._waiters: collections.deque = collections.deque()
+
+    def _wake(self):
+        while self._waiters and self.in_flight < self.limit:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
+
+    def set_limit(self, limit: int):
+        self.limit = limit
+        self._wake()
+
+    @asynccontextmanager
+    async def slot(self):
+        if self.in_flight < self.limit and not self._waiters:
+            self.in_flight += 1
+        else:
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter.done() and not waiter.cancelled():
+                    self.in_flight -= 1
+                    self._wake()
+                raise
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self._wake()
+
+
+class Watchdog:
+    """Samples CPU and memory and steers worker concurrency towards a target utilisation.
+
+    Additive increase while the machine has headroom and workers are
+    saturated, multiplicative decrease as soon as CPU or memory goes over
+    target. Registered browsers whose process tree exceeds rss_ceiling_mb are
+    flagged for recycling, and killed outright past twice the ceiling. Every
+    decision is appended to metrics_path as one JSON line.
+    """
+
+    def __init__(
+        self,
+        limit,
+        min_workers: int = 1,
+        max_workers: Optional[int] = None,
+        target_cpu: float = 0.80,
+        target_memory: float = 0.85,
+        interval: float = 5.0,
+        rss_ceiling_mb: float = 1500.0,
+        metrics_path: Optional[str] = METRICS_PATH,
+    ):
+        self.limit = limit
+        self.min_workers = min_workers
+        self.max_workers = max_workers or default_max_workers()
+        self.target_cpu = target_cpu
+        self.target_memory = target_memory
+        self.interval = interval
+        self.rss_ceiling = rss_ceiling_mb * 2**20
+        self.metrics_path = metrics_path
+        self.browsers: Dict[int, str] = {}  # pid -> libellé
+        self.to_recycle: set = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._process = psutil.Process()
+        psutil.cpu_percent(None)  # Amorce : le premier appel renvoie toujours 0
+
+    def register_browser(self, driver, label: str = "chrome"):
+        pid = driver_pid(driver)
+        if pid is not None:
+            with self._lock:
+                self.browsers[pid] = label
+
+    def unregister_browser(self, driver):
+        pid = driver_pid(driver)
+        with self._lock:
+            self.browsers.pop(pid, None)
+            self.to_recycle.discard(pid)
+
+    def should_recycle(self, driver) -> bool:
+        with self._lock:
+            return driver_pid(driver) in self.to_recycle
+
+    def mark_for_recycle(self, driver):
+        """Have the next recycle() replace driver, e.g. because its session died."""
+        pid = driver_pid(driver)
+        if pid is not None:
+            with self._lock:
+                self.to_recycle.add(pid)
+
+    def recycle(self, driver, factory: Callable):
+        """Quit driver and return a fresh one from factory() if it went over the ceiling."""
+        if not self.should_recycle(driver):
+            return driver
+        self.unregister_browser(driver)
+        try:
+            driver.quit()
+        except Exception as e:
+            logging.warning("Browser quit failed during recycling: %s", e)
+        new_driver = factory()
+        self.register_browser(new_driver)
+        return new_driver
+
+    def _check_browsers(self) -> dict:
+        killed, flagged, browsers_rss = 0, 0, 0
+        with self._lock:
+            browsers = list(self.browsers)
+        for pid in browsers:
+            rss = process_tree_rss(pid)
+            browsers_rss += rss
+            if rss > 2 * self.rss_ceiling:
+                # Au-delà de deux fois le plafond : on n'attend pas la fin de la page en cours
+                logging.warning("Killing browser %s: %.0f MB", pid, rss / 2**20)
+                kill_process_tree(pid)
+                with self._lock:
+                    self.browsers.pop(pid, None)
+                    self.to_recycle.add(pid)  # Le propriétaire le remplacera au prochain recycle()
+                killed += 1
+            elif rss > self.rss_ceiling:
+                with self._lock:
+                    self.to_recycle.add(pid)
+                flagged += 1
+        return {"browsers": len(browsers), "browsers_rss_mb": round(browsers_rss / 2**20), "recycle": flagged, "killed": killed}
+
+    def step(self) -> dict:
+        """Take one sample and adjust the limit; returns the metrics line."""
+        cpu = psutil.cpu_percent(None) / 100
+        memory = psutil.virtual_memory().percent / 100
+        rss = process_tree_rss(self._process.pid)
+        current = self.limit.limit
+        saturated = self.limit.in_flight >= current
+        if cpu > self.target_cpu or memory > self.target_memory:
+            new_limit, reason = max(self.min_workers, int(current * 0.75)), "over_target"
+        elif saturated and cpu < self.target_cpu - 0.15 and memory < self.target_memory - 0.1:
+            new_limit, reason = min(self.max_workers, current + 1), "headroom"
+        else:
+            new_limit, reason = current, "hold"
+        if new_limit != current:
+            self.limit.set_limit(new_limit)
+            logging.info(
+                "Watchdog: workers %s -> %s (cpu %.0f%%, memory %.0f%%)",
+                current,
+                new_limit,
+                cpu * 100,
+                memory * 100,
+            )
+        metrics = {
+            "ts": datetime.now().isoformat(timespec="seconds"),
+            "cpu": round(cpu, 3),
+            "memory": round(memory, 3),
+            "rss_mb": round(rss / 2**20),
+            "in_flight": self.limit.in_flight,
+            "limit": new_limit,
+            "decision": reason,
+            **self._check_browsers(),
+        }
+        if self.metrics_path:
+            with open(self.metrics_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(metrics) + "\n")
+        return metrics
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.step()
+            except Exception as e:
+                logging.warning("Watchdog sample failed: %s", e)
+
+    def start(self) -> "Watchdog":
+        """Sample from a daemon thread (Selenium thread pools)."""
+        self._thread = threading.Thread(target=self._run, name="watchdog", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    async def run_async(self):
+        """Sample from the event loop, so AsyncWorkerLimit is only touched from its loop."""
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                self.step()
+            except Exception as e:
+                logging.warning("Watchdog sample failed: %s", e)
@@ -9,9 +9,39 @@ import re
 import json
 from urllib.parse import urlparse
 import logging
+import sys
 
-# Configuration du logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+from archive import archive_page
+from change_capture import capture_changes
+from chrome_profile import ProfileTemplate
+from domains import canonical_domain
+from egress import EgressPool, chrome_arguments
+from extraction_spec import full_address, get_engine, star_distribution
+from frontier import Deadline, Frontier, parse_duration
+from history import HistoryStore
+from listing_extractor import BASE_URL, get_listings
+from log_setup import configure_logging
+from normalize import normalize_csv
+from prefilter import ListingFilter
+from rate_limiter import RateLimiter
+from readiness import navigate, setup_readiness_options, wait_for_listing, wait_for_profile
+from records import CSV_COLUMNS, CompanyBatch, CompanyRecord, append_csv
+from resilience import Resilience
+from resource_watchdog import Watchdog, WorkerLimit
+from site_check import check_websites
+from store import CompanyStore
+from tracing import enable_tracing, tracer
+
+# Cadence des requêtes : on n'attend que si le budget est épuisé
+pacer = RateLimiter(rate=4, burst=4)
+
+resilience = Resilience("scraper_fr", limiter=pacer)
+
+# Profils clonés d'un modèle au cache HTTP déjà chaud (JS, CSS, polices de cdn.trustpilot.net)
+profiles = ProfileTemplate()
+
+# Un seul driver : une sortie réseau (egress.json) choisie au lancement pour tout le run
+egress = EgressPool.from_config()
 
 def setup_driver():
     logging.info("Configuration du driver Chrome...")
@@ -19,137 +49,161 @@ def setup_driver():
     options.add_argument('--headless')
     options.add_argument('--no-sandbox')
     options.add_argument('--disable-dev-shm-usage')
-    return webdriver.Chrome(options=options)
-
-def extract_json_ld_data(driver):
-    """Extraire les données du JSON-LD"""
-    try:
-        json_scripts = driver.find_elements(By.CSS_SELECTOR, "script[type='application/ld+json']")
-        for script in json_scripts:
-            try:
-                data = json.loads(script.get_attribute('innerHTML'))
-                if isinstance(data, dict):
-                    return data
-                elif isinstance(data, list) and len(data) > 0:
-                    return data[0]
-            except json.JSONDecodeError:
-                continue
-    except:
-        pass
-    return {}
+    exit_ = egress.choose()
+    logging.info("Sortie réseau: %s", exit_.name)
+    for argument in chrome_arguments(exit_):
+        options.add_argument(argument)
+    profile_dir = profiles.clone()
+    for argument in profiles.chrome_arguments(profile_dir):
+        options.add_argument(argument)
+    setup_readiness_options(options)
+    driver = webdriver.Chrome(options=options)
+    profiles.attach(driver, profile_dir)
+    return driver
 
 def get_company_links_from_page(driver, page_url):
     try:
-        driver.get(page_url)
-        time.sleep(0.5)
-        company_links = set()
+        with tracer.span("pace", url=page_url):
+            pacer.acquire()
+        with tracer.span("navigate", url=page_url):
+            navigate(driver, page_url)
+        company_links = []  # Liste pour conserver l'ordre d'affichage
         
         # Attendre que les liens des entreprises soient chargés
-        WebDriverWait(driver, 3).until(
-            EC.presence_of_element_located((By.CSS_SELECTOR, "a[href*='/review/']"))
-        )
+        with tracer.span("wait", url=page_url):
+            wait_for_listing(driver, 3)
         
         # Récupérer tous les liens d'entreprises de la page
         links = driver.find_elements(By.CSS_SELECTOR, "a[href*='/review/']")
         for link in links:
             href = link.get_attribute("href")
-            if href and "trustpilot.com/review/" in href:
-                company_links.add(href)
+            if href and "trustpilot.com/review/" in href and href not in company_links:
+                company_links.append(href)
         
-        logging.info(f"Nombre d'entreprises trouvées sur la page: {len(company_links)}")
-        return list(company_links)
+        logging.info("Nombre d'entreprises trouvées sur la page: %s", len(company_links))
+        return company_links
     except Exception as e:
-        logging.error(f"Erreur lors de la récupération des liens sur {page_url}: {str(e)}")
+        logging.error("Erreur lors de la récupération des liens sur %s: %s", page_url, e)
         return []
 
-def scrape_company_data(driver, url):
+# Messages Selenium d'une session Chrome morte (tuée par le watchdog, plantée)
+SESSION_LOST_MARKERS = ("invalid session id", "chrome not reachable", "session deleted", "disconnected")
+
+def session_lost(exc):
+    name = type(exc).__name__
+    message = str(exc).lower()
+    return name == "InvalidSessionIdException" or any(marker in message for marker in SESSION_LOST_MARKERS)
+
+def scrape_company_data(driver, url, watchdog=None):
+    """Retry par classe d'erreur, disjoncteur par hôte, lettres mortes si abandon.
+
+    Retourne (driver, données) : si la session Chrome meurt, le driver est
+    remplacé avant la tentative suivante et l'appelant doit garder le nouveau.
+    """
+    session = [driver]
+
+    def attempt():
+        if watchdog is not None:
+            # Chrome tué par le watchdog ou session perdue à la tentative précédente
+            session[0] = watchdog.recycle(session[0], setup_driver)
+        try:
+            return _scrape_company_data_once(session[0], url)
+        except Exception as e:
+            if watchdog is not None and session_lost(e):
+                logging.warning("Session Chrome perdue pour %s, nouveau driver à la prochaine tentative", url, extra={"url": url})
+                watchdog.mark_for_recycle(session[0])
+            raise
+
+    company_data = resilience.call(url, attempt)
+    return session[0], company_data
+
+def _scrape_company_data_once(driver, url):
     try:
-        logging.info(f"Tentative de scraping pour l'URL: {url}")
-        driver.get(url)
-        time.sleep(0.5)
+        logging.info("Tentative de scraping pour l'URL: %s", url, extra={"url": url})
+        with tracer.span("pace", url=url):
+            pacer.acquire()
+        with tracer.span("navigate", url=url):
+            navigate(driver, url)
         
-        # Attendre que les éléments principaux soient chargés
-        WebDriverWait(driver, 5).until(
-            EC.presence_of_element_located((By.CSS_SELECTOR, "h1"))
-        )
+        # Attendre que les éléments principaux soient chargés (__NEXT_DATA__ ou note)
+        with tracer.span("wait", url=url):
+            wait_for_profile(driver, 5)
         
-        # Extraire les données JSON-LD
-        json_data = extract_json_ld_data(driver)
+        # Extraction déclarative : __NEXT_DATA__, JSON-LD, CSS puis regex (extraction_spec.json)
+        with tracer.span("parse", url=url):
+            page_source = driver.page_source
+            archive_page(url, page_source)  # Actif si TRUSTPILOT_ARCHIVE=<dossier>
+            # Données JSON-LD et __NEXT_DATA__ identiques à un passage précédent : ni extraction ni recherche DOM
+            cached = get_engine().cached_record(page_source, url)
+            if cached is not None:
+                logging.info("♻️ Page inchangée, extraction réutilisée pour %s", url, extra={"url": url})
+                return cached
+            spec_values = get_engine().extract(page_source)
         
-        # Nom de l'entreprise (nettoyer)
-        name_raw = driver.find_element(By.CSS_SELECTOR, "h1").text
-        name = re.sub(r'\s*Reviews\s+[\d,]+.*$', '', name_raw).strip()
-        logging.info(f"Nom de l'entreprise trouvé: {name}")
+        # Nom de l'entreprise
+        name = spec_values.get("name", "")
+        logging.debug("Nom de l'entreprise trouvé: %s", name)
         
         # Note
-        try:
-            rating_element = driver.find_element(By.CSS_SELECTOR, "p[data-rating-typography]")
-            rating = rating_element.text.strip()
-            logging.info(f"Note trouvée: {rating}")
-        except NoSuchElementException:
-            rating = json_data.get('aggregateRating', {}).get('ratingValue', "0")
-            logging.warning(f"Note récupérée depuis JSON-LD: {rating}")
+        rating = spec_values.get("rating", 0)
+        logging.debug("Note trouvée: %s", rating)
         
         # Nombre de reviews
-        try:
-            reviews_element = driver.find_element(By.CSS_SELECTOR, "p[data-reviews-count-typography]")
-            reviews_count = reviews_element.text.replace(" total", "").strip()
-            logging.info(f"Nombre de reviews trouvé: {reviews_count}")
-        except NoSuchElementException:
-            reviews_count = json_data.get('aggregateRating', {}).get('reviewCount', "0")
-            logging.warning(f"Nombre de reviews récupéré depuis JSON-LD: {reviews_count}")
+        reviews_count = spec_values.get("review_count", 0)
+        logging.debug("Nombre de reviews trouvé: %s", reviews_count)
         
-        # Catégorie - Détecter le type d'entreprise
+        # Catégorie - Catégorie principale Trustpilot, sinon détection par le contenu
         try:
-            category = "Non spécifié"
-            page_text = driver.page_source.lower()
+            category = spec_values.get("category")
+            page_text = page_source.lower()
             
-            # Détecter des catégories spécifiques basées sur le contenu
-            if any(word in page_text for word in ['wig store', 'hair extension', 'perruque', 'cheveux postiches', 'hair salon']):
-                category = "Hair & Beauty"
-            elif any(word in page_text for word in ['sneaker', 'basket', 'chaussure de sport', 'running shoes']):
-                category = "Shoe Store"
-            elif any(word in page_text for word in ['jewelry store', 'bijouterie', 'watch store', 'montre de luxe']):
-                category = "Jewelry Store"
-            elif any(word in page_text for word in ['cosmetic store', 'beauty salon', 'makeup store', 'parfumerie']):
-                category = "Beauty Store"
-            else:
-                category = "Clothing Store"  # Par défaut
+            if not category:
+                # Détecter des catégories spécifiques basées sur le contenu
+                if any(word in page_text for word in ['wig store', 'hair extension', 'perruque', 'cheveux postiches', 'hair salon']):
+                    category = "Hair & Beauty"
+                elif any(word in page_text for word in ['sneaker', 'basket', 'chaussure de sport', 'running shoes']):
+                    category = "Shoe Store"
+                elif any(word in page_text for word in ['jewelry store', 'bijouterie', 'watch store', 'montre de luxe']):
+                    category = "Jewelry Store"
+                elif any(word in page_text for word in ['cosmetic store', 'beauty salon', 'makeup store', 'parfumerie']):
+                    category = "Beauty Store"
+                else:
+                    category = "Clothing Store"  # Par défaut
             
-            logging.info(f"Catégorie détectée via contenu: {category}")
-            logging.info(f"Catégorie finale: {category}")
+            logging.debug("Catégorie finale: %s", category)
         except Exception as e:
             category = "Clothing Store"
-            logging.warning(f"Erreur catégorie, utilisation par défaut: {str(e)}")
+            logging.warning("Erreur catégorie, utilisation par défaut: %s", e)
         
         # Site web
         try:
-            website = ""
+            website = spec_values.get("website", "")
             # Chercher le bouton "Visit website"
-            try:
-                visit_elements = driver.find_elements(By.XPATH, "//*[contains(text(), 'Visit website')]")
-                for element in visit_elements:
-                    parent = element.find_element(By.XPATH, "..")
-                    if parent.tag_name == 'a':
-                        href = parent.get_attribute("href")
-                        if href and 'http' in href and not any(social in href.lower() for social in ['facebook', 'twitter', 'instagram', 'linkedin', 'youtube', 'trustpilot.com/review']):
-                            website = href
-                            break
-                    
-                    try:
-                        ancestor_link = element.find_element(By.XPATH, "./ancestor::a")
-                        if ancestor_link:
-                            href = ancestor_link.get_attribute("href")
+            if not website:
+                try:
+                    visit_elements = driver.find_elements(By.XPATH, "//*[contains(text(), 'Visit website')]")
+                    for element in visit_elements:
+                        parent = element.find_element(By.XPATH, "..")
+                        if parent.tag_name == 'a':
+                            href = parent.get_attribute("href")
                             if href and 'http' in href and not any(social in href.lower() for social in ['facebook', 'twitter', 'instagram', 'linkedin', 'youtube', 'trustpilot.com/review']):
                                 website = href
                                 break
-                    except:
-                        pass
+                    
+                        try:
+                            ancestor_link = element.find_element(By.XPATH, "./ancestor::a")
+                            if ancestor_link:
+                                href = ancestor_link.get_attribute("href")
+                                if href and 'http' in href and not any(social in href.lower() for social in ['facebook', 'twitter', 'instagram', 'linkedin', 'youtube', 'trustpilot.com/review']):
+                                    website = href
+                                    break
+                        except:
+                            pass
                 
-                if website:
-                    logging.info(f"Site web trouvé via 'Visit website': {website}")
-            except Exception as e:
-                logging.warning(f"Erreur lors de la recherche 'Visit website': {str(e)}")
+                    if website:
+                        logging.debug("Site web trouvé via 'Visit website': %s", website)
+                except Exception as e:
+                    logging.warning("Erreur lors de la recherche 'Visit website': %s", e)
             
             # Si pas trouvé, chercher tous les liens externes
             if not website:
@@ -163,39 +217,35 @@ def scrape_company_data(driver, url):
                                 break
                     
                     if website:
-                        logging.info(f"Site web trouvé via liens externes: {website}")
+                        logging.debug("Site web trouvé via liens externes: %s", website)
                 except Exception as e:
-                    logging.warning(f"Erreur lors de la recherche de liens externes: {str(e)}")
+                    logging.warning("Erreur lors de la recherche de liens externes: %s", e)
             
-            if not website:
-                website = json_data.get('url', "")
-                if website:
-                    logging.info(f"Site web trouvé via JSON-LD: {website}")
-                    
         except Exception as e:
             website = ""
-            logging.error(f"Erreur générale lors de la recherche du site web: {str(e)}")
+            logging.error("Erreur générale lors de la recherche du site web: %s", e)
         
         # Adresse
         try:
-            address = ""
+            address = full_address(spec_values)
             
             # Chercher les éléments qui contiennent une adresse française
-            try:
-                address_elements = driver.find_elements(By.XPATH, "//*[contains(text(), 'rue') or contains(text(), 'Rue') or contains(text(), 'avenue') or contains(text(), 'Avenue') or contains(text(), 'boulevard') or contains(text(), 'Boulevard')]")
+            if not address:
+                try:
+                    address_elements = driver.find_elements(By.XPATH, "//*[contains(text(), 'rue') or contains(text(), 'Rue') or contains(text(), 'avenue') or contains(text(), 'Avenue') or contains(text(), 'boulevard') or contains(text(), 'Boulevard')]")
                 
-                for element in address_elements:
-                    text = element.text.strip()
-                    if text and 10 < len(text) < 100:
-                        if ',' in text or 'france' in text.lower():
-                            if not any(bad in text.lower() for bad in ['http', '@', 'www.', 'review', 'trustpilot', 'go to', 'looks like']):
-                                address = text
-                                break
+                    for element in address_elements:
+                        text = element.text.strip()
+                        if text and 10 < len(text) < 100:
+                            if ',' in text or 'france' in text.lower():
+                                if not any(bad in text.lower() for bad in ['http', '@', 'www.', 'review', 'trustpilot', 'go to', 'looks like']):
+                                    address = text
+                                    break
                 
-                if address:
-                    logging.info(f"Adresse trouvée: {address}")
-            except Exception as e:
-                logging.warning(f"Erreur: {str(e)}")
+                    if address:
+                        logging.debug("Adresse trouvée: %s", address)
+                except Exception as e:
+                    logging.warning("Erreur: %s", e)
             
             # Si pas trouvé, chercher les codes postaux français
             if not address:
@@ -211,7 +261,7 @@ def scrape_company_data(driver, url):
                                     break
                     
                     if address:
-                        logging.info(f"Adresse trouvée (code postal): {address}")
+                        logging.debug("Adresse trouvée (code postal): %s", address)
                 except:
                     pass
             
@@ -221,193 +271,255 @@ def scrape_company_data(driver, url):
                 
         except Exception as e:
             address = ""
-            logging.error(f"Erreur adresse: {str(e)}")
+            logging.error("Erreur adresse: %s", e)
         
         # Vérifier si l'entreprise est française
         non_french_countries = ['united states', 'usa', 'canada', 'uk', 'united kingdom', 'germany', 'spain', 'italy', 'belgium', 'netherlands']
         
-        if address and any(country in address.lower() for country in non_french_countries):
+        country = spec_values.get("country")
+        if country:
+            is_french = "Oui" if country == "FR" else "Non"
+            logging.debug("Entreprise en France: %s (pays Trustpilot: %s)", is_french, country)
+        elif address and any(country in address.lower() for country in non_french_countries):
             is_french = "Non"
-            logging.info(f"Entreprise rejetée (pays étranger détecté): {address}")
+            logging.debug("Entreprise rejetée (pays étranger détecté): %s", address)
         elif not address or address.strip() == "":
             is_french = "Oui"  # Pas d'adresse = on assume France (filtre du site)
-            logging.info(f"Entreprise en France: Oui (pas d'adresse, filtre FR du site)")
+            logging.debug("Entreprise en France: Oui (pas d'adresse, filtre FR du site)")
         elif "france" in address.lower():
             is_french = "Oui"
-            logging.info(f"Entreprise en France: Oui (France dans l'adresse)")
+            logging.debug("Entreprise en France: Oui (France dans l'adresse)")
         else:
             # Vérifier si l'adresse contient des indicateurs français
             french_indicators = ['paris', 'lyon', 'marseille', 'bordeaux', 'lille', 'toulouse', 'nantes', 'strasbourg', 'montpellier', 'rennes']
             if any(city in address.lower() for city in french_indicators):
                 is_french = "Oui"
-                logging.info(f"Entreprise en France: Oui (ville française détectée: {address})")
+                logging.debug("Entreprise en France: Oui (ville française détectée: %s)", address)
             else:
                 is_french = "Non"
-                logging.info(f"Entreprise en France: Non (adresse sans indicateur français: {address})")
+                logging.debug("Entreprise en France: Non (adresse sans indicateur français: %s)", address)
         
         # Récupérer les pourcentages d'étoiles
         star_percentages = {}
-        try:
-            for i in range(1, 6):
-                try:
-                    percentage = "0%"
-                    
-                    # Chercher directement les éléments qui contiennent "X-star" et un pourcentage
+        distribution = star_distribution(spec_values.get("star_counts"))
+        if distribution:
+            star_percentages = {f"{i}_stars": distribution[i] for i in range(1, 6)}
+            logging.debug("Pourcentages d'étoiles trouvés: %s", distribution)
+        else:
+            try:
+                for i in range(1, 6):
                     try:
-                        star_elements = driver.find_elements(By.XPATH, f"//*[contains(text(), '{i}-star')]")
-                        
-                        for star_element in star_elements:
-                            parent = star_element.find_element(By.XPATH, "..")
-                            parent_text = parent.text
-                            
-                            if "0%" in parent_text:
-                                percentage = "0%"
-                                break
-                            elif "<1%" in parent_text:
-                                percentage = "1%"
-                                break
-                            else:
-                                percent_matches = re.findall(r'(\d+)%', parent_text)
-                                if percent_matches:
-                                    for percent in percent_matches:
-                                        if 0 <= int(percent) <= 100:
-                                            percentage = f"{percent}%"
-                                            break
-                                    if percentage != "0%":
-                                        break
-                        
-                        if percentage != "0%":
-                            logging.info(f"Pourcentage {i} étoiles trouvé: {percentage}")
-                    except Exception as e:
-                        logging.warning(f"Erreur méthode 1 pour {i} étoiles: {str(e)}")
+                        percentage = "0%"
                     
-                    # Si pas trouvé, chercher dans la structure du tableau
-                    if percentage == "0%":
+                        # Chercher directement les éléments qui contiennent "X-star" et un pourcentage
                         try:
-                            table_rows = driver.find_elements(By.XPATH, f"//tr[contains(., '{i}-star')] | //div[contains(@class, 'review') and contains(., '{i}-star')]")
+                            star_elements = driver.find_elements(By.XPATH, f"//*[contains(text(), '{i}-star')]")
+                        
+                            for star_element in star_elements:
+                                parent = star_element.find_element(By.XPATH, "..")
+                                parent_text = parent.text
                             
-                            for row in table_rows:
-                                row_text = row.text
-                                
-                                if "0%" in row_text:
+                                if "0%" in parent_text:
                                     percentage = "0%"
                                     break
-                                elif "<1%" in row_text:
+                                elif "<1%" in parent_text:
                                     percentage = "1%"
                                     break
                                 else:
-                                    percent_match = re.search(r'(\d+)%', row_text)
-                                    if percent_match:
-                                        found_percent = percent_match.group(1)
-                                        if 0 <= int(found_percent) <= 100:
-                                            percentage = f"{found_percent}%"
+                                    percent_matches = re.findall(r'(\d+)%', parent_text)
+                                    if percent_matches:
+                                        for percent in percent_matches:
+                                            if 0 <= int(percent) <= 100:
+                                                percentage = f"{percent}%"
+                                                break
+                                        if percentage != "0%":
                                             break
-                            
+                        
                             if percentage != "0%":
-                                logging.info(f"Pourcentage {i} étoiles trouvé (tableau): {percentage}")
+                                logging.debug("Pourcentage %s étoiles trouvé: %s", i, percentage)
                         except Exception as e:
-                            logging.warning(f"Erreur méthode 2 pour {i} étoiles: {str(e)}")
+                            logging.warning("Erreur méthode 1 pour %s étoiles: %s", i, e)
+                    
+                        # Si pas trouvé, chercher dans la structure du tableau
+                        if percentage == "0%":
+                            try:
+                                table_rows = driver.find_elements(By.XPATH, f"//tr[contains(., '{i}-star')] | //div[contains(@class, 'review') and contains(., '{i}-star')]")
+                            
+                                for row in table_rows:
+                                    row_text = row.text
+                                
+                                    if "0%" in row_text:
+                                        percentage = "0%"
+                                        break
+                                    elif "<1%" in row_text:
+                                        percentage = "1%"
+                                        break
+                                    else:
+                                        percent_match = re.search(r'(\d+)%', row_text)
+                                        if percent_match:
+                                            found_percent = percent_match.group(1)
+                                            if 0 <= int(found_percent) <= 100:
+                                                percentage = f"{found_percent}%"
+                                                break
+                            
+                                if percentage != "0%":
+                                    logging.debug("Pourcentage %s étoiles trouvé (tableau): %s", i, percentage)
+                            except Exception as e:
+                                logging.warning("Erreur méthode 2 pour %s étoiles: %s", i, e)
                     
-                    star_percentages[f"{i}_stars"] = percentage
-                    if percentage == "0%":
-                        logging.info(f"Pourcentage {i} étoiles: 0% (pas de reviews ou non trouvé)")
+                        star_percentages[f"{i}_stars"] = percentage
+                        if percentage == "0%":
+                            logging.debug("Pourcentage %s étoiles: 0%% (pas de reviews ou non trouvé)", i)
                     
-                except Exception as e:
-                    star_percentages[f"{i}_stars"] = "0%"
-                    logging.warning(f"Erreur générale pour pourcentage {i} étoiles: {str(e)}")
+                    except Exception as e:
+                        star_percentages[f"{i}_stars"] = "0%"
+                        logging.warning("Erreur générale pour pourcentage %s étoiles: %s", i, e)
                     
-        except Exception as e:
-            logging.error(f"Erreur générale pour les pourcentages: {str(e)}")
-            for i in range(1, 6):
-                star_percentages[f"{i}_stars"] = "0%"
+            except Exception as e:
+                logging.error("Erreur générale pour les pourcentages: %s", e)
+                for i in range(1, 6):
+                    star_percentages[f"{i}_stars"] = "0%"
         
-        return {
-            "Nom de l'entreprise": name,
-            "Note": rating,
-            "Nombre de reviews": reviews_count,
-            "Catégorie": category,
-            "Site": website,
-            "Adresse": address,
-            "En France": is_french,
-            "Pourcentage 5 étoiles": star_percentages["5_stars"],
-            "Pourcentage 4 étoiles": star_percentages["4_stars"],
-            "Pourcentage 3 étoiles": star_percentages["3_stars"],
-            "Pourcentage 2 étoiles": star_percentages["2_stars"],
-            "Pourcentage 1 étoile": star_percentages["1_stars"]
-        }
+        record = CompanyRecord(
+            url=url,
+            name=name,
+            rating=rating,
+            review_count=reviews_count,
+            category=category,
+            website=website,
+            address=address,
+            in_france=is_french == "Oui",
+            stars={i: star_percentages[f"{i}_stars"] for i in range(1, 6)},
+        )
+        get_engine().remember_record(page_source, record)
+        return record
         
     except Exception as e:
-        logging.error(f"Erreur lors du scraping de {url}: {str(e)}")
-        return None
+        logging.debug("Tentative échouée pour %s: %s", url, e, extra={"url": url})
+        raise
 
-def main():
+def main(redrive=False, budget=None, base_url=BASE_URL, pages_count=105,
+         csv_filename="entreprises_vetements_trustpilot_sequential.csv", requests_per_second=None,
+         listing_filter=None, check_sites=True, normalize=True):
+    configure_logging()
+    if requests_per_second:
+        pacer.rate = requests_per_second
+    deadline = Deadline(budget)  # Fenêtre de crawl en secondes, None = sans limite
+    enable_tracing()  # Actif si TRUSTPILOT_TRACE=<fichier.json>
     logging.info("Démarrage du script de scraping...")
     driver = setup_driver()
-    batch_data = []
+    # Un seul Chrome : le watchdog ne règle pas la concurrence, il surveille sa mémoire
+    watchdog = Watchdog(WorkerLimit(1), max_workers=1).start()
+    watchdog.register_browser(driver)
+    store = CompanyStore()  # Base SQLite indexée (store.py), alimentée par upserts groupés
+    batch_data = CompanyBatch()  # Colonnes typées, vidées dans le CSV toutes les 10 entreprises
+    crawled = CompanyBatch()  # Tout le run, pour le diff entre crawls
     
-    # Créer le CSV avec les en-têtes
-    columns = [
-        "Nom de l'entreprise", "Note", "Nombre de reviews", "Catégorie", "Site", "Adresse", "En France",
-        "Pourcentage 5 étoiles", "Pourcentage 4 étoiles", "Pourcentage 3 étoiles", "Pourcentage 2 étoiles", "Pourcentage 1 étoile"
-    ]
     
     # Créer un nouveau fichier CSV ou continuer l'existant
-    csv_filename = "entreprises_vetements_trustpilot_sequential.csv"
-    
-    # Vérifier si le fichier existe déjà
     try:
         existing_df = pd.read_csv(csv_filename, encoding='utf-8-sig')
         start_count = len(existing_df)
-        logging.info(f"Fichier existant trouvé avec {start_count} entreprises. Continuation...")
+        logging.info("Fichier existant trouvé avec %s entreprises. Continuation...", start_count)
     except FileNotFoundError:
-        pd.DataFrame(columns=columns).to_csv(csv_filename, index=False, encoding='utf-8-sig')
+        pd.DataFrame(columns=CSV_COLUMNS).to_csv(csv_filename, index=False, encoding='utf-8-sig')
         start_count = 0
         logging.info("Nouveau fichier CSV créé avec les en-têtes")
     
-    # URL de base
-    base_url = "https://www.trustpilot.com/categories/clothing_store?country=FR"
-    
     try:
-        # Parcourir toutes les pages
-        for page in range(1, 106):
+        listing_by_page = {}
+        popularity = {}  # Nombre d'avis affiché sur les cartes du listing
+        # Pays, avis, note et domaines connus lus sur les cartes : Chrome n'ouvre que les profils utiles
+        listing_filter = listing_filter or ListingFilter.from_store(store.path)
+        if redrive:
+            # Rejouer uniquement les URLs abandonnées lors des runs précédents
+            listing_by_page[1] = resilience.dead_letters.pending("scraper_fr")
+            pages = [1]
+            logging.info("Relance de %s URLs en lettres mortes", len(listing_by_page[1]))
+        else:
+            # Liens de toutes les pages en HTTP parallèle (__NEXT_DATA__), dans l'ordre du site
+            listings = get_listings(base_url, range(1, pages_count + 1))
+            for page in {record.page for record in listings}:
+                listing_by_page[page] = []  # Page lue en HTTP, même si le filtre en écarte tout
+            for record in listing_filter.filter(listings):
+                listing_by_page[record.page].append(record.url)
+                popularity[record.url] = record.review_count
+            pages = range(1, pages_count + 1)
+        
+        # Collecter les liens de toutes les pages
+        all_company_links = []
+        for page in pages:
             page_url = f"{base_url}&page={page}"
-            logging.info(f"Traitement de la page {page}")
-            
-            company_links = get_company_links_from_page(driver, page_url)
             
-            for company_url in company_links:
-                company_data = scrape_company_data(driver, company_url)
-                if company_data:
-                    # Ignorer les entreprises non-françaises
-                    if company_data['En France'] == "Non":
-                        logging.info(f"❌ Entreprise ignorée (non-française): {company_data['Nom de l\'entreprise']}")
-                        continue
-                    
-                    batch_data.append(company_data)
-                    logging.info(f"✅ Données récupérées pour: {company_data['Nom de l\'entreprise']} (Batch: {len(batch_data)}/10)")
+            # Repli sur Chrome si la page n'a pas pu être lue en HTTP
+            if page in listing_by_page:
+                company_links = listing_by_page[page]
+            else:
+                company_links = listing_filter.filter_urls(get_company_links_from_page(driver, page_url))
+            all_company_links.extend(company_links)
+        
+        # Les entreprises les plus utiles d'abord (ancienneté du crawl × avis × changements), arrêt net à l'échéance
+        frontier = Frontier(all_company_links, popularity=popularity, deadline=deadline)
+        for company_url in frontier:
+            # Chrome fuit la mémoire sur les longs runs : remplacé au-delà du plafond
+            driver = watchdog.recycle(driver, setup_driver)
+            with tracer.span("profile", url=company_url):
+                driver, company_data = scrape_company_data(driver, company_url, watchdog)
+            if company_data:
+                # Ignorer les entreprises non-françaises
+                if not company_data.in_france:
+                    logging.info("❌ Entreprise ignorée (non-française): %s", company_data.name)
+                    # Gardée en base (in_france = 0) : le filtre du listing l'écartera au prochain run
+                    store.add_company(canonical_domain(company_url), company_data)
+                    continue
                 
-                    # Sauvegarder par batch de 10
-                    if len(batch_data) >= 10:
-                        pd.DataFrame(batch_data).to_csv(csv_filename, mode='a', header=False, index=False, encoding='utf-8-sig')
-                        logging.info(f"✅ Batch de {len(batch_data)} entreprises françaises sauvegardé dans le CSV")
-                        batch_data = []
+                batch_data.append(company_data)
+                crawled.append(company_data)
+                store.add_company(canonical_domain(company_url), company_data)
+                logging.info("✅ Données récupérées pour: %s (Batch: %s/10)", company_data.name, len(batch_data), extra={"url": company_url})
+            
+                # Sauvegarder par batch de 10
+                if len(batch_data) >= 10:
+                    with tracer.span("csv_write", rows=len(batch_data)):
+                        append_csv(csv_filename, batch_data)
+                    logging.info("✅ Batch de %s entreprises françaises sauvegardé dans le CSV", len(batch_data))
+                    batch_data.clear()
         
         # Sauvegarder les dernières données restantes
         if batch_data:
-            pd.DataFrame(batch_data).to_csv(csv_filename, mode='a', header=False, index=False, encoding='utf-8-sig')
-            logging.info(f"✅ Dernier batch de {len(batch_data)} entreprises sauvegardé")
+            append_csv(csv_filename, batch_data)
+            logging.info("✅ Dernier batch de %s entreprises sauvegardé", len(batch_data))
+            batch_data.clear()
+        
+        # Émettre uniquement les changements depuis le dernier crawl
+        companies = {canonical_domain(company.url): company for company in crawled}
+        capture_changes({domain: company.to_row(missing=None) for domain, company in companies.items()})
+        # Série temporelle compacte par entreprise (note, avis, étoiles) pour les requêtes de tendance
+        HistoryStore().ingest(companies)
+        if check_sites:
+            # Sites web résolus (redirections, domaine final, statut) sans second passage
+            check_websites({domain: company.website for domain, company in companies.items()}, store)
+        if normalize:
+            # CSV typé et dédoublonné (reprises de crawl, relances) à côté du CSV brut
+            normalize_csv(csv_filename)
+        resilience.dead_letters.compact()
+        logging.info("URLs en lettres mortes: %s (relancer avec --redrive)", len(resilience.dead_letters.pending("scraper_fr")))
         
         logging.info("Script terminé avec succès!")
         
     except Exception as e:
         # Sauvegarder les données en cours en cas d'erreur
         if batch_data:
-            pd.DataFrame(batch_data).to_csv(csv_filename, mode='a', header=False, index=False, encoding='utf-8-sig')
-            logging.info(f"Sauvegarde d'urgence de {len(batch_data)} entreprises")
-        logging.error(f"Erreur générale: {str(e)}")
+            append_csv(csv_filename, batch_data)
+            logging.info("Sauvegarde d'urgence de %s entreprises", len(batch_data))
+        logging.error("Erreur générale: %s", e)
     finally:
+        watchdog.stop()
+        store.close()
         driver.quit()
         logging.info("Script terminé.")
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    # python scraper_fr.py [--redrive] [--budget 2h]
+    budget = sys.argv[sys.argv.index("--budget") + 1] if "--budget" in sys.argv else None
+    main(redrive="--redrive" in sys.argv, budget=parse_duration(budget) if budget else None) 
\ No newline at end of file
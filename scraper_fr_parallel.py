@@ -1,8 +1,4 @@
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import TimeoutException, NoSuchElementException
+# selenium est importé dans les fonctions qui pilotent Chrome : le backend playwright s'en passe
 import pandas as pd
 import time
 import re
@@ -13,14 +9,50 @@ from concurrent.futures import ThreadPoolExecutor, as_completed
 import threading
 from queue import Queue
 import os
+import sys
+import asyncio
 
-# Configuration du logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+from archive import archive_page
+from change_capture import capture_changes
+from chrome_profile import ProfileTemplate
+from domains import canonical_domain
+from egress import EgressPool, chrome_arguments
+from extraction_spec import full_address, get_engine, star_distribution
+from frontier import Deadline, Frontier, parse_duration
+from history import HistoryStore
+from listing_extractor import BASE_URL, get_listings
+from log_setup import configure_logging
+from normalize import normalize_csv
+from prefilter import ListingFilter
+from rate_limiter import RateLimiter
+from records import CSV_COLUMNS, CompanyBatch, CompanyRecord, append_csv
+from resilience import Resilience
+from resource_watchdog import Watchdog, WorkerLimit, default_max_workers
+from site_check import check_websites
+from store import CompanyStore
+from tracing import enable_tracing, tracer
+
+# Résultat des tâches non lancées car la fenêtre de crawl est écoulée
+DEADLINE_REACHED = object()
 
 # Lock pour l'écriture du CSV
 csv_lock = threading.Lock()
 
-def setup_driver():
+# Cadence des pages de listing (repli Chrome) : on n'attend que si le budget est épuisé
+pacer = RateLimiter(rate=10, burst=10)
+
+# Sorties réseau des profils (egress.json), chacune avec sa cadence ; direct par défaut
+egress = EgressPool.from_config(rate=10, burst=10)
+
+# Retry par classe d'erreur, disjoncteur par hôte, URLs abandonnées en lettres mortes
+resilience = Resilience("scraper_fr_parallel")
+
+# Profils clonés d'un modèle au cache HTTP déjà chaud (JS, CSS, polices de cdn.trustpilot.net)
+profiles = ProfileTemplate()
+
+def setup_driver(exit_=None):
+    from selenium import webdriver
+    from readiness import setup_readiness_options
     logging.info("Configuration du driver Chrome...")
     options = webdriver.ChromeOptions()
     options.add_argument('--headless')
@@ -30,130 +62,210 @@ def setup_driver():
     options.add_argument('--disable-dev-shm-usage')
     options.add_argument('--no-first-run')
     options.add_argument('--disable-extensions')
-    return webdriver.Chrome(options=options)
-
-def extract_json_ld_data(driver):
-    """Extraire les données du JSON-LD"""
-    try:
-        json_scripts = driver.find_elements(By.CSS_SELECTOR, "script[type='application/ld+json']")
-        for script in json_scripts:
-            try:
-                data = json.loads(script.get_attribute('innerHTML'))
-                if isinstance(data, dict):
-                    return data
-                elif isinstance(data, list) and len(data) > 0:
-                    return data[0]
-            except json.JSONDecodeError:
-                continue
-    except:
-        pass
-    return {}
+    if exit_ is not None:
+        for argument in chrome_arguments(exit_):
+            options.add_argument(argument)
+    # Un profil par driver (pas de verrou partagé), cloné du modèle au cache déjà chaud ;
+    # le driver sert ensuite à tout un worker (DriverPool), le clone n'est fait qu'à son lancement
+    profile_dir = profiles.clone()
+    for argument in profiles.chrome_arguments(profile_dir):
+        options.add_argument(argument)
+    setup_readiness_options(options)
+    driver = webdriver.Chrome(options=options)
+    profiles.attach(driver, profile_dir)
+    return driver
 
 def get_company_links_from_page(driver, page_url):
+    from selenium.webdriver.common.by import By
+    from readiness import navigate, wait_for_listing
     try:
-        driver.get(page_url)
-        time.sleep(0.3)  # Réduit encore plus pour la parallélisation
-        company_links = set()
+        with tracer.span("pace", url=page_url):
+            pacer.acquire()
+        with tracer.span("navigate", url=page_url):
+            navigate(driver, page_url)
+        company_links = []  # Liste pour conserver l'ordre d'affichage
         
-        WebDriverWait(driver, 2).until(  # Réduit à 2 secondes
-            EC.presence_of_element_located((By.CSS_SELECTOR, "a[href*='/review/']"))
-        )
+        with tracer.span("wait", url=page_url):
+            wait_for_listing(driver, 2)
         
         links = driver.find_elements(By.CSS_SELECTOR, "a[href*='/review/']")
         for link in links:
             href = link.get_attribute("href")
-            if href and "trustpilot.com/review/" in href:
-                company_links.add(href)
+            if href and "trustpilot.com/review/" in href and href not in company_links:
+                company_links.append(href)
         
-        logging.info(f"Nombre d'entreprises trouvées sur la page: {len(company_links)}")
-        return list(company_links)
+        logging.info("Nombre d'entreprises trouvées sur la page: %s", len(company_links))
+        return company_links
     except Exception as e:
-        logging.error(f"Erreur lors de la récupération des liens sur {page_url}: {str(e)}")
+        logging.error("Erreur lors de la récupération des liens sur %s: %s", page_url, e)
         return []
 
-def scrape_company_data(url):
-    """Version thread-safe du scraping d'une entreprise"""
+class DriverPool:
+    """Drivers Chrome réutilisés d'une entreprise à l'autre au lieu d'un par URL.
+
+    Lancer Chrome et cloner son profil coûte plus cher que charger la page :
+    un worker emprunte un driver libre et le rend ensuite. Un driver garde la
+    sortie réseau de son lancement (Chrome prend le proxy au démarrage), donc
+    checkout() cherche un driver libre sur la sortie choisie et n'en lance un
+    nouveau que s'il n'y en a pas. Un driver en échec, signalé par le watchdog
+    (mémoire) ou en trop par rapport à la limite de workers est fermé au retour.
+    """
+
+    def __init__(self, limit=None, watchdog=None):
+        self.limit = limit
+        self.watchdog = watchdog
+        self.idle = []  # (sortie, driver)
+        self.started = 0
+        self._lock = threading.Lock()
+
+    def checkout(self, exit_):
+        while True:
+            driver = None
+            with self._lock:
+                for index, (idle_exit, idle_driver) in enumerate(self.idle):
+                    if idle_exit is exit_:
+                        del self.idle[index]
+                        driver = idle_driver
+                        break
+            if driver is None:
+                break
+            if not (self.watchdog and self.watchdog.should_recycle(driver)):
+                return driver
+            # Signalé ou tué par le watchdog pendant qu'il attendait : remplacé avant usage
+            self.discard(driver)
+        driver = setup_driver(exit_)
+        with self._lock:
+            self.started += 1
+        if self.watchdog:
+            # Le watchdog tue le Chrome s'il dépasse deux fois le plafond mémoire
+            self.watchdog.register_browser(driver, exit_.name)
+        return driver
+
+    def checkin(self, exit_, driver):
+        with self._lock:
+            keep = (
+                not (self.watchdog and self.watchdog.should_recycle(driver))
+                and (self.limit is None or len(self.idle) < self.limit.limit)
+            )
+            if keep:
+                self.idle.append((exit_, driver))
+                return
+        self.discard(driver)
+
+    def discard(self, driver):
+        if self.watchdog:
+            self.watchdog.unregister_browser(driver)
+        try:
+            driver.quit()
+        except Exception as e:
+            logging.debug("Fermeture du driver impossible: %s", e)
+
+    def close(self):
+        with self._lock:
+            idle, self.idle = self.idle, []
+        for _, driver in idle:
+            self.discard(driver)
+        logging.info("🧭 Drivers Chrome lancés pour le run: %s", self.started)
+
+def scrape_company_data(url, drivers):
+    """Version thread-safe du scraping d'une entreprise, avec retry et lettres mortes"""
+    return resilience.call(url, _scrape_company_data_once, url, drivers)
+
+def _scrape_company_data_once(url, drivers):
+    """Une tentative : les exceptions remontent pour être classées par la politique de retry"""
+    from selenium.webdriver.common.by import By
+    from readiness import navigate, wait_for_profile
     driver = None
     try:
-        driver = setup_driver()
-        logging.info(f"Worker - Tentative de scraping pour l'URL: {url}")
-        driver.get(url)
-        time.sleep(0.3)  # Réduit pour la parallélisation
-        
-        WebDriverWait(driver, 2).until(  # Réduit à 2 secondes
-            EC.presence_of_element_located((By.CSS_SELECTOR, "h1"))
-        )
-        
-        # Extraire les données JSON-LD
-        json_data = extract_json_ld_data(driver)
-        
-        # Récupérer les données de base - NETTOYER LE NOM
-        name_raw = driver.find_element(By.CSS_SELECTOR, "h1").text
-        name = re.sub(r'\s*Reviews\s+[\d,]+.*$', '', name_raw).strip()
-        
-        # Note de l'entreprise sur 5
+        # La sortie est choisie avant le démarrage : Chrome prend le proxy au lancement
+        with tracer.span("pace", url=url):
+            exit_ = egress.acquire()
+        with tracer.span("driver_start", url=url):
+            driver = drivers.checkout(exit_)
+        logging.debug("Worker - Tentative de scraping pour l'URL: %s via %s", url, exit_.name, extra={"url": url})
+        started = time.monotonic()
         try:
-            rating_element = driver.find_element(By.CSS_SELECTOR, "p[data-rating-typography]")
-            rating = rating_element.text.strip()
-        except NoSuchElementException:
-            rating = json_data.get('aggregateRating', {}).get('ratingValue', "0")
+            with tracer.span("navigate", url=url, exit=exit_.name):
+                navigate(driver, url)
+            
+            with tracer.span("wait", url=url):
+                wait_for_profile(driver, 2)
+        except Exception as e:
+            egress.record(exit_, time.monotonic() - started, e)
+            raise
+        egress.record(exit_, time.monotonic() - started)
         
-        # Nombre de reviews
-        try:
-            reviews_element = driver.find_element(By.CSS_SELECTOR, "p[data-reviews-count-typography]")
-            reviews_count = reviews_element.text.replace(" total", "").strip()
-        except NoSuchElementException:
-            reviews_count = json_data.get('aggregateRating', {}).get('reviewCount', "0")
+        # Extraction déclarative : __NEXT_DATA__, JSON-LD, CSS puis regex (extraction_spec.json)
+        with tracer.span("parse", url=url):
+            page_source = driver.page_source
+            archive_page(url, page_source)  # Actif si TRUSTPILOT_ARCHIVE=<dossier>
+            # Données JSON-LD et __NEXT_DATA__ identiques à un passage précédent : ni extraction ni recherche DOM
+            cached = get_engine().cached_record(page_source, url)
+            if cached is not None:
+                logging.info("♻️ Worker - page inchangée, extraction réutilisée pour %s", url, extra={"url": url})
+                return cached
+            spec_values = get_engine().extract(page_source)
         
-        # Catégorie - Version simplifiée pour la parallélisation
-        category = "Clothing Store"  # Par défaut puisqu'on est sur cette catégorie
-        try:
-            page_text = driver.page_source.lower()
-            if any(word in page_text for word in ['jewelry store', 'bijouterie']):
-                category = "Jewelry Store"
-            elif any(word in page_text for word in ['shoe store', 'chaussure']):
-                category = "Shoe Store"
-            elif any(word in page_text for word in ['beauty', 'cosmetic']):
-                category = "Beauty Store"
-        except:
-            pass
+        name = spec_values.get("name", "")
+        rating = spec_values.get("rating", 0)
+        reviews_count = spec_values.get("review_count", 0)
+        
+        # Catégorie principale Trustpilot, sinon version simplifiée pour la parallélisation
+        category = spec_values.get("category")
+        if not category:
+            category = "Clothing Store"  # Par défaut puisqu'on est sur cette catégorie
+            try:
+                page_text = page_source.lower()
+                if any(word in page_text for word in ['jewelry store', 'bijouterie']):
+                    category = "Jewelry Store"
+                elif any(word in page_text for word in ['shoe store', 'chaussure']):
+                    category = "Shoe Store"
+                elif any(word in page_text for word in ['beauty', 'cosmetic']):
+                    category = "Beauty Store"
+            except:
+                pass
         
         # Site de l'entreprise - Version simplifiée
-        website = ""
+        website = spec_values.get("website", "")
         try:
-            visit_elements = driver.find_elements(By.XPATH, "//*[contains(text(), 'Visit website')]")
-            for element in visit_elements:
-                try:
-                    parent = element.find_element(By.XPATH, "..")
-                    if parent.tag_name == 'a':
-                        href = parent.get_attribute("href")
-                        if href and 'http' in href and not any(social in href.lower() for social in ['facebook', 'twitter', 'instagram', 'linkedin', 'youtube', 'trustpilot.com/review']):
-                            website = href
-                            break
-                except:
-                    continue
+            if not website:
+                visit_elements = driver.find_elements(By.XPATH, "//*[contains(text(), 'Visit website')]")
+                for element in visit_elements:
+                    try:
+                        parent = element.find_element(By.XPATH, "..")
+                        if parent.tag_name == 'a':
+                            href = parent.get_attribute("href")
+                            if href and 'http' in href and not any(social in href.lower() for social in ['facebook', 'twitter', 'instagram', 'linkedin', 'youtube', 'trustpilot.com/review']):
+                                website = href
+                                break
+                    except:
+                        continue
         except:
             pass
         
         # Adresse - Version ultra-simplifiée pour la parallélisation
-        address = ""
+        address = full_address(spec_values)
         try:
-            address_elements = driver.find_elements(By.XPATH, "//*[contains(text(), 'rue') or contains(text(), 'Rue') or contains(text(), 'avenue') or contains(text(), 'Avenue')]")
+            if not address:
+                address_elements = driver.find_elements(By.XPATH, "//*[contains(text(), 'rue') or contains(text(), 'Rue') or contains(text(), 'avenue') or contains(text(), 'Avenue')]")
             
-            for element in address_elements:
-                text = element.text.strip()
-                if text and 10 < len(text) < 100:
-                    if ',' in text or 'france' in text.lower():
-                        if not any(bad in text.lower() for bad in ['http', '@', 'www.', 'review', 'trustpilot', 'go to', 'looks like']):
-                            address = text
-                            break
+                for element in address_elements:
+                    text = element.text.strip()
+                    if text and 10 < len(text) < 100:
+                        if ',' in text or 'france' in text.lower():
+                            if not any(bad in text.lower() for bad in ['http', '@', 'www.', 'review', 'trustpilot', 'go to', 'looks like']):
+                                address = text
+                                break
         except:
             pass
         
         # Vérifier si l'entreprise est française - Logique stricte
         non_french_countries = ['united states', 'usa', 'canada', 'uk', 'united kingdom', 'germany', 'spain', 'italy', 'belgium', 'netherlands']
         
-        if address and any(country in address.lower() for country in non_french_countries):
+        country = spec_values.get("country")
+        if country:
+            is_french = "Oui" if country == "FR" else "Non"
+        elif address and any(country in address.lower() for country in non_french_countries):
             is_french = "Non"
         elif not address or address.strip() == "":
             is_french = "Oui"
@@ -168,149 +280,231 @@ def scrape_company_data(url):
         
         # Pourcentages d'étoiles - Version simplifiée pour la parallélisation
         star_percentages = {}
-        try:
-            for i in range(1, 6):
-                percentage = "0%"
-                try:
-                    star_elements = driver.find_elements(By.XPATH, f"//*[contains(text(), '{i}-star')]")
+        distribution = star_distribution(spec_values.get("star_counts"))
+        if distribution:
+            star_percentages = {f"{i}_stars": distribution[i] for i in range(1, 6)}
+        else:
+            try:
+                for i in range(1, 6):
+                    percentage = "0%"
+                    try:
+                        star_elements = driver.find_elements(By.XPATH, f"//*[contains(text(), '{i}-star')]")
                     
-                    for star_element in star_elements:
-                        parent = star_element.find_element(By.XPATH, "..")
-                        parent_text = parent.text
+                        for star_element in star_elements:
+                            parent = star_element.find_element(By.XPATH, "..")
+                            parent_text = parent.text
                         
-                        if "0%" in parent_text:
-                            percentage = "0%"
-                            break
-                        elif "<1%" in parent_text:
-                            percentage = "1%"
-                            break
-                        else:
-                            percent_matches = re.findall(r'(\d+)%', parent_text)
-                            if percent_matches:
-                                for percent in percent_matches:
-                                    if 0 <= int(percent) <= 100:
-                                        percentage = f"{percent}%"
+                            if "0%" in parent_text:
+                                percentage = "0%"
+                                break
+                            elif "<1%" in parent_text:
+                                percentage = "1%"
+                                break
+                            else:
+                                percent_matches = re.findall(r'(\d+)%', parent_text)
+                                if percent_matches:
+                                    for percent in percent_matches:
+                                        if 0 <= int(percent) <= 100:
+                                            percentage = f"{percent}%"
+                                            break
+                                    if percentage != "0%":
                                         break
-                                if percentage != "0%":
-                                    break
-                except:
-                    pass
+                    except:
+                        pass
                 
-                star_percentages[f"{i}_stars"] = percentage
-        except:
-            for i in range(1, 6):
-                star_percentages[f"{i}_stars"] = "0%"
+                    star_percentages[f"{i}_stars"] = percentage
+            except:
+                for i in range(1, 6):
+                    star_percentages[f"{i}_stars"] = "0%"
         
-        result = {
-            "Nom de l'entreprise": name,
-            "Note": rating,
-            "Nombre de reviews": reviews_count,
-            "Catégorie": category,
-            "Site": website,
-            "Adresse": address,
-            "En France": is_french,
-            "Pourcentage 5 étoiles": star_percentages["5_stars"],
-            "Pourcentage 4 étoiles": star_percentages["4_stars"],
-            "Pourcentage 3 étoiles": star_percentages["3_stars"],
-            "Pourcentage 2 étoiles": star_percentages["2_stars"],
-            "Pourcentage 1 étoile": star_percentages["1_stars"]
-        }
+        result = CompanyRecord(
+            url=url,
+            name=name,
+            rating=rating,
+            review_count=reviews_count,
+            category=category,
+            website=website,
+            address=address,
+            in_france=is_french == "Oui",
+            stars={i: star_percentages[f"{i}_stars"] for i in range(1, 6)},
+        )
         
-        logging.info(f"✅ Worker terminé pour: {name}")
+        get_engine().remember_record(page_source, result)
+        logging.info("✅ Worker terminé pour: %s", name, extra={"url": url})
         return result
         
     except Exception as e:
-        logging.error(f"❌ Erreur lors du scraping de {url}: {str(e)}")
-        return None
+        logging.debug("Tentative échouée pour %s: %s", url, e, extra={"url": url})
+        if driver is not None:
+            # Session peut-être morte (watchdog, plantage) : jamais rendue au pool
+            drivers.discard(driver)
+            driver = None
+        raise
     finally:
-        if driver:
-            driver.quit()
+        if driver is not None:
+            drivers.checkin(exit_, driver)
 
 def save_company_data(company_data, csv_file):
     """Sauvegarde thread-safe d'une entreprise"""
-    with csv_lock:
-        try:
-            # Vérifier si le fichier existe
-            file_exists = os.path.exists(csv_file)
-            
-            df = pd.DataFrame([company_data])
-            df.to_csv(csv_file, mode='a', header=not file_exists, index=False, encoding='utf-8-sig')
-            logging.info(f"💾 Sauvegardé: {company_data['Nom de l\'entreprise']}")
-        except Exception as e:
-            logging.error(f"❌ Erreur sauvegarde: {str(e)}")
+    # Attente du verrou mesurée à part pour voir la contention dans la trace
+    with tracer.span("csv_lock_wait"):
+        csv_lock.acquire()
+    try:
+        with tracer.span("csv_write"):
+            # En-tête écrit seulement si le fichier n'existe pas encore
+            append_csv(csv_file, [company_data])
+        logging.debug("💾 Sauvegardé: %s", company_data.name)
+    except Exception as e:
+        logging.error("❌ Erreur sauvegarde: %s", e)
+    finally:
+        csv_lock.release()
 
-def main():
-    logging.info("🚀 Démarrage du script de scraping PARALLÈLE...")
+def main(backend="selenium", max_pages=50, redrive=False, max_workers=None, budget=None,
+         base_url=BASE_URL, pages_count=105, csv_file="entreprises_vetements_trustpilot.csv",
+         listing_filter=None, check_sites=True, normalize=True):
+    configure_logging()
+    deadline = Deadline(budget)  # Fenêtre de crawl en secondes, None = sans limite
+    enable_tracing()  # Actif si TRUSTPILOT_TRACE=<fichier.json>
+    logging.info("🚀 Démarrage du script de scraping PARALLÈLE (backend: %s)...", backend)
     
     # Créer le CSV avec les en-têtes
-    columns = [
-        "Nom de l'entreprise", "Note", "Nombre de reviews", "Catégorie", "Site", "Adresse", "En France",
-        "Pourcentage 5 étoiles", "Pourcentage 4 étoiles", "Pourcentage 3 étoiles", "Pourcentage 2 étoiles", "Pourcentage 1 étoile"
-    ]
-    csv_file = "entreprises_vetements_trustpilot.csv"
-    pd.DataFrame(columns=columns).to_csv(csv_file, index=False, encoding='utf-8-sig')
-    logging.info("📄 Fichier CSV créé avec les en-têtes")
+    if not (redrive and os.path.exists(csv_file)):
+        pd.DataFrame(columns=CSV_COLUMNS).to_csv(csv_file, index=False, encoding='utf-8-sig')
+        logging.info("📄 Fichier CSV créé avec les en-têtes")
     
-    # URL de base
-    base_url = "https://www.trustpilot.com/categories/clothing_store?country=FR"
-    
-    # Driver principal pour récupérer les liens
-    main_driver = setup_driver()
+    # Driver principal pour le repli Chrome des listings, lancé seulement si ce repli sert
+    main_driver = None
+    # Base SQLite indexée (store.py), alimentée par upserts groupés
+    store = CompanyStore()
+    # Pays, avis, note et domaines connus lus sur les cartes : Chrome n'ouvre que les profils utiles
+    listing_filter = listing_filter or ListingFilter.from_store(store.path)
     
     try:
-        # Récupérer tous les liens d'entreprises de toutes les pages
-        all_company_links = []
+        if redrive:
+            # Rejouer uniquement les URLs abandonnées lors des runs précédents
+            all_company_links = resilience.dead_letters.pending("scraper_fr_parallel")
+            logging.info("♻️ Relance de %s URLs en lettres mortes", len(all_company_links))
+        else:
+            # Récupérer tous les liens en HTTP parallèle (__NEXT_DATA__), dans l'ordre du site
+            listings = get_listings(base_url, range(1, pages_count + 1))
+            fetched_pages = {record.page for record in listings}
+            listings = listing_filter.filter(listings)
+            all_company_links = [record.url for record in listings]
         
-        for page in range(1, 106):  # 105 pages
-            page_url = f"{base_url}&page={page}"
-            logging.info(f"📄 Récupération des liens - Page {page}")
+        # Repli sur Chrome page par page, pour chaque page que l'extraction HTTP n'a pas pu lire
+        missing_pages = [] if redrive else [page for page in range(1, pages_count + 1) if page not in fetched_pages]
+        if missing_pages:
+            logging.info("📄 %s pages de listing non lues en HTTP, repli sur Chrome", len(missing_pages))
+            main_driver = setup_driver()
+            for count, page in enumerate(missing_pages, 1):
+                page_url = f"{base_url}&page={page}"
+                logging.info("📄 Récupération des liens - Page %s", page)
             
-            company_links = get_company_links_from_page(main_driver, page_url)
-            all_company_links.extend(company_links)
+                company_links = listing_filter.filter_urls(get_company_links_from_page(main_driver, page_url))
+                all_company_links.extend(company_links)
             
-            if page % 10 == 0:
-                logging.info(f"📊 Total de liens récupérés: {len(all_company_links)}")
+                if count % 10 == 0:
+                    logging.info("📊 Total de liens récupérés: %s", len(all_company_links))
         
-        logging.info(f"🎯 Total final de liens: {len(all_company_links)}")
+        logging.info("🎯 Total final de liens: %s", len(all_company_links))
+        
+        # Les entreprises les plus utiles d'abord (ancienneté du crawl × avis × changements)
+        popularity = {} if redrive else {record.url: record.review_count for record in listings}
+        all_company_links = Frontier(all_company_links, popularity=popularity, deadline=deadline).ordered()
         
-        # Traitement parallèle avec pool de 10 workers
         processed_count = 0
         french_count = 0
+        skipped_count = 0
+        crawled = CompanyBatch()  # Colonnes typées de tout le run, pour le diff entre crawls
         
-        with ThreadPoolExecutor(max_workers=10) as executor:
-            # Soumettre toutes les tâches
-            future_to_url = {executor.submit(scrape_company_data, url): url for url in all_company_links}
+        def handle_result(url, company_data):
+            nonlocal processed_count, french_count
+            processed_count += 1
             
-            # Traiter les résultats dès qu'ils arrivent
-            for future in as_completed(future_to_url):
-                url = future_to_url[future]
-                try:
-                    company_data = future.result()
-                    processed_count += 1
-                    
-                    if company_data:
-                        if company_data['En France'] == "Oui":
-                            # Sauvegarder immédiatement les entreprises françaises
-                            save_company_data(company_data, csv_file)
-                            french_count += 1
-                            logging.info(f"🇫🇷 Entreprises françaises: {french_count} | Total traité: {processed_count}/{len(all_company_links)}")
-                        else:
-                            logging.info(f"❌ Ignorée (non-française): {company_data['Nom de l\'entreprise']}")
-                    
-                    # Log de progression toutes les 50 entreprises
-                    if processed_count % 50 == 0:
-                        logging.info(f"📊 PROGRESSION: {processed_count}/{len(all_company_links)} ({processed_count/len(all_company_links)*100:.1f}%) - Françaises: {french_count}")
-                        
-                except Exception as e:
-                    logging.error(f"❌ Erreur pour {url}: {str(e)}")
+            if company_data:
+                if company_data.in_france:
+                    # Sauvegarder immédiatement les entreprises françaises
+                    save_company_data(company_data, csv_file)
+                    crawled.append(company_data)
+                    store.add_company(canonical_domain(url), company_data)
+                    french_count += 1
+                    logging.info("🇫🇷 Entreprises françaises: %s | Total traité: %s/%s", french_count, processed_count, len(all_company_links), extra={"url": url, "sample": "progress"})
+                else:
+                    logging.info("❌ Ignorée (non-française): %s", company_data.name, extra={"url": url})
+                    # Gardée en base (in_france = 0) : le filtre du listing l'écartera au prochain run
+                    store.add_company(canonical_domain(url), company_data)
+            
+            # Log de progression toutes les 50 entreprises
+            if processed_count % 50 == 0:
+                logging.info("📊 PROGRESSION: %s/%s (%.1f%%) - Françaises: %s", processed_count, len(all_company_links), processed_count/len(all_company_links)*100, french_count)
+        
+        if backend == "playwright":
+            # Un seul Chromium, un contexte isolé par page (import paresseux : dépendance optionnelle)
+            from browser_async import scrape_companies
+            asyncio.run(scrape_companies(all_company_links, handle_result, max_pages=max_pages, resilience=resilience, deadline=deadline))
+        else:
+            # Pool dimensionné selon la machine ; le watchdog ajuste le nombre de Chrome actifs
+            max_workers = max_workers or default_max_workers(per_worker_mb=300)
+            limit = WorkerLimit(max(1, max_workers // 2))
+            watchdog = Watchdog(limit, max_workers=max_workers).start()
+            # Un Chrome par worker actif, réutilisé de profil en profil
+            drivers = DriverPool(limit, watchdog)
+            
+            def scrape_limited(url):
+                with limit.slot():
+                    # Échéance passée : les tâches restantes se terminent sans rien charger
+                    if deadline.expired():
+                        return DEADLINE_REACHED
+                    return scrape_company_data(url, drivers)
+            
+            try:
+                with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                    # Soumettre toutes les tâches
+                    future_to_url = {executor.submit(scrape_limited, url): url for url in all_company_links}
+                
+                    # Traiter les résultats dès qu'ils arrivent
+                    for future in as_completed(future_to_url):
+                        url = future_to_url[future]
+                        try:
+                            company_data = future.result()
+                            if company_data is DEADLINE_REACHED:
+                                skipped_count += 1
+                                continue
+                            with tracer.span("handle_result", url=url):
+                                handle_result(url, company_data)
+                        except Exception as e:
+                            logging.error("❌ Erreur pour %s: %s", url, e)
+            finally:
+                drivers.close()
+            watchdog.stop()
+            if skipped_count:
+                logging.warning("⏰ Échéance atteinte: %s entreprises reportées au prochain run", skipped_count)
+        
+        # Émettre uniquement les changements depuis le dernier crawl
+        companies = {canonical_domain(company.url): company for company in crawled}
+        capture_changes({domain: company.to_row(missing=None) for domain, company in companies.items()})
+        # Série temporelle compacte par entreprise (note, avis, étoiles) pour les requêtes de tendance
+        HistoryStore().ingest(companies)
+        if check_sites:
+            # Sites web résolus (redirections, domaine final, statut) sans second passage
+            check_websites({domain: company.website for domain, company in companies.items()}, store)
+        if normalize:
+            # CSV typé et dédoublonné (reprises de crawl, relances) à côté du CSV brut
+            normalize_csv(csv_file)
+        resilience.dead_letters.compact()
         
-        logging.info(f"🎉 Script terminé! Entreprises françaises sauvegardées: {french_count}")
+        logging.info("🎉 Script terminé! Entreprises françaises sauvegardées: %s", french_count)
+        logging.info("📮 URLs en lettres mortes: %s (relancer avec --redrive)", len(resilience.dead_letters.pending("scraper_fr_parallel")))
         
     except Exception as e:
-        logging.error(f"❌ Erreur générale: {str(e)}")
+        logging.error("❌ Erreur générale: %s", e)
     finally:
-        main_driver.quit()
+        store.close()
+        if main_driver is not None:
+            main_driver.quit()
         logging.info("🏁 Script terminé.")
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    # python scraper_fr_parallel.py [--redrive] [--budget 2h]
+    budget = sys.argv[sys.argv.index("--budget") + 1] if "--budget" in sys.argv else None
+    main(redrive="--redrive" in sys.argv, budget=parse_duration(budget) if budget else None) 
\ No newline at end of file
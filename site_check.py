@@ -0,0 +1,246 @@
+import argparse
+import asyncio
+import logging
+import time
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+from urllib.parse import parse_qsl, urlencode, urlparse, urlunparse
+
+import aiohttp
+from aiohttp import ClientTimeout
+from yarl import URL
+
+from domains import canonical_domain
+from log_setup import configure_logging
+from rate_limiter import RateLimiter
+from store import DB_PATH, CompanyStore
+
+# Paramètres qui portent la vraie destination dans les liens de suivi
+REDIRECT_PARAMS = ("url", "u", "target", "redirect", "redirect_url", "dest", "destination", "to", "link")
+TRACKING_PARAMS = ("gclid", "fbclid", "msclkid", "mc_cid", "mc_eid", "_ga")
+REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+MAX_REDIRECTS = 10
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36"
+
+
+def clean_website(value: Optional[str]) -> Optional[str]:
+    """The company URL behind a 'Site' value: tracking wrappers unwrapped, utm_* dropped.
+
+    'https://track.example/click?url=https%3A%2F%2Fshop.fr%2F%3Futm_source%3Dtp'
+    -> 'https://shop.fr/'. None for empty values and Trustpilot's own pages.
+    """
+    url = (value or "").strip()
+    if not url:
+        return None
+    if "://" not in url:
+        url = f"https://{url}"
+    for _ in range(3):  # Redirections de suivi imbriquées
+        params = dict(parse_qsl(urlparse(url).query))
+        inner = next(
+            (params[key] for key in REDIRECT_PARAMS if params.get(key, "").startswith(("http://", "https://"))),
+            None,
+        )
+        if inner is None:
+            break
+        url = inner
+    parsed = urlparse(url)
+    if not parsed.hostname or parsed.hostname.endswith("trustpilot.com"):
+        return None
+    query = [
+        (key, value)
+        for key, value in parse_qsl(parsed.query, keep_blank_values=True)
+        if not key.startswith("utm_") and key not in TRACKING_PARAMS
+    ]
+    return urlunparse(parsed._replace(path=parsed.path or "/", query=urlencode(query), fragment=""))
+
+
+@dataclass
+class SiteCheck:
+    domain: str  # Clé de l'entreprise dans le store
+    website: Optional[str]  # Valeur 'Site' d'origine
+    final_url: Optional[str] = None
+    site_domain: Optional[str] = None  # Domaine canonique après redirections
+    status: Optional[int] = None
+    live: bool = False
+    latency: Optional[float] = None
+    redirects: int = 0
+    error: Optional[str] = None
+    checked_at: str = field(default_factory=lambda: datetime.now().isoformat(timespec="seconds"))
+
+    def to_row(self) -> dict:
+        row = asdict(self)
+        del row["redirects"]
+        row["live"] = int(self.live)
+        return row
+
+
+class SiteChecker:
+    """Resolve company websites through their redirects and check they answer.
+
+    One pooled aiohttp session with at most concurrency requests in flight,
+    and per-host politeness: requests to the same host are paced at
+    per_host_rate by their own RateLimiter (link shorteners and trackers are
+    shared by many companies), redirect hops included. Only response headers
+    are read. Identical URLs
+    are checked once per ttl, concurrent duplicates share one request.
+    A site is live if it answers anything but a 5xx, 404 or 410: a 403 from
+    a bot shield still means the site exists.
+    """
+
+    def __init__(
+        self,
+        concurrency: int = 50,
+        per_host_rate: float = 1.0,
+        timeout: float = 10.0,
+        ttl: float = 3600.0,
+    ):
+        self.concurrency = concurrency
+        self.per_host_rate = per_host_rate
+        self.timeout = timeout
+        self.ttl = ttl
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._hosts: Dict[str, RateLimiter] = {}
+        self._cache: Dict[str, tuple] = {}
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    async def __aenter__(self):
+        self._session = aiohttp.ClientSession(
+            timeout=ClientTimeout(total=self.timeout),
+            connector=aiohttp.TCPConnector(limit=self.concurrency, ttl_dns_cache=300),
+            headers={"User-Agent": USER_AGENT},
+        )
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self._session.close()
+
+    async def check(self, domain: str, website: Optional[str]) -> SiteCheck:
+        url = clean_website(website)
+        if url is None:
+            return SiteCheck(domain, website, error="no website")
+        entry = self._cache.get(url)
+        if entry is not None and entry[0] > time.monotonic():
+            result = entry[1]
+        else:
+            task = self._inflight.get(url)
+            if task is None:
+                task = self._inflight[url] = asyncio.create_task(self._resolve(url))
+                task.add_done_callback(lambda _: self._inflight.pop(url, None))
+            result = await asyncio.shield(task)
+        return SiteCheck(domain, website, **result)
+
+    async def check_many(self, sites: Dict[str, Optional[str]]) -> List[SiteCheck]:
+        """{company domain: 'Site' value} -> one SiteCheck per company."""
+        return list(await asyncio.gather(*(self.check(domain, website) for domain, website in sites.items())))
+
+    def _limiter(self, host: str) -> RateLimiter:
+        limiter = self._hosts.get(host)
+        if limiter is None:
+            limiter = self._hosts[host] = RateLimiter(rate=self.per_host_rate, burst=1)
+        return limiter
+
+    async def _resolve(self, url: str) -> dict:
+        result = await self._get(url)
+        # https est supposé quand la valeur n'a pas de schéma : repli sur http s'il ne répond pas
+        if result.get("status") is None and url.startswith("https://"):
+            fallback = await self._get("http://" + url[len("https://"):])
+            if fallback.get("status") is not None:
+                result = fallback
+        self._cache[url] = (time.monotonic() + self.ttl, result)
+        return result
+
+    async def _get(self, url: str) -> dict:
+        """Follow redirects hop by hop, each hop paced by its own host's limiter."""
+        started = time.monotonic()
+        try:
+            for redirects in range(MAX_REDIRECTS + 1):
+                await self._limiter(urlparse(url).hostname).acquire_async()
+                async with self._semaphore:
+                    async with self._session.get(url, allow_redirects=False) as response:
+                        location = response.headers.get("Location")
+                        if response.status not in REDIRECT_STATUSES or not location:
+                            return {
+                                "final_url": url,
+                                "site_domain": canonical_domain(url),
+                                "status": response.status,
+                                "live": response.status < 500 and response.status not in (404, 410),
+                                "latency": round(time.monotonic() - started, 3),
+                                "redirects": redirects,
+                            }
+                        url = str(response.url.join(URL(location)))
+            raise aiohttp.TooManyRedirects(response.request_info, response.history)
+        except Exception as e:
+            return {
+                "latency": round(time.monotonic() - started, 3),
+                "error": f"{type(e).__name__}: {e}"[:200],
+            }
+
+
+async def _check_all(sites: Dict[str, Optional[str]], **kwargs) -> List[SiteCheck]:
+    async with SiteChecker(**kwargs) as checker:
+        return await checker.check_many(sites)
+
+
+def check_websites(
+    sites: Dict[str, Optional[str]],
+    store: Optional[CompanyStore] = None,
+    max_age_days: float = 7.0,
+    **kwargs,
+) -> List[SiteCheck]:
+    """Pipeline stage: check the websites of a crawl, skipping those checked recently.
+
+    sites maps company domains to their 'Site' values. With a store, sites
+    whose check is younger than max_age_days (and whose URL did not change)
+    are skipped and the new results are saved in its websites table.
+    """
+    if store is not None:
+        since = (datetime.now() - timedelta(days=max_age_days)).isoformat(timespec="seconds")
+        fresh = store.checked_websites(since)
+        sites = {domain: website for domain, website in sites.items() if fresh.get(domain, "\0") != website}
+    sites = {domain: website for domain, website in sites.items() if website}
+    if not sites:
+        return []
+    start = time.perf_counter()
+    results = asyncio.run(_check_all(sites, **kwargs))
+    if store is not None:
+        store.add_site_checks(result.to_row() for result in results)
+    live = sum(result.live for result in results)
+    redirected = sum(
+        bool(result.site_domain) and result.site_domain != canonical_domain(clean_website(result.website) or "")
+        for result in results
+    )
+    logging.info(
+        "Websites checked: %s, %s live, %s redirected to another domain, in %.1f s",
+        len(results),
+        live,
+        redirected,
+        time.perf_counter() - start,
+    )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Resolve and check the websites of the companies in the store.")
+    parser.add_argument("--db", default=DB_PATH)
+    parser.add_argument("--max-age-days", type=float, default=7.0, help="re-check sites older than this")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--per-host-rate", type=float, default=1.0, help="requests per second to one host")
+    args = parser.parse_args()
+    configure_logging()
+    store = CompanyStore(args.db)
+    try:
+        check_websites(
+            store.websites(),
+            store,
+            max_age_days=args.max_age_days,
+            concurrency=args.concurrency,
+            per_host_rate=args.per_host_rate,
+        )
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,372 @@
+import argparse
+import csv
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterable, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+from change_capture import STAR_COLUMNS
+from domains import canonical_domain, record_key
+from log_setup import configure_logging
+from records import CompanyRecord
+
+DB_PATH = os.environ.get("TRUSTPILOT_DB", "trustpilot.db")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS companies (
+    domain TEXT PRIMARY KEY,
+    name TEXT,
+    rating REAL,
+    review_count INTEGER,
+    category TEXT,
+    website TEXT,
+    address TEXT,
+    in_france INTEGER,
+    pct_5 REAL,
+    pct_4 REAL,
+    pct_3 REAL,
+    pct_2 REAL,
+    pct_1 REAL,
+    crawled_at TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_companies_rating ON companies (rating);
+CREATE INDEX IF NOT EXISTS idx_companies_reviews ON companies (review_count);
+CREATE INDEX IF NOT EXISTS idx_companies_crawled ON companies (crawled_at);
+CREATE INDEX IF NOT EXISTS idx_companies_france_rating ON companies (in_france, rating);
+CREATE TABLE IF NOT EXISTS websites (
+    domain TEXT PRIMARY KEY,
+    website TEXT,
+    final_url TEXT,
+    site_domain TEXT,
+    status INTEGER,
+    live INTEGER,
+    latency REAL,
+    error TEXT,
+    checked_at TEXT
+);
+"""
+
+COLUMNS = [
+    "domain", "name", "rating", "review_count", "category", "website", "address",
+    "in_france", "pct_5", "pct_4", "pct_3", "pct_2", "pct_1", "crawled_at",
+]
+
+# Résultat de site_check : résolution des redirections et disponibilité du site
+WEBSITE_COLUMNS = ["domain", "website", "final_url", "site_domain", "status", "live", "latency", "error", "checked_at"]
+
+# Tri autorisé pour les requêtes top-N : nom public -> colonne indexée
+ORDERS = {"rating": "rating", "reviews": "review_count", "crawled": "crawled_at", "name": "name"}
+
+
+def _number(value, decimal_comma: bool = False) -> Optional[float]:
+    """'13,236' -> 13236, '87%' -> 87, '4,8' -> 4.8 with decimal_comma; None if unparseable."""
+    if value is None or value == "":
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    text = str(value).replace(" ", "")
+    text = text.replace(",", ".") if decimal_comma else text.replace(",", "")
+    match = re.search(r"\d+(?:\.\d+)?", text)
+    return float(match.group()) if match else None
+
+
+def record_to_row(domain: str, record: dict, crawled_at: Optional[str] = None) -> dict:
+    """Map a scraper record (French CSV columns) to a companies row."""
+    review_count = _number(record.get("Nombre de reviews"))
+    in_france = record.get("En France")
+    row = {
+        "domain": domain,
+        "name": record.get("Nom de l'entreprise"),
+        "rating": _number(record.get("Note"), decimal_comma=True),
+        "review_count": int(review_count) if review_count is not None else None,
+        "category": record.get("Catégorie"),
+        "website": record.get("Site"),
+        "address": record.get("Adresse"),
+        "in_france": None if in_france is None else int(in_france == "Oui"),
+        "crawled_at": crawled_at or datetime.now().isoformat(timespec="seconds"),
+    }
+    for stars, column in zip(range(5, 0, -1), STAR_COLUMNS):
+        row[f"pct_{stars}"] = _number(record.get(column))
+    return row
+
+
+def company_to_row(domain: str, company: CompanyRecord, crawled_at: Optional[str] = None) -> dict:
+    """Map a typed CompanyRecord to a companies row: no string parsing needed."""
+    row = {
+        "domain": domain,
+        "name": company.name,
+        "rating": company.rating,
+        "review_count": company.review_count,
+        "category": company.category,
+        "website": company.website,
+        "address": company.address,
+        "in_france": None if company.in_france is None else int(company.in_france),
+        "crawled_at": crawled_at or datetime.now().isoformat(timespec="seconds"),
+    }
+    for stars in range(5, 0, -1):
+        row[f"pct_{stars}"] = getattr(company, f"pct_{stars}")
+    return row
+
+
+class CompanyStore:
+    """SQLite store of the latest record of every company, keyed by canonical domain.
+
+    Writers call add() from any thread; rows are buffered and upserted in
+    batches of batch_size in one transaction. Partial rows (e.g. only rating
+    and review_count) update just the columns they carry.
+    """
+
+    def __init__(self, path: str = DB_PATH, batch_size: int = 50):
+        self.path = path
+        self.batch_size = batch_size
+        self._buffer: List[dict] = []
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+
+    def add(self, row: dict):
+        with self._lock:
+            self._buffer.append(row)
+            if len(self._buffer) < self.batch_size:
+                return
+            rows, self._buffer = self._buffer, []
+            self._upsert(rows)
+
+    def add_record(self, domain: str, record: dict):
+        self.add(record_to_row(domain, record))
+
+    def add_company(self, domain: str, company: CompanyRecord):
+        self.add(company_to_row(domain, company))
+
+    def flush(self):
+        with self._lock:
+            rows, self._buffer = self._buffer, []
+            if rows:
+                self._upsert(rows)
+
+    def upsert(self, rows: Iterable[dict]):
+        with self._lock:
+            self._upsert(list(rows))
+
+    def _upsert(self, rows: List[dict]):
+        # Regroupement par jeu de colonnes : un executemany par forme de ligne
+        groups: Dict[tuple, List[dict]] = {}
+        for row in rows:
+            groups.setdefault(tuple(c for c in COLUMNS if c in row), []).append(row)
+        with self.conn:
+            for columns, group in groups.items():
+                updates = ", ".join(f"{c} = excluded.{c}" for c in columns if c != "domain")
+                sql = (
+                    f"INSERT INTO companies ({', '.join(columns)}) "
+                    f"VALUES ({', '.join('?' for _ in columns)}) "
+                    f"ON CONFLICT(domain) DO UPDATE SET {updates}"
+                )
+                self.conn.executemany(sql, [tuple(row[c] for c in columns) for row in group])
+        logging.debug("%s rows upserted into %s", len(rows), self.path)
+
+    def query(
+        self,
+        min_rating: Optional[float] = None,
+        max_rating: Optional[float] = None,
+        min_reviews: Optional[int] = None,
+        max_reviews: Optional[int] = None,
+        in_france: Optional[bool] = None,
+        category: Optional[str] = None,
+        since: Optional[str] = None,
+        order: str = "rating",
+        descending: bool = True,
+        limit: int = 50,
+    ) -> List[dict]:
+        """Filter and top-N over the indexed columns, e.g. French stores rated >= 4.5 with > 1000 reviews."""
+        if order not in ORDERS:
+            raise ValueError(f"order must be one of {sorted(ORDERS)}")
+        clauses, params = [], []
+        for sql, value in (
+            ("rating >= ?", min_rating),
+            ("rating <= ?", max_rating),
+            ("review_count >= ?", min_reviews),
+            ("review_count <= ?", max_reviews),
+            ("in_france = ?", None if in_france is None else int(in_france)),
+            ("category = ?", category),
+            ("crawled_at >= ?", since),
+        ):
+            if value is not None:
+                clauses.append(sql)
+                params.append(value)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        sql = (
+            f"SELECT * FROM companies {where} "
+            f"ORDER BY {ORDERS[order]} {'DESC' if descending else 'ASC'} LIMIT ?"
+        )
+        with self._lock:
+            rows = self.conn.execute(sql, (*params, limit)).fetchall()
+        return [dict(row) for row in rows]
+
+    def key_index(self) -> Dict[str, str]:
+        """{website domain or lower-cased name: domain} of the stored companies, for domains.record_key()."""
+        self.flush()
+        with self._lock:
+            rows = self.conn.execute("SELECT domain, website, name FROM companies").fetchall()
+        # Un domaine déjà connu comme clé prime sur le site d'une autre entreprise
+        index: Dict[str, str] = {domain: domain for domain, _, _ in rows}
+        for domain, website, name in rows:
+            if name:
+                index.setdefault(name.strip().lower(), domain)
+            if website:
+                index.setdefault(canonical_domain(website), domain)
+        return index
+
+    def import_csv(self, path: str) -> int:
+        """Load a scraper CSV under the crawlers' key (domains.record_key()); the website stays in its column."""
+        crawled_at = datetime.fromtimestamp(os.path.getmtime(path)).isoformat(timespec="seconds")
+        known = self.key_index()
+        count = 0
+        with open(path, newline="", encoding="utf-8-sig") as f:
+            for record in csv.DictReader(f):
+                key = record_key(record, known)
+                if key:
+                    self.add(record_to_row(key, record, crawled_at))
+                    count += 1
+        self.flush()
+        return count
+
+    def websites(self) -> Dict[str, str]:
+        """{domain: 'Site' value} for every company that has one."""
+        self.flush()
+        with self._lock:
+            rows = self.conn.execute("SELECT domain, website FROM companies WHERE website IS NOT NULL AND website != ''")
+            return {domain: website for domain, website in rows}
+
+    def checked_websites(self, since: str) -> Dict[str, str]:
+        """{domain: website} of the site checks done since the given ISO date."""
+        with self._lock:
+            rows = self.conn.execute("SELECT domain, website FROM websites WHERE checked_at >= ?", (since,))
+            return {domain: website for domain, website in rows}
+
+    def add_site_checks(self, rows: Iterable[dict]):
+        sql = (
+            f"INSERT OR REPLACE INTO websites ({', '.join(WEBSITE_COLUMNS)}) "
+            f"VALUES ({', '.join('?' for _ in WEBSITE_COLUMNS)})"
+        )
+        with self._lock, self.conn:
+            self.conn.executemany(sql, [tuple(row[c] for c in WEBSITE_COLUMNS) for row in rows])
+
+    def close(self):
+        self.flush()
+        self.conn.close()
+
+
+def query_params(params: Dict[str, str]) -> dict:
+    """HTTP/CLI string parameters -> CompanyStore.query() keyword arguments."""
+    converters = {
+        "min_rating": float,
+        "max_rating": float,
+        "min_reviews": int,
+        "max_reviews": int,
+        "in_france": lambda v: v.lower() in ("1", "true", "oui", "yes"),
+        "category": str,
+        "since": str,
+        "order": str,
+        "descending": lambda v: v.lower() not in ("0", "false", "non", "no"),
+        "limit": int,
+    }
+    return {key: converters[key](value) for key, value in params.items() if key in converters}
+
+
+def serve(store: CompanyStore, host: str = "127.0.0.1", port: int = 8765):
+    """GET /companies?min_rating=4.5&min_reviews=1000&in_france=1&order=reviews&limit=20"""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path != "/companies":
+                self.send_error(404)
+                return
+            try:
+                params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+                start = time.perf_counter()
+                rows = store.query(**query_params(params))
+                elapsed_ms = (time.perf_counter() - start) * 1000
+            except ValueError as e:
+                self.send_error(400, str(e))
+                return
+            body = json.dumps({"count": len(rows), "elapsed_ms": round(elapsed_ms, 2), "companies": rows}, ensure_ascii=False)
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.end_headers()
+            self.wfile.write(body.encode("utf-8"))
+
+        def log_message(self, format, *args):
+            logging.debug("HTTP %s", format % args)
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    logging.info("Serving %s on http://%s:%s/companies", store.path, host, port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query the embedded Trustpilot company store.")
+    parser.add_argument("--db", default=DB_PATH)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    importer = commands.add_parser("import", help="load scraper CSV files")
+    importer.add_argument("csv_files", nargs="+")
+
+    query = commands.add_parser("query", help="filter / top-N query")
+    query.add_argument("--min-rating", type=float)
+    query.add_argument("--max-rating", type=float)
+    query.add_argument("--min-reviews", type=int)
+    query.add_argument("--max-reviews", type=int)
+    query.add_argument("--france", dest="in_france", action="store_true", default=None)
+    query.add_argument("--category")
+    query.add_argument("--since", help="ISO date, e.g. 2024-05-01")
+    query.add_argument("--order", choices=sorted(ORDERS), default="rating")
+    query.add_argument("--ascending", dest="descending", action="store_false")
+    query.add_argument("--top", dest="limit", type=int, default=20)
+
+    server = commands.add_parser("serve", help="HTTP JSON API")
+    server.add_argument("--host", default="127.0.0.1")
+    server.add_argument("--port", type=int, default=8765)
+
+    args = parser.parse_args()
+    configure_logging()
+    store = CompanyStore(args.db)
+    try:
+        if args.command == "import":
+            for path in args.csv_files:
+                logging.info("%s: %s companies imported", path, store.import_csv(path))
+        elif args.command == "serve":
+            serve(store, args.host, args.port)
+        else:
+            filters = {
+                key: getattr(args, key)
+                for key in ("min_rating", "max_rating", "min_reviews", "max_reviews", "in_france",
+                            "category", "since", "order", "descending", "limit")
+            }
+            start = time.perf_counter()
+            rows = store.query(**filters)
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            for row in rows:
+                print(f"{row['rating'] or '-':>4}  {row['review_count'] or 0:>7}  {row['domain']:<35} {row['name'] or ''}")
+            print(f"{len(rows)} companies in {elapsed_ms:.2f} ms")
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+import asyncio
+import time
+
+import aiohttp
+from aiohttp import web
+
+from egress import EgressPool, Exit
+from resilience import FetchError, retry_after_seconds
+
+TARGET = "http://fr.trustpilot.test/review/example.com"
+
+
+class ProxyStandIn:
+    """Local HTTP proxy stand-in: answers every proxied request itself, with a fixed behaviour."""
+
+    def __init__(self, status: int = 200, delay: float = 0.0, retry_after: str = None):
+        self.status = status
+        self.delay = delay
+        self.retry_after = retry_after
+        self.hosts = []
+        self._runner = None
+        self.url = None
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        self.hosts.append(request.host)
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        headers = {"Retry-After": self.retry_after} if self.retry_after else None
+        return web.Response(status=self.status, text="<html></html>", headers=headers)
+
+    async def __aenter__(self):
+        app = web.Application()
+        app.router.add_route("*", "/{tail:.*}", self._handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        port = self._runner.addresses[0][1]
+        self.url = f"http://127.0.0.1:{port}"
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self._runner.cleanup()
+
+
+async def fetch(session: aiohttp.ClientSession, pool: EgressPool, exit_: Exit = None) -> int:
+    """Same feedback loop as the sitemap crawler's _get: one request, one record()."""
+    if exit_ is None:
+        exit_ = await pool.acquire_async()
+    started = time.monotonic()
+    try:
+        async with session.get(TARGET, proxy=exit_.proxy) as response:
+            if response.status >= 400:
+                raise FetchError(TARGET, response.status, retry_after_seconds(response.headers.get("Retry-After")))
+            await response.text()
+    except FetchError as e:
+        pool.record(exit_, time.monotonic() - started, e)
+        return e.status
+    pool.record(exit_, time.monotonic() - started)
+    return 200
+
+
+def test_health_scoring_prefers_fast_healthy_exit():
+    async def scenario():
+        async with ProxyStandIn(delay=0.2) as slow, ProxyStandIn() as fast, ProxyStandIn(status=503) as failing:
+            slow_exit, fast_exit, failing_exit = Exit(slow.url), Exit(fast.url), Exit(failing.url)
+            pool = EgressPool([slow_exit, fast_exit, failing_exit], alpha=0.5, min_samples=100)
+            async with aiohttp.ClientSession() as session:
+                for exit_ in (slow_exit, fast_exit, failing_exit):
+                    for _ in range(3):
+                        await fetch(session, pool, exit_)
+            assert slow.hosts and set(slow.hosts) == {"fr.trustpilot.test"}
+            assert slow_exit.latency > fast_exit.latency
+            assert failing_exit.error_rate > 0.5 and fast_exit.error_rate == 0.0
+            assert failing_exit.score() > fast_exit.score()
+            assert pool.choose() is fast_exit
+            # Pas de retrait sous min_samples : la sortie en échec est seulement pénalisée
+            assert failing_exit.retired_until == 0.0
+
+    asyncio.run(scenario())
+
+
+def test_failing_exit_is_retired():
+    async def scenario():
+        async with ProxyStandIn(status=503) as failing, ProxyStandIn() as healthy:
+            failing_exit, healthy_exit = Exit(failing.url), Exit(healthy.url)
+            pool = EgressPool([failing_exit, healthy_exit], alpha=0.5, min_samples=3, retire_seconds=60)
+            async with aiohttp.ClientSession() as session:
+                statuses = [await fetch(session, pool, failing_exit) for _ in range(3)]
+                assert statuses == [503, 503, 503]
+                assert failing_exit.retirements == 1
+                assert failing_exit.retired_until > time.monotonic() + 50
+                # Retour en période d'essai : compteur remis à zéro, taux d'erreur à mi-seuil
+                assert failing_exit.samples == 0
+                assert failing_exit.error_rate == 0.25
+                for _ in range(3):
+                    assert await fetch(session, pool) == 200
+            assert len(failing.hosts) == 3
+            assert len(healthy.hosts) == 3
+            retired = {s["exit"]: s["retired_for"] for s in pool.stats()}
+            assert retired[failing.url] > 50 and retired[healthy.url] == 0.0
+
+    asyncio.run(scenario())
+
+
+def test_single_exit_is_never_retired():
+    async def scenario():
+        async with ProxyStandIn(status=503) as failing:
+            only = Exit(failing.url)
+            pool = EgressPool([only], alpha=0.5, min_samples=1)
+            async with aiohttp.ClientSession() as session:
+                for _ in range(3):
+                    await fetch(session, pool)
+            assert only.retirements == 0 and only.retired_until == 0.0
+
+    asyncio.run(scenario())
+
+
+def test_rate_limited_exit_pauses_alone():
+    async def scenario():
+        async with ProxyStandIn(status=429, retry_after="5") as limited, ProxyStandIn() as other:
+            limited_exit, other_exit = Exit(limited.url), Exit(other.url)
+            pool = EgressPool([limited_exit, other_exit], min_samples=100)
+            async with aiohttp.ClientSession() as session:
+                assert await fetch(session, pool) == 429
+                assert 4 < limited_exit.limiter.peek() <= 5
+                assert other_exit.limiter.peek() == 0.0
+                assert pool.choose() is other_exit
+                started = time.monotonic()
+                assert await fetch(session, pool) == 200
+                assert time.monotonic() - started < 1
+            assert len(limited.hosts) == 1 and len(other.hosts) == 1
+
+    asyncio.run(scenario())
+
+
+def test_rate_limited_pause_defaults_without_retry_after():
+    async def scenario():
+        async with ProxyStandIn(status=429) as limited:
+            limited_exit = Exit(limited.url)
+            pool = EgressPool([limited_exit], rate_limit_pause=30)
+            async with aiohttp.ClientSession() as session:
+                await fetch(session, pool)
+            assert 29 < limited_exit.limiter.peek() <= 30
+
+    asyncio.run(scenario())
@@ -6,6 +6,8 @@ from selenium.common.exceptions import TimeoutException, NoSuchElementException
 import json
 import logging
 
+from extraction_spec import get_engine
+
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 def setup_driver():
@@ -190,6 +192,11 @@ def analyze_trustpilot_page(driver, url):
                 continue
     except:
         print("❌ Aucun JSON-LD trouvé")
+    
+    # 9. Résultat de la spec d'extraction déclarative
+    print("\n--- SPEC D'EXTRACTION (extraction_spec.json) ---")
+    for field, value in get_engine().extract(driver.page_source).items():
+        print(f"✅ {field}: {value}")
 
 def main():
     driver = setup_driver()
@@ -208,6 +215,9 @@ def main():
         except Exception as e:
             print(f"Erreur lors de l'analyse de {url}: {str(e)}")
     
+    # Taux de succès de chaque stratégie, pour repérer les sélecteurs cassés
+    print(json.dumps(get_engine().stats(), indent=2))
+    
     driver.quit()
 
 if __name__ == "__main__":
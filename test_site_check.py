@@ -0,0 +1,167 @@
+import asyncio
+import time
+from collections import Counter
+
+from aiohttp import web
+
+from site_check import SiteChecker
+
+
+class SiteStandIn:
+    """Local web server playing company websites: fixed routes, per-path hit counts."""
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.hits = Counter()
+        self._runner = None
+        self.port = None
+
+    def url(self, path: str, host: str = "127.0.0.1") -> str:
+        return f"http://{host}:{self.port}{path}"
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        self.hits[request.path] += 1
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        if request.path == "/track":
+            # Lien de suivi : renvoie vers l'autre nom d'hôte du même serveur
+            raise web.HTTPFound(self.url("/hop", host="localhost"))
+        if request.path == "/hop":
+            raise web.HTTPMovedPermanently(self.url("/home", host="localhost"))
+        if request.path == "/loop":
+            raise web.HTTPFound("/loop")
+        if request.path.startswith("/status/"):
+            return web.Response(status=int(request.path.rsplit("/", 1)[1]))
+        return web.Response(text="<html>shop</html>")
+
+    async def __aenter__(self):
+        app = web.Application()
+        app.router.add_route("*", "/{tail:.*}", self._handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        self.port = self._runner.addresses[0][1]
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self._runner.cleanup()
+
+
+def run(scenario, **kwargs):
+    """Run scenario(server, checker) against a fresh stand-in and checker."""
+
+    async def main():
+        async with SiteStandIn(delay=kwargs.pop("delay", 0.0)) as server:
+            async with SiteChecker(**{"per_host_rate": 1000, "timeout": 5, **kwargs}) as checker:
+                return await scenario(server, checker)
+
+    return asyncio.run(main())
+
+
+def test_redirects_resolve_final_url_and_site_domain():
+    async def scenario(server, checker):
+        result = await checker.check("shop.fr", server.url("/track?utm_source=tp"))
+        assert result.status == 200 and result.live
+        assert result.final_url == server.url("/home", host="localhost")
+        assert result.site_domain == "localhost"
+        assert result.redirects == 2
+        assert result.error is None
+        assert "redirects" not in result.to_row()
+
+    run(scenario)
+
+
+def test_every_redirect_hop_is_paced_by_its_host():
+    async def scenario(server, checker):
+        started = time.monotonic()
+        results = await checker.check_many(
+            {"a.fr": server.url("/track"), "b.fr": server.url("/status/200")}
+        )
+        elapsed = time.monotonic() - started
+        assert [r.status for r in results] == [200, 200]
+        assert set(checker._hosts) == {"127.0.0.1", "localhost"}
+        # 127.0.0.1 : /track puis /status/200 ; localhost : /hop puis /home, une requête par 0,2 s
+        assert elapsed >= 0.2
+
+    run(scenario, per_host_rate=5)
+
+
+def test_redirect_loop_is_cut():
+    async def scenario(server, checker):
+        result = await checker.check("loop.fr", server.url("/loop"))
+        assert result.status is None and not result.live
+        assert result.error.startswith("TooManyRedirects")
+        assert server.hits["/loop"] == 11
+
+    run(scenario)
+
+
+def test_live_rule():
+    async def scenario(server, checker):
+        expected = {200: True, 403: True, 404: False, 410: False, 500: False, 503: False}
+        results = await checker.check_many({str(code): server.url(f"/status/{code}") for code in expected})
+        assert {int(r.domain): r.live for r in results} == expected
+        assert {int(r.domain): r.status for r in results} == {code: code for code in expected}
+
+    run(scenario)
+
+
+def test_https_falls_back_to_http():
+    async def scenario(server, checker):
+        # Sans schéma, https est supposé : le serveur de test ne parle que http
+        result = await checker.check("shop.fr", f"127.0.0.1:{server.port}/home")
+        assert result.status == 200 and result.live
+        assert result.final_url == server.url("/home")
+        assert result.error is None
+
+    run(scenario)
+
+
+def test_unreachable_site_is_not_live():
+    async def scenario(server, checker):
+        port = server.port
+        await server.__aexit__()
+        result = await checker.check("gone.fr", f"http://127.0.0.1:{port}/home")
+        assert result.status is None and not result.live
+        assert result.error
+
+    run(scenario)
+
+
+def test_no_website():
+    async def scenario(server, checker):
+        result = await checker.check("shop.fr", "https://fr.trustpilot.com/review/shop.fr")
+        assert result.error == "no website" and not result.live
+        assert not server.hits
+
+    run(scenario)
+
+
+def test_ttl_cache():
+    async def scenario(server, checker):
+        first = await checker.check("a.fr", server.url("/home"))
+        second = await checker.check("b.fr", server.url("/home"))
+        assert server.hits["/home"] == 1
+        assert (first.domain, second.domain) == ("a.fr", "b.fr")
+        assert second.final_url == first.final_url
+
+    run(scenario)
+
+    async def expired(server, checker):
+        await checker.check("a.fr", server.url("/home"))
+        await checker.check("b.fr", server.url("/home"))
+        assert server.hits["/home"] == 2
+
+    run(expired, ttl=0)
+
+
+def test_concurrent_duplicates_share_one_request():
+    async def scenario(server, checker):
+        sites = {f"company{i}.fr": server.url("/home") for i in range(10)}
+        results = await checker.check_many(sites)
+        assert server.hits["/home"] == 1
+        assert [r.domain for r in results] == list(sites)
+        assert all(r.status == 200 for r in results)
+
+    run(scenario, delay=0.2)
@@ -0,0 +1,163 @@
+import asyncio
+import atexit
+import contextlib
+import json
+import logging
+import os
+import threading
+import time
+import weakref
+from types import SimpleNamespace
+from typing import List, Optional
+
+_NOOP = contextlib.nullcontext()
+
+
+class _Span:
+    __slots__ = ("tracer", "name", "args", "start")
+
+    def __init__(self, tracer: "Tracer", name: str, args: dict):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.args["error"] = exc_type.__name__
+        self.tracer.complete(self.name, self.start, time.perf_counter_ns(), self.args)
+        return False
+
+
+class Tracer:
+    """Records per-URL stage spans and exports them as a Chrome trace / Perfetto file.
+
+    Disabled, span() returns a shared no-op context manager: one attribute check
+    and no allocation. Each thread, or asyncio task, gets its own lane in the
+    timeline so queueing gaps and stragglers are visible.
+    """
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self.events: List[dict] = []
+        self._origin = time.perf_counter_ns()
+        # Clés faibles : une tâche ou un thread terminé ne reste pas en vie pour sa voie
+        self._lanes: "weakref.WeakKeyDictionary[object, int]" = weakref.WeakKeyDictionary()
+        self._next_lane = 1
+        self._lock = threading.Lock()
+
+    def span(self, name: str, **args):
+        """with tracer.span("navigate", url=url): ..."""
+        if not self.enabled:
+            return _NOOP
+        return _Span(self, name, args)
+
+    def _lane(self) -> int:
+        try:
+            task = asyncio.current_task()
+        except RuntimeError:
+            task = None
+        owner = task if task is not None else threading.current_thread()
+        lane = self._lanes.get(owner)
+        if lane is None:
+            with self._lock:
+                lane = self._lanes.get(owner)
+                if lane is not None:
+                    return lane
+                lane = self._lanes[owner] = self._next_lane
+                self._next_lane += 1
+                self.events.append(
+                    {
+                        "name": "thread_name",
+                        "ph": "M",
+                        "pid": os.getpid(),
+                        "tid": lane,
+                        "args": {"name": task.get_name() if task is not None else owner.name},
+                    }
+                )
+        return lane
+
+    def complete(self, name: str, start_ns: int, end_ns: int, args: Optional[dict] = None):
+        """Record a finished span given perf_counter_ns() bounds."""
+        if not self.enabled:
+            return
+        self.events.append(
+            {
+                "name": name,
+                "ph": "X",
+                "ts": (start_ns - self._origin) / 1000,
+                "dur": (end_ns - start_ns) / 1000,
+                "pid": os.getpid(),
+                "tid": self._lane(),
+                "args": args or {},
+            }
+        )
+
+    def instant(self, name: str, **args):
+        if not self.enabled:
+            return
+        self.events.append(
+            {
+                "name": name,
+                "ph": "i",
+                "s": "t",
+                "ts": (time.perf_counter_ns() - self._origin) / 1000,
+                "pid": os.getpid(),
+                "tid": self._lane(),
+                "args": args,
+            }
+        )
+
+    def export(self, path: str):
+        """Write a file that chrome://tracing and ui.perfetto.dev open directly."""
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": self.events, "displayTimeUnit": "ms"}, f)
+        logging.info("Trace of %s events written to %s", len(self.events), path)
+
+
+tracer = Tracer()
+
+
+def enable_tracing(path: Optional[str] = None) -> Tracer:
+    """Turn the process-wide tracer on and export it at exit.
+
+    Without a path, the TRUSTPILOT_TRACE environment variable is used; nothing
+    is enabled if neither is set.
+    """
+    path = path or os.environ.get("TRUSTPILOT_TRACE")
+    if path and not tracer.enabled:
+        tracer.enabled = True
+        atexit.register(tracer.export, path)
+    return tracer
+
+
+def aiohttp_trace_config():
+    """aiohttp hooks splitting a request into dns / connect / ttfb spans."""
+    import aiohttp
+
+    def starter(attr):
+        async def on_start(session, ctx, params):
+            setattr(ctx, attr, time.perf_counter_ns())
+
+        return on_start
+
+    def ender(attr, name):
+        async def on_end(session, ctx, params):
+            start = getattr(ctx, attr, None)
+            if start is not None:
+                url = str(getattr(params, "url", "")) or getattr(params, "host", "")
+                tracer.complete(name, start, time.perf_counter_ns(), {"url": url})
+
+        return on_end
+
+    config = aiohttp.TraceConfig(trace_config_ctx_factory=lambda **kwargs: SimpleNamespace(**kwargs))
+    config.on_dns_resolvehost_start.append(starter("dns_start"))
+    config.on_dns_resolvehost_end.append(ender("dns_start", "dns"))
+    config.on_connection_create_start.append(starter("connect_start"))
+    config.on_connection_create_end.append(ender("connect_start", "connect"))
+    config.on_request_start.append(starter("request_start"))
+    config.on_request_end.append(ender("request_start", "ttfb"))
+    return config
@@ -1,183 +1,151 @@
+import argparse
 import asyncio
 import csv
 import json
 import logging
 import os
-import random
 import signal
 import time
 import xml.etree.ElementTree as ET
 from asyncio import Queue
 from datetime import datetime
-from typing import Dict, List, Optional, Set, Tuple
+from typing import List, Optional, Set, Tuple
 from urllib.parse import urlparse
 
 import aiohttp
-from aiohttp import ClientResponseError, ClientTimeout
-from bs4 import BeautifulSoup
-
-# Configuration du logging
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(levelname)s - %(message)s",
-    handlers=[
-        logging.FileHandler(
-            f"trustpilot_scraper_{datetime.now().strftime('%Y%m%d_%H%M%S')}.log"
-        ),
-        logging.StreamHandler(),
-    ],
-)
+from aiohttp import ClientTimeout
+
+from archive import archive_page
+from domains import canonical_domain
+from egress import EgressPool
+from extraction_spec import get_engine
+from frontier import Deadline, Frontier, parse_duration
+from history import HistoryStore
+from latency import Hedger, endpoint_class, latency
+from log_setup import configure_logging
+from records import CompanyBatch, CompanyRecord
+from resilience import FetchError, ParseError, Resilience, retry_after_seconds
+from resource_watchdog import AsyncWorkerLimit, Watchdog, default_max_workers
+from store import CompanyStore
+from tracing import aiohttp_trace_config, enable_tracing, tracer
+
 
 
 class TrustpilotScraper:
-    def __init__(self, input_csv: str, output_csv: str, max_workers: int = 5):
+    def __init__(
+        self,
+        input_csv: Optional[str] = None,
+        output_csv: Optional[str] = None,
+        max_workers: Optional[int] = None,
+        requests_per_second: Optional[float] = 2.0,
+        budget: Optional[float] = None,
+        hedge_ratio: float = 0.0,
+    ):
         self.input_csv = input_csv
         self.output_csv = output_csv
-        self.max_workers = max_workers
+        # Plafond propre à la machine ; le watchdog ajuste la concurrence réelle en dessous
+        self.max_workers = max_workers or default_max_workers(per_worker_mb=50)
+        self.worker_limit = AsyncWorkerLimit(max(1, self.max_workers // 2))
+        self.watchdog = Watchdog(self.worker_limit, max_workers=self.max_workers)
         self.processed: Set[str] = set()
         self.queue: Queue = Queue()
-        self.results: Dict[str, Tuple[Optional[str], Optional[int]]] = {}
+        # Colonnes typées (url, note, avis) en attendant la prochaine sauvegarde
+        self.results = CompanyBatch()
+        # Toutes les notes du run, pour l'historique (quelques dizaines d'octets par entreprise)
+        self.crawled = CompanyBatch()
         self.total_processed = 0
         self.total_errors = 0
         self.start_time = None
         self.running = True
-        self.rate_limit_delay = 1  # Délai initial en secondes
-        self.max_retries = 3
-        self.retry_delays = [5, 30, 300]  # Délais de retry en secondes
+        # Fenêtre de crawl : arrêt propre à l'échéance, les URLs prioritaires passées d'abord
+        self.deadline = Deadline(budget)
+        # Sorties réseau (egress.json) avec chacune sa cadence, direct par défaut
+        self.egress = EgressPool.from_config(rate=requests_per_second, burst=self.max_workers)
+        # Retry par classe d'erreur, disjoncteur par hôte, URLs abandonnées en lettres mortes.
+        # Les 429 mettent en pause la sortie concernée, pas tous les workers.
+        self.resilience = Resilience("sitemap")
+        # Délais tirés des percentiles de latence par type de page ; requêtes doublées au-delà du p95
+        self.hedger = Hedger(latency, ratio=hedge_ratio)
+        self.store = CompanyStore()
 
     async def extract_company_data(
         self, session: aiohttp.ClientSession, url: str
-    ) -> Tuple[Optional[str], Optional[int]]:
+    ) -> Tuple[Optional[float], Optional[int]]:
         """Extract the Trustpilot score and number of reviews from a company profile page asynchronously."""
-        retry_count = 0
-        while retry_count < self.max_retries:
-            try:
-                # Ajouter un délai aléatoire entre 1 et 3 secondes
-                await asyncio.sleep(random.uniform(1, 3))
-
-                headers = {
-                    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3"
-                }
-                async with session.get(
-                    url, headers=headers, timeout=ClientTimeout(total=10)
-                ) as response:
-                    if response.status == 429:  # Too Many Requests
-                        retry_count += 1
-                        delay = self.retry_delays[
-                            min(retry_count - 1, len(self.retry_delays) - 1)
-                        ]
-                        logging.warning(
-                            f"Rate limited. Waiting {delay} seconds before retry {retry_count}/{self.max_retries}"
-                        )
-                        await asyncio.sleep(delay)
-                        continue
-
-                    response.raise_for_status()
-                    html = await response.text()
-                    soup = BeautifulSoup(html, "html.parser")
-
-                    score = None
-                    num_reviews = None
-
-                    # Extraction du nombre d'avis via ld+json
-                    ld_json_tag = soup.find(
-                        "script",
-                        {
-                            "type": "application/ld+json",
-                            "data-business-unit-json-ld": "true",
-                        },
-                    )
-                    if ld_json_tag:
-                        try:
-                            data = json.loads(ld_json_tag.string)
-                            if isinstance(data, dict) and "@graph" in data:
-                                for item in data["@graph"]:
-                                    if (
-                                        item.get("@type") == "LocalBusiness"
-                                        and "aggregateRating" in item
-                                    ):
-                                        agg = item["aggregateRating"]
-                                        num_reviews = (
-                                            int(agg.get("reviewCount"))
-                                            if agg.get("reviewCount")
-                                            else None
-                                        )
-                                        score = agg.get("ratingValue") or score
-                                        break
-                        except Exception as e:
-                            logging.warning(f"Error parsing ld+json for {url}: {e}")
-
-                    # Fallback extraction du score si pas trouvé dans le JSON
-                    if not score:
-                        # Méthode 1: Chercher dans les meta tags
-                        meta_score = soup.find("meta", {"property": "og:title"})
-                        if (
-                            meta_score
-                            and "rated" in meta_score.get("content", "").lower()
-                        ):
-                            content = meta_score["content"]
-                            if "with" in content and "/" in content:
-                                score = content.split("with")[1].split("/")[0].strip()
-
-                        # Méthode 2: Chercher dans les divs avec la classe typography_display-l__gUWQR
-                        if not score:
-                            score_div = soup.find(
-                                "p", {"class": "typography_display-l__gUWQR"}
-                            )
-                            if score_div:
-                                score = score_div.text.strip()
-
-                        # Méthode 3: Chercher dans les images avec alt contenant "TrustScore"
-                        if not score:
-                            score_img = soup.find(
-                                "img", alt=lambda x: x and "TrustScore" in x
-                            )
-                            if score_img:
-                                alt_text = score_img["alt"]
-                                if "out of 5" in alt_text:
-                                    score = (
-                                        alt_text.split("TrustScore")[1]
-                                        .split("out of")[0]
-                                        .strip()
-                                    )
-
-                        # Méthode 4: Chercher dans les spans avec data-rating-typography
-                        if not score:
-                            score_span = soup.find(
-                                "p", {"data-rating-typography": "true"}
-                            )
-                            if score_span:
-                                score = score_span.text.strip()
-
-                    if score:
-                        logging.info(
-                            f"Found score {score} and {num_reviews} reviews for {url}"
-                        )
-                        return score, num_reviews
-
-                    logging.warning(f"No score found for {url}")
-                    return None, None
-
-            except ClientResponseError as e:
-                if e.status == 429:  # Too Many Requests
-                    retry_count += 1
-                    delay = self.retry_delays[
-                        min(retry_count - 1, len(self.retry_delays) - 1)
-                    ]
-                    logging.warning(
-                        f"Rate limited. Waiting {delay} seconds before retry {retry_count}/{self.max_retries}"
+        data = await self.resilience.call_async(url, self._fetch_company_data, session, url)
+        return data if data is not None else (None, None)
+
+    async def fetch_html(self, session: aiohttp.ClientSession, url: str) -> str:
+        """Paced GET through the egress pool, hedged when slower than the usual p95; raises FetchError on HTTP errors."""
+        endpoint = endpoint_class(url)
+        with tracer.span("pace", url=url):
+            exit_ = await self.egress.acquire_async()
+        # La copie éventuelle repasse par la cadence : le délai du hedge ne compte que le réseau
+        html = await self.hedger.run(
+            endpoint,
+            lambda: self._get(session, url, endpoint, exit_),
+            lambda: self._paced_get(session, url, endpoint),
+        )
+        archive_page(url, html)  # Actif si TRUSTPILOT_ARCHIVE=<dossier>
+        return html
+
+    async def _paced_get(self, session: aiohttp.ClientSession, url: str, endpoint: str) -> str:
+        with tracer.span("pace", url=url, hedge=True):
+            exit_ = await self.egress.acquire_async()
+        return await self._get(session, url, endpoint, exit_)
+
+    async def _get(self, session: aiohttp.ClientSession, url: str, endpoint: str, exit_) -> str:
+        headers = {"User-Agent": exit_.user_agent}
+        # Délai fixe de 10 s tant que le type de page n'a pas assez de mesures
+        timeout = latency.timeout(endpoint, 10, key=url)
+        started = time.monotonic()
+        try:
+            async with session.get(
+                url, headers=headers, proxy=exit_.proxy, timeout=ClientTimeout(total=timeout)
+            ) as response:
+                if response.status >= 400:
+                    raise FetchError(
+                        url,
+                        response.status,
+                        retry_after_seconds(response.headers.get("Retry-After")),
                     )
-                    await asyncio.sleep(delay)
-                    continue
-                else:
-                    logging.error(f"HTTP error {e.status} for {url}: {str(e)}")
-                    return None, None
-            except Exception as e:
-                logging.error(f"Error extracting data from {url}: {str(e)}")
-                return None, None
-
-        logging.error(f"Max retries reached for {url}")
-        return None, None
+                with tracer.span("download", url=url, exit=exit_.name):
+                    html = await response.text()
+        except Exception as e:
+            elapsed = time.monotonic() - started
+            self.egress.record(exit_, elapsed, e)
+            if isinstance(e, asyncio.TimeoutError):
+                latency.record(endpoint, elapsed)
+                latency.mark_slow(url)
+            raise
+        elapsed = time.monotonic() - started
+        self.egress.record(exit_, elapsed)
+        latency.record(endpoint, elapsed)
+        latency.clear_slow(url)
+        return html
+
+    async def _fetch_company_data(
+        self, session: aiohttp.ClientSession, url: str
+    ) -> Tuple[float, Optional[int]]:
+        """One attempt: raises FetchError / ParseError so the retry policy can classify it."""
+        html = await self.fetch_html(session, url)
+        # Stratégies ordonnées (__NEXT_DATA__, JSON-LD, CSS, regex) définies dans extraction_spec.json
+        with tracer.span("parse", url=url):
+            values = get_engine().extract(html)
+        score = values.get("rating")
+        num_reviews = values.get("review_count")
+
+        if not score:
+            raise ParseError(f"No score found for {url}")
+
+        logging.debug(
+            "Found score %s and %s reviews for %s",
+            score,
+            num_reviews,
+            url,
+            extra={"url": url, "score": score, "reviews": num_reviews},
+        )
+        return score, num_reviews
 
     async def worker(self, worker_id: int, session: aiohttp.ClientSession):
         """Worker that processes URLs from the queue."""
@@ -186,9 +154,22 @@ class TrustpilotScraper:
                 url = await self.queue.get()
                 if url is None:  # Signal to stop
                     break
+                if self.deadline.expired():
+                    if self.running:
+                        logging.warning(
+                            "Time budget reached, %s URLs left for the next run",
+                            self.queue.qsize(),
+                        )
+                    self.running = False
+                    break
 
-                score, num_reviews = await self.extract_company_data(session, url)
-                self.results[url] = (score, num_reviews)
+                async with self.worker_limit.slot():
+                    with tracer.span("url", url=url, worker=worker_id):
+                        score, num_reviews = await self.extract_company_data(session, url)
+                company = CompanyRecord(url=url, rating=score, review_count=num_reviews)
+                self.results.append(company)
+                if score is not None:
+                    self.crawled.append(company)
 
                 self.total_processed += 1
                 if score is None:
@@ -199,37 +180,63 @@ class TrustpilotScraper:
                 remaining = self.queue.qsize()
                 eta = remaining / rate if rate > 0 else 0
 
+                # Échantillonné : au plus une ligne de progression toutes les 5 s, tous workers confondus
                 logging.info(
-                    f"Worker {worker_id} - Progress: {self.total_processed} sites processed, "
-                    f"{self.total_errors} errors, {remaining} remaining, "
-                    f"Rate: {rate:.2f} sites/sec, ETA: {eta / 60:.1f} minutes"
+                    "Progress: %s sites processed, %s errors, %s remaining, "
+                    "Rate: %.2f sites/sec, ETA: %.1f minutes",
+                    self.total_processed,
+                    self.total_errors,
+                    remaining,
+                    rate,
+                    eta / 60,
+                    extra={"sample": "progress", "worker": worker_id},
                 )
 
                 self.queue.task_done()
             except Exception as e:
-                logging.error(f"Worker {worker_id} error: {str(e)}")
+                logging.error("Worker %s error: %s", worker_id, e, extra={"worker": worker_id})
                 self.queue.task_done()
 
+    def _flush(self):
+        """Append the pending results to the CSV and upsert them into the store, once."""
+        if not self.results:
+            return
+        with open(
+            self.output_csv, "a", newline="", encoding="utf-8"
+        ) as outfile:
+            writer = csv.writer(outfile)
+            for company in self.results:
+                writer.writerow([company.url, company.rating, company.review_count])
+        # Mise à jour partielle : seules la note et le nombre d'avis sont connus ici
+        crawled_at = datetime.now().isoformat(timespec="seconds")
+        self.store.upsert(
+            {
+                "domain": canonical_domain(company.url),
+                "rating": company.rating,
+                "review_count": company.review_count,
+                "crawled_at": crawled_at,
+            }
+            for company in self.results
+            if company.rating is not None
+        )
+        self.results.clear()
+
     async def save_results(self):
-        """Save results to CSV file periodically."""
-        while self.running:
-            if self.results:
-                with open(
-                    self.output_csv, "a", newline="", encoding="utf-8"
-                ) as outfile:
-                    writer = csv.writer(outfile)
-                    for url, (score, num_reviews) in self.results.items():
-                        writer.writerow([url, score, num_reviews])
-                self.results.clear()
+        """Save results to CSV file periodically, until cancelled."""
+        while True:
             await asyncio.sleep(5)  # Save every 5 seconds
+            self._flush()
 
     def signal_handler(self):
         """Handle Ctrl+C gracefully."""
         logging.info("Shutting down gracefully...")
         self.running = False
 
-    async def run(self):
-        """Run the scraper."""
+    async def run(self, redrive: bool = False):
+        """Run the scraper.
+
+        With redrive, only the dead-lettered URLs of previous runs are fetched.
+        """
         # Load already processed URLs
         if os.path.exists(self.output_csv):
             try:
@@ -238,9 +245,9 @@ class TrustpilotScraper:
                     for row in reader:
                         if row and row[0]:  # Check if row exists and has a URL
                             self.processed.add(row[0])
-                    logging.info(f"Loaded {len(self.processed)} already processed URLs")
+                    logging.info("Loaded %s already processed URLs", len(self.processed))
             except Exception as e:
-                logging.warning(f"Error reading output file: {e}")
+                logging.warning("Error reading output file: %s", e)
                 # If there's an error reading the file, we'll start fresh
                 self.processed = set()
 
@@ -250,22 +257,28 @@ class TrustpilotScraper:
                 writer = csv.writer(outfile)
                 writer.writerow(["URL", "Score", "Nombre d'avis"])
 
-        # Process URLs from CSV
-        with open(self.input_csv, newline="", encoding="utf-8") as csvfile:
-            reader = csv.DictReader(csvfile)
-            urls_to_process = []
-            for row in reader:
-                url = row["URL"]
-                if url not in self.processed:
-                    urls_to_process.append(url)
-                else:
-                    logging.info(f"Skipping already processed URL: {url}")
+        if redrive:
+            urls_to_process = self.resilience.dead_letters.pending("sitemap")
+            logging.info("Re-driving %s dead-lettered URLs", len(urls_to_process))
+        else:
+            # Process URLs from CSV
+            with open(self.input_csv, newline="", encoding="utf-8") as csvfile:
+                reader = csv.DictReader(csvfile)
+                urls_to_process = []
+                for row in reader:
+                    url = row["URL"]
+                    if url not in self.processed:
+                        urls_to_process.append(url)
+                    else:
+                        logging.debug("Skipping already processed URL: %s", url)
 
         if not urls_to_process:
             logging.info("No new URLs to process")
             return
 
-        logging.info(f"Found {len(urls_to_process)} new URLs to process")
+        logging.info("Found %s new URLs to process", len(urls_to_process))
+        # Staleness × popularity × change frequency, most valuable first
+        urls_to_process = Frontier(urls_to_process, deadline=self.deadline).ordered()
 
         # Set up signal handler
         signal.signal(signal.SIGINT, lambda s, f: self.signal_handler())
@@ -285,48 +298,92 @@ class TrustpilotScraper:
         timeout = ClientTimeout(total=30)
         connector = aiohttp.TCPConnector(limit=self.max_workers)
 
-        async with aiohttp.ClientSession(
-            timeout=timeout, connector=connector
-        ) as session:
-            # Start workers
-            workers = [
-                asyncio.create_task(self.worker(i, session))
-                for i in range(self.max_workers)
-            ]
-
-            # Start the save_results task
-            save_task = asyncio.create_task(self.save_results())
-
-            # Wait for all workers to complete
-            await asyncio.gather(*workers)
-
-            # Cancel the save task
-            save_task.cancel()
-            try:
-                await save_task
-            except asyncio.CancelledError:
-                pass
-
-        # Save any remaining results
-        await self.save_results()
+        # dns / connect / ttfb de chaque requête dans la trace
+        trace_configs = [aiohttp_trace_config()] if tracer.enabled else []
+
+        try:
+            async with aiohttp.ClientSession(
+                timeout=timeout, connector=connector, trace_configs=trace_configs
+            ) as session:
+                # Start workers
+                workers = [
+                    asyncio.create_task(self.worker(i, session))
+                    for i in range(self.max_workers)
+                ]
+
+                # Start the save_results task
+                save_task = asyncio.create_task(self.save_results())
+                watchdog_task = asyncio.create_task(self.watchdog.run_async())
+
+                # Wait for all workers to complete
+                await asyncio.gather(*workers)
+
+                # Cancel the save task
+                watchdog_task.cancel()
+                save_task.cancel()
+                try:
+                    await save_task
+                except asyncio.CancelledError:
+                    pass
+        finally:
+            # Save any remaining results: once, also after a deadline stop or Ctrl+C
+            self._flush()
+            self.store.close()
+            # Séries de notes de tout ce qui a été lu, même si le run s'est arrêté avant la fin
+            HistoryStore().ingest({canonical_domain(company.url): company for company in self.crawled})
+            self.resilience.dead_letters.compact()
 
         elapsed_time = time.time() - self.start_time
-        logging.info(f"\nProcessing complete!")
-        logging.info(f"Total sites processed: {self.total_processed}")
-        logging.info(f"Total errors: {self.total_errors}")
-        logging.info(f"Total time: {elapsed_time / 60:.1f} minutes")
+        logging.info("\nProcessing complete!")
+        logging.info("Total sites processed: %s", self.total_processed)
+        logging.info("Total errors: %s", self.total_errors)
+        logging.info("Total time: %.1f minutes", elapsed_time / 60)
+        logging.info(
+            "Average rate: %.2f sites/second", self.total_processed / elapsed_time
+        )
+        for stats in self.egress.stats():
+            logging.info("Exit %(exit)s: latency %(latency)ss, error rate %(error_rate)s", stats)
+        logging.info("Latency percentiles: %s, hedging: %s", latency.stats(), self.hedger.stats())
         logging.info(
-            f"Average rate: {self.total_processed / elapsed_time:.2f} sites/second"
+            "Dead-lettered URLs: %s (re-run with --redrive)",
+            len(self.resilience.dead_letters.pending("sitemap")),
         )
 
 
-def main():
+def crawl(
+    input_csv: str = "trustpilot_urls.csv",
+    output_csv: str = "trustpilot_company_scores.csv",
+    max_workers: Optional[int] = None,
+    requests_per_second: Optional[float] = 2.0,
+    budget: Optional[float] = None,
+    redrive: bool = False,
+    hedge_ratio: float = 0.0,
+):
+    """Configure logging and tracing, then run the scraper to completion."""
+    configure_logging(
+        log_file=f"trustpilot_scraper_{datetime.now().strftime('%Y%m%d_%H%M%S')}.log",
+        json_format=True,
+    )
+    enable_tracing()  # Actif si TRUSTPILOT_TRACE=<fichier.json>
     scraper = TrustpilotScraper(
-        "trustpilot_urls.csv",
-        "trustpilot_company_scores.csv",
-        max_workers=10,  # Augmenté à 10 workers
+        input_csv,
+        output_csv,
+        max_workers=max_workers,  # Concurrence réelle pilotée par le watchdog
+        requests_per_second=requests_per_second,
+        budget=budget,
+        hedge_ratio=hedge_ratio,
     )
-    asyncio.run(scraper.run())
+    asyncio.run(scraper.run(redrive=redrive))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fetch Trustpilot scores for the URLs of trustpilot_urls.csv.")
+    parser.add_argument("--redrive", action="store_true", help="only retry the dead-lettered URLs of previous runs")
+    parser.add_argument("--max-workers", type=int, help="upper bound on concurrency (default: sized to this machine)")
+    parser.add_argument("--budget", type=parse_duration, help="wall-clock budget, e.g. 2h or 90m")
+    parser.add_argument("--hedge-ratio", type=float, default=0.0, help="extra requests allowed for hedging, e.g. 0.05")
+    args = parser.parse_args()
+    crawl(max_workers=args.max_workers, budget=args.budget, redrive=args.redrive, hedge_ratio=args.hedge_ratio)
 
 
 if __name__ == "__main__":